@@ -1,16 +1,59 @@
 """ The Palette Python SDK.
 """
+from __future__ import absolute_import
+
 __version__ = '0.0.0' # PEP440 compliant
 __maintainer__ = 'Palette Software'
 __email__ = 'support@palette-software.com'
 __url__ = 'http://www.palette-software.com'
 
+import sys
+import types
 import logging
+import importlib
 
 # Example usage:
 # >>> palette.logger.addHandler(logging.StreamHandler())
 # >>> palette.logger.setLevel(logging.DEBUG)
+# Logged payloads are truncated to palette.payload.LIMIT characters.
 logger = logging.getLogger('palette')
 logger.addHandler(logging.NullHandler())
 
-from .server import PaletteServer, connect
+# The public classes are imported when they are first used so that
+# 'import palette' does not load the transport stack (requests).
+LAZY_ATTRIBUTES = {
+    'PaletteServer': 'server',
+    'connect': 'server',
+    'AsyncPaletteServer': 'asyncserver',
+    'connect_async': 'asyncserver',
+    'PaletteFleet': 'fleet',
+    'FleetExporter': 'exporter',
+}
+
+__all__ = ['logger'] + sorted(LAZY_ATTRIBUTES)
+
+class _LazyModule(types.ModuleType): # pylint: disable=no-init
+    """The 'palette' package, importing the submodule that defines a
+    public attribute on first access."""
+
+    def __getattr__(self, name):
+        try:
+            submodule = LAZY_ATTRIBUTES[name]
+        except KeyError:
+            fmt = "'module' object has no attribute '{0}'"
+            raise AttributeError(fmt.format(name))
+        module = importlib.import_module('.' + submodule, __name__)
+        value = getattr(module, name)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(LAZY_ATTRIBUTES))
+
+
+# the original module stays referenced: its globals are those of the code
+# above and Python 2 clears them when a module is deallocated.
+_ORIGINAL = sys.modules[__name__]
+_MODULE = _LazyModule(__name__, __doc__)
+_MODULE.__dict__.update(_ORIGINAL.__dict__)
+sys.modules[__name__] = _MODULE
@@ -0,0 +1,150 @@
+""" A local daemon keeping authenticated connections for the 'palette'
+command (see :mod:`palette.cli`).
+
+The agent serves one JSON request per connection on a Unix socket:
+
+>>> {"url": URL, "username": null, "password": null,
+...  "command": "state", "options": {}}
+{"status": "OK", "result": "RUNNING"}
+
+A PaletteServer is created (and authenticated) the first time a server is
+used and is reused for every later request, so its connections stay warm.
+"""
+from __future__ import absolute_import
+
+import os
+import json
+import stat
+import errno
+import signal
+import socket
+import threading
+import SocketServer
+
+from . import logger
+from .commands import STOP_COMMAND, execute, to_json
+from .server import connect
+
+class _Handler(SocketServer.StreamRequestHandler):
+    """Handle one request of a client."""
+
+    def handle(self):
+        stop = False
+        try:
+            request = json.loads(self.rfile.readline())
+            if request.get('command') == STOP_COMMAND:
+                stop = True
+                result = True
+            else:
+                server = self.server.session(request['url'],
+                                             request.get('username'),
+                                             request.get('password'))
+                result = execute(server, request['command'],
+                                 request.get('options') or {})
+            body = json.dumps({'status': 'OK', 'result': result},
+                              default=to_json)
+        except Exception as ex: # pylint: disable=broad-except
+            logger.info("Agent request failed: %s", ex)
+            body = json.dumps({'status': 'FAILED',
+                               'error': str(ex) or type(ex).__name__})
+        self.wfile.write(body + '\n')
+        if stop:
+            logger.info("Agent stopping")
+            # shutdown() waits for serve_forever() in another thread
+            threading.Thread(target=self.server.shutdown).start()
+
+
+class Agent(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    """ Serve the commands of the 'palette' command on a Unix socket.
+
+    :param path: the socket path
+    :type path: str
+    :raises: socket.error (e.g. if an agent is already running)
+    """
+    daemon_threads = True
+
+    def __init__(self, path):
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.servers = {}
+        self._lock = threading.Lock()
+        self._remove_stale_socket()
+        # the socket is only accessible by its owner
+        umask = os.umask(0o077)
+        try:
+            SocketServer.UnixStreamServer.__init__(self, self.path, _Handler)
+        finally:
+            os.umask(umask)
+
+    def _remove_stale_socket(self):
+        """Remove the socket of an agent that did not exit cleanly (any
+        other kind of file is left alone)."""
+        try:
+            mode = os.lstat(self.path).st_mode
+        except OSError as ex:
+            if ex.errno != errno.ENOENT:
+                raise
+            return
+        if not stat.S_ISSOCK(mode):
+            raise socket.error(errno.EEXIST, "'{0}' is not a socket".format(
+                self.path))
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except socket.error as ex:
+            if ex.errno != errno.ECONNREFUSED:
+                raise
+            os.unlink(self.path)
+        else:
+            raise socket.error(errno.EADDRINUSE,
+                               "An agent is already running on '{0}'".format(
+                                   self.path))
+        finally:
+            sock.close()
+
+    def session(self, url, username=None, password=None):
+        """ Return the (authenticated) PaletteServer for `url`, connecting
+        on first use.
+
+        :raises: PaletteAuthenticationError, ValueError
+        """
+        key = (url, username, password)
+        with self._lock:
+            server = self.servers.get(key)
+        if server is not None:
+            return server
+        # a slow (or unreachable) server must not hold up the others
+        server = connect(url, username=username, password=password)
+        with self._lock:
+            existing = self.servers.setdefault(key, server)
+        if existing is not server:
+            # another request connected first
+            server.close()
+            return existing
+        logger.info("Agent connected to '%s'", url)
+        return server
+
+    def run(self):
+        """Serve requests until stopped (by a client or SIGTERM)."""
+        try:
+            signal.signal(signal.SIGTERM,
+                          lambda signum, frame: threading.Thread(
+                              target=self.shutdown).start())
+        except ValueError:
+            pass # not the main thread (e.g. embedded in tests)
+        logger.info("Agent listening on '%s'", self.path)
+        try:
+            self.serve_forever()
+        finally:
+            self.close()
+
+    def close(self):
+        """Close the socket and the connections of every server."""
+        self.server_close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+        with self._lock:
+            servers, self.servers = self.servers, {}
+        for server in servers.itervalues():
+            server.close()
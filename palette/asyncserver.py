@@ -0,0 +1,143 @@
+"""Non-blocking interface to a Palette Server.
+
+Every call returns a :class:`Future <palette.executor.Future>` immediately
+and the request is performed by a bounded, shared
+:class:`WorkerPool <palette.executor.WorkerPool>`.  A single process can
+drive any number of servers with a fixed number of threads.
+
+>>> future = palette.connect_async(URL)
+>>> server = future.result()
+>>> print server.state.result()
+RUNNING
+"""
+from __future__ import absolute_import
+
+from . import logger
+from .executor import default_pool
+from .internal import ApiObject
+from .server import PaletteServer
+
+class AsyncApiObject(ApiObject):
+    """Expose the class methods of a resource class as asynchronous calls.
+    Here `server` is the AsyncPaletteServer instance."""
+
+    def bind(self, method):
+        def submit(*args, **kwargs):
+            """Run the class method in the worker pool."""
+            return self.server.pool.submit(method, self.server.server,
+                                           *args, **kwargs)
+        return submit
+
+
+class AsyncPaletteServer(object):
+    """An asynchronous interface to a particular Palette Server.
+    The methods mirror :class:`PaletteServer <palette.PaletteServer>` but
+    return a future instead of the result.
+
+    The constructor arguments are the same as for PaletteServer with the
+    addition of `pool`.
+
+    :param pool: The worker pool performing requests (default: shared pool)
+    :type pool: WorkerPool
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, url, username=None, password=None,
+                 security_token=None, pool=None, **kwargs):
+        self.server = PaletteServer(url, username=username, password=password,
+                                    security_token=security_token, **kwargs)
+        if pool is None:
+            pool = default_pool()
+        self.pool = pool
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getattr__(self, name):
+        return AsyncApiObject.attach(self, name)
+
+    @property
+    def url(self):
+        """The URL of the server."""
+        return self.server.url
+
+    @property
+    def state(self):
+        """ A future for the current state of the environment. """
+        return self.pool.submit(getattr, self.server, 'state')
+
+    def close(self):
+        """Close all pooled connections held by this instance."""
+        self.server.close()
+
+    def authenticate(self, cached=False):
+        """Authenticate the user against this Palette server."""
+        return self.pool.submit(self.server.authenticate, cached=cached)
+
+    def start(self, sync=True):
+        """Start the Tableau server."""
+        return self.pool.submit(self.server.start, sync=sync)
+
+    def stop(self, sync=True):
+        """Stop the Tableau server."""
+        return self.pool.submit(self.server.stop, sync=sync)
+
+    def restart(self, sync=True):
+        """Restart the Tableau server."""
+        return self.pool.submit(self.server.restart, sync=sync)
+
+    def backup(self, sync=True):
+        """Take a Tableau backup."""
+        return self.pool.submit(self.server.backup, sync=sync)
+
+    # pylint: disable=too-many-arguments
+    def restore(self, backup, data_only=False, password=None, sync=True,
+                progress=None):
+        """Restore Tableau from a tsbak file."""
+        return self.pool.submit(self.server.restore, backup,
+                                data_only=data_only, password=password,
+                                sync=sync, progress=progress)
+
+    def repair_license(self, sync=True):
+        """Repair the Tableau Server license."""
+        return self.pool.submit(self.server.repair_license, sync=sync)
+
+    def ziplogs(self, sync=True):
+        """Cleanup the Tableau Server logs."""
+        return self.pool.submit(self.server.ziplogs, sync=sync)
+
+    def get(self, url, params=None, required=None):
+        """Send a GET request to the server."""
+        return self.pool.submit(self.server.get, url, params=params,
+                                required=required)
+
+    def post(self, url, data=None, required=None, idempotent=None):
+        """Send a POST request to the server."""
+        return self.pool.submit(self.server.post, url, data=data,
+                                required=required, idempotent=idempotent)
+
+    def delete(self, url, required=None):
+        """Send a DELETE request to the server."""
+        return self.pool.submit(self.server.delete, url, required=required)
+
+
+def connect_async(url, username=None, password=None, security_token=None,
+                  pool=None, **kwargs):
+    """Create an AsyncPaletteServer instance and authenticate.
+
+    :returns: a future for an
+      :class:`AsyncPaletteServer <palette.asyncserver.AsyncPaletteServer>`
+    :raises: ValueError
+    """
+    server = AsyncPaletteServer(url, username=username, password=password,
+                                security_token=security_token, pool=pool,
+                                **kwargs)
+
+    def _connect():
+        server.server.authenticate(cached=True)
+        logger.info("Connected to server '%s'", url)
+        return server
+    return server.pool.submit(_connect)
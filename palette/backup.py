@@ -1,8 +1,101 @@
 """ Classes and functions for handling Tableau Backups """
 from __future__ import absolute_import
-from .internal import API_PATH_INFO, DictObject
+import time
 
-class Backup(DictObject):
+from requests import HTTPError
+
+from . import logger
+from .error import PaletteError
+from .executor import WorkerPool, default_pool
+from .internal import API_PATH_INFO, DictObject, Record, parse_time
+
+# the number of concurrent requests when backups are deleted one at a time
+DELETE_WORKERS = 4
+
+class BackupFile(object):
+    """Methods for the backup file shared by Backup and BackupRecord."""
+    # pylint: disable=unsubscriptable-object
+    __slots__ = ()
+
+    def download(self, path, **kwargs):
+        """ Download the backup file to the local `path`.
+
+        Keyword arguments (e.g. `workers`, `resume`, `digest` or
+        `progress`) are passed to :func:`palette.storage.download`.
+
+        :returns: a :class:`TransferResult <palette.storage.TransferResult>`
+        :raises: PaletteChecksumError, PaletteError, ValueError, IOError
+        """
+        from . import storage
+        kwargs.setdefault('size', self['size'])
+        return storage.download(self['url'], path, **kwargs)
+
+
+def _backup_ids(backups):
+    """Return the ids of `backups` (instances or ids) and a mapping of id to
+    size for the instances."""
+    ids = []
+    sizes = {}
+    for backup in backups:
+        if isinstance(backup, BackupFile):
+            backup_id = int(backup['id'])
+            sizes[backup_id] = backup.get('size')
+        else:
+            backup_id = int(backup)
+        ids.append(backup_id)
+    return ids, sizes
+
+
+class DeleteResult(object):
+    """ The outcome of deleting backups.
+
+    :ivar deleted: the unique ids of the deleted backups
+    :ivar errors: a mapping of backup id to the exception for each backup
+      that could not be deleted
+    :ivar reclaimed: the total size in bytes of the deleted backups
+    :ivar dry_run: True if the backups were only selected, not deleted
+    """
+
+    def __init__(self, dry_run=False):
+        self.deleted = []
+        self.errors = {}
+        self.reclaimed = 0
+        self.dry_run = dry_run
+
+    def __repr__(self):
+        fmt = '<DeleteResult deleted={0} errors={1} reclaimed={2}>'
+        return fmt.format(len(self.deleted), len(self.errors), self.reclaimed)
+
+    @property
+    def ok(self): # pylint: disable=invalid-name
+        """True if every backup was deleted."""
+        return not self.errors
+
+    def add(self, backup_id, size=None):
+        """Record a deleted backup."""
+        self.deleted.append(backup_id)
+        self.reclaimed += size or 0
+
+    def raise_for_errors(self):
+        """Raise PaletteError if any backup could not be deleted.
+
+        :raises: PaletteError
+        """
+        if self.errors:
+            fmt = '{0} backup(s) could not be deleted: {1}'
+            ids = ', '.join(str(key) for key in sorted(self.errors))
+            raise PaletteError(fmt.format(len(self.errors), ids),
+                               data=self.errors)
+
+
+class BackupRecord(BackupFile, Record):
+    """ A compact, read-only Backup for loading large backup histories.
+    Returned by the Backup class methods when `compact` is True.
+    """
+    FIELDS = ('id', 'url', 'size', 'creation-time')
+
+
+class Backup(BackupFile, DictObject):
     """ A Tableau Server backup object.
 
     The classmethods of this class are most easily accessed via
@@ -22,10 +115,15 @@ class Backup(DictObject):
      u'size': 6586553,
      u'creation-time': u'2015-09-24T22:55:17.861285Z'}
 
+    The file itself may be copied with ``backup.download(path)``, see
+    :mod:`palette.storage`.
     """
 
+    # pylint: disable=too-many-arguments
     MAX_LIMIT = 100
     PATH_INFO = API_PATH_INFO + '/backups'
+    DELETE_PATH_INFO = PATH_INFO + '/delete'
+    RECORD = BackupRecord
 
     @classmethod
     def get(cls, server, backup_id):
@@ -43,7 +141,7 @@ class Backup(DictObject):
         return cls.from_json(server, server.get(path_info, required=('id')))
 
     @classmethod
-    def list_all(cls, server, limit=7, desc=True):
+    def list_all(cls, server, limit=7, desc=True, cursor=None, compact=False):
         """ Return a list of available backups.
 
         :param server: The server instance
@@ -52,17 +150,191 @@ class Backup(DictObject):
         :type limit: int
         :param desc: sort descending or not
         :type desc: bool
+        :param cursor: only return backups following the backup with this
+          unique id (in sort order).
+        :type cursor: int
+        :param compact: return BackupRecord instances which use less memory
+        :type compact: bool
         :return: the available backups
-        :rtype: list of Backup instances
+        :rtype: list of Backup (or BackupRecord) instances
         :raises: ValueError, HTTPError
         """
         if limit > cls.MAX_LIMIT:
             fmt = "The value of 'limit' must be less than or equal to {0}'"
             raise ValueError(fmt.format(cls.MAX_LIMIT))
         params = {'limit': int(limit), 'desc': desc}
+        if cursor is not None:
+            params['cursor'] = int(cursor)
+        if compact and cls.RECORD is not None:
+            # parse incrementally: the backup dicts are never all in memory
+            return list(server.iter_json(
+                cls.PATH_INFO, 'backups', params=params,
+                factory=lambda obj: cls.from_json(server, obj, compact=True)))
         json = server.get(cls.PATH_INFO, params=params, required=('backups'))
 
         backups = []
         for obj in json['backups']:
-            backups.append(cls.from_json(server, obj))
+            backups.append(cls.from_json(server, obj, compact=compact))
         return backups
+
+    @classmethod
+    def iter_all(cls, server, desc=True, page_size=MAX_LIMIT, cursor=None,
+                 compact=False):
+        """ Iterate over every available backup, one page at a time.
+
+        The next page is requested in the background while the current one
+        is being consumed, and at most two pages are held in memory.
+
+        >>> total = sum(backup.size for backup in server.Backup.iter_all())
+
+        :param server: The server instance
+        :type server: PaletteServer
+        :param desc: sort descending or not
+        :type desc: bool
+        :param page_size: the number of backups requested at once (max=100).
+        :type page_size: int
+        :param cursor: start after the backup with this unique id.
+        :type cursor: int
+        :param compact: yield BackupRecord instances which use less memory
+        :type compact: bool
+        :return: generator of Backup (or BackupRecord) instances
+        :raises: ValueError, HTTPError, PaletteError if a page does not
+          start after the cursor (i.e. the server ignores it).
+        """
+        if page_size > cls.MAX_LIMIT or page_size < 1:
+            fmt = "The value of 'page_size' must be between 1 and {0}'"
+            raise ValueError(fmt.format(cls.MAX_LIMIT))
+        pool = default_pool('prefetch')
+        page = cls.list_all(server, limit=page_size, desc=desc, cursor=cursor,
+                            compact=compact)
+        while page:
+            if cursor is not None:
+                first = page[0]['id']
+                if (first >= cursor) if desc else (first <= cursor):
+                    fmt = "The page after backup {0} starts at backup {1}: " \
+                          "the server does not support 'cursor'"
+                    raise PaletteError(fmt.format(cursor, first))
+            cursor = page[-1]['id']
+            future = None
+            if len(page) == page_size:
+                future = pool.submit(cls.list_all, server, limit=page_size,
+                                     desc=desc, cursor=cursor,
+                                     compact=compact)
+            for backup in page:
+                yield backup
+            if future is None:
+                return
+            page = future.result()
+
+    @classmethod
+    def delete_many(cls, server, backups, workers=DELETE_WORKERS):
+        """ Delete backups and their files.
+
+        The ids are sent in bulk requests of up to MAX_LIMIT backups.  If the
+        server does not support bulk deletion, one request per backup is
+        sent with at most `workers` requests in flight.
+
+        >>> result = server.Backup.delete_many([12, 13, 14])
+        >>> result.deleted, result.reclaimed, result.errors
+        ([12, 14], 13180686, {13: PaletteError('Not Found',)})
+
+        :param server: The server instance
+        :type server: PaletteServer
+        :param backups: the backups (or their unique ids) to delete
+        :type backups: iterable of Backup, BackupRecord or int
+        :param workers: the maximum number of concurrent single deletes
+        :type workers: int
+        :returns: a :class:`DeleteResult` -- backups that could not be
+          deleted are reported in its `errors`.
+        :raises: HTTPError (if a bulk request failed as a whole)
+        """
+        ids, sizes = _backup_ids(backups)
+        result = DeleteResult()
+        for start in xrange(0, len(ids), cls.MAX_LIMIT):
+            chunk = ids[start:start + cls.MAX_LIMIT]
+            try:
+                json = server.post(cls.DELETE_PATH_INFO,
+                                   data={'ids': ','.join(map(str, chunk))},
+                                   required=('deleted'), idempotent=True)
+            except HTTPError as ex:
+                if ex.response is None \
+                        or ex.response.status_code not in (404, 405):
+                    raise
+                logger.info("'%s' does not support bulk deletion, deleting "
+                            "%d backup(s) one at a time", server.url,
+                            len(ids) - start)
+                cls._delete_each(server, ids[start:], sizes, result, workers)
+                break
+            for item in json['deleted']:
+                result.add(item['id'],
+                           item.get('size', sizes.get(item['id'])))
+            for key, message in json.get('errors', {}).iteritems():
+                result.errors[int(key)] = PaletteError(message)
+        logger.info("Deleted %d backup(s) (%d bytes), %d failed",
+                    len(result.deleted), result.reclaimed, len(result.errors))
+        return result
+
+    @classmethod
+    def _delete_each(cls, server, ids, sizes, result, workers):
+        """Delete backups with one request each on a bounded pool."""
+        pool = WorkerPool(max_workers=workers)
+        try:
+            futures = [(backup_id, pool.submit(
+                server.delete, cls.PATH_INFO + '/' + str(backup_id)))
+                       for backup_id in ids]
+            for backup_id, future in futures:
+                try:
+                    json = future.result()
+                except Exception as ex: # pylint: disable=broad-except
+                    result.errors[backup_id] = ex
+                else:
+                    result.add(backup_id,
+                               json.get('size', sizes.get(backup_id)))
+        finally:
+            pool.shutdown(wait=False)
+
+    @classmethod
+    def prune(cls, server, keep_last=None, older_than=None, dry_run=False,
+              workers=DELETE_WORKERS):
+        """ Delete old backups according to a retention policy.
+
+        The newest `keep_last` backups are always kept; of the others, those
+        created more than `older_than` seconds ago are deleted.  Either
+        criterion may be omitted, but not both.
+
+        >>> result = server.Backup.prune(keep_last=14, older_than=30 * 86400)
+        >>> result.raise_for_errors()
+
+        :param server: The server instance
+        :type server: PaletteServer
+        :param keep_last: the number of most recent backups to keep
+        :type keep_last: int
+        :param older_than: only delete backups older than this (seconds)
+        :type older_than: float
+        :param dry_run: select the backups without deleting them
+        :type dry_run: bool
+        :param workers: see :meth:`delete_many`
+        :type workers: int
+        :returns: a :class:`DeleteResult`
+        :raises: ValueError, HTTPError
+        """
+        if keep_last is None and older_than is None:
+            raise ValueError("'keep_last' or 'older_than' is required")
+        if keep_last is not None and keep_last < 0:
+            raise ValueError("'keep_last' must not be negative")
+        cutoff = None if older_than is None else time.time() - older_than
+        expired = []
+        for index, backup in enumerate(cls.iter_all(server, compact=True)):
+            if keep_last is not None and index < keep_last:
+                continue
+            if cutoff is not None:
+                created = parse_time(backup.get('creation-time'))
+                if created is None or created >= cutoff:
+                    continue
+            expired.append(backup)
+        if not dry_run:
+            return cls.delete_many(server, expired, workers=workers)
+        result = DeleteResult(dry_run=True)
+        for backup in expired:
+            result.add(backup['id'], backup.get('size'))
+        return result
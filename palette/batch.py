@@ -0,0 +1,308 @@
+""" Send several API calls in one round trip.
+
+Calls queued on a :class:`Batch` return a
+:class:`Future <palette.executor.Future>` immediately; at the end of the
+``with`` block every queued call runs and the requests they make are sent
+together:
+
+>>> with server.batch() as batch:
+...     state = batch.state
+...     retain = batch.System.get('backup-auto-retain-count')
+...     latest = batch.Backup.list_all(limit=1)
+>>> print state.result(), retain.result(), latest.result()
+RUNNING 14 [{u'id': 56, ...}]
+
+Servers supporting the multi-operation endpoint (``POST /api/v1/batch``)
+receive all requests in a single HTTP request.  Other servers receive them
+concurrently over the pooled connections.  Either way a batch costs about
+one round trip of latency per dependent step (e.g. one for the calls
+above).
+
+The results are only available once the block exits: waiting on a future
+inside the block blocks forever.
+"""
+from __future__ import absolute_import
+
+import json
+import threading
+from operator import methodcaller
+
+from requests import HTTPError, Response
+
+from . import decoder, logger
+from .error import PaletteCancelledError, PaletteInternalError
+from .executor import Future, WorkerPool, run_future
+from .internal import API_PATH_INFO, ApiObject, raise_for_json
+
+# the maximum number of requests sent in one multi-operation request
+MAX_OPERATIONS = 50
+
+# the maximum number of queued calls run at once
+MAX_WORKERS = 8
+
+# the batch running a queued call in this thread
+_LOCAL = threading.local()
+
+def active_batch(server):
+    """Return the batch collecting the requests `server` makes in this
+    thread (or None)."""
+    batch = getattr(_LOCAL, 'batch', None)
+    if batch is not None and batch.server is server:
+        return batch
+    return None
+
+class _Operation(object):
+    """A request made by a queued call while the batch is sent."""
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, method, url, required, kwargs):
+        self.method = method
+        self.url = url
+        self.required = required
+        self.kwargs = kwargs
+        self.direct = False
+        self.result = None
+        self.error = None
+        self.event = threading.Event()
+
+    def encode(self):
+        """Return the operation as an element of the multi-operation
+        request."""
+        return {'method': self.method, 'path': self.url,
+                'params': self.kwargs.get('params') or {},
+                'data': self.kwargs.get('data') or {}}
+
+    def decode(self, item):
+        """Set the result (or error) from an element of the multi-operation
+        response."""
+        status = item.get('status_code', 200)
+        body = item.get('body') or {}
+        try:
+            if status >= 400:
+                response = Response()
+                response.status_code = status
+                response.reason = body.get('error', '')
+                response.url = self.url
+                # pylint: disable=protected-access
+                response._content = json.dumps(body)
+                response._content_consumed = True
+                response.raise_for_status()
+            raise_for_json(body, required=self.required)
+        except Exception as ex: # pylint: disable=broad-except
+            self.error = ex
+        else:
+            self.result = body
+        self.event.set()
+
+    def value(self):
+        """Return the decoded response (or raise the error)."""
+        if self.error is not None:
+            raise self.error # pylint: disable=raising-bad-type
+        return self.result
+
+    def fail(self, error):
+        """Set the error of the operation."""
+        self.error = error
+        self.event.set()
+
+    def send_directly(self):
+        """Let the call send the request itself."""
+        self.direct = True
+        self.event.set()
+
+
+class BatchApiObject(ApiObject):
+    """Expose the class methods of a resource class as queued calls.
+    Here `server` is the Batch instance."""
+
+    def bind(self, method):
+        def queue(*args, **kwargs):
+            """Queue the class method in the batch."""
+            return self.server.call(method, *args, **kwargs)
+        return queue
+
+
+class Batch(object):
+    """ Calls queued to be sent together, see :meth:`PaletteServer.batch
+    <palette.PaletteServer.batch>`.
+
+    The methods mirror :class:`PaletteServer <palette.PaletteServer>` but
+    return a future instead of the result.
+
+    :param server: The server instance
+    :type server: PaletteServer
+    """
+
+    PATH_INFO = API_PATH_INFO + '/batch'
+
+    def __init__(self, server):
+        self.server = server
+        self._calls = []
+        self._ops = []
+        # the calls not started yet and the calls running
+        self._queued = 0
+        self._running = 0
+        self._condition = threading.Condition()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.send()
+        else:
+            self.cancel()
+
+    def __len__(self):
+        return len(self._calls)
+
+    def __getattr__(self, name):
+        return BatchApiObject.attach(self, name)
+
+    @property
+    def state(self):
+        """ A future for the current state of the environment. """
+        return self.call(lambda server: server.state)
+
+    def get(self, url, params=None, required=None):
+        """Queue a GET request."""
+        return self.call(methodcaller('get', url, params=params,
+                                      required=required))
+
+    def post(self, url, data=None, required=None, idempotent=None):
+        """Queue a POST request."""
+        return self.call(methodcaller('post', url, data=data,
+                                      required=required,
+                                      idempotent=idempotent))
+
+    def delete(self, url, required=None):
+        """Queue a DELETE request."""
+        return self.call(methodcaller('delete', url, required=required))
+
+    def call(self, func, *args, **kwargs):
+        """Queue ``func(server, *args, **kwargs)``.
+
+        :returns: a :class:`Future <palette.executor.Future>` instance
+        """
+        future = Future()
+        self._calls.append((future, func, args, kwargs))
+        return future
+
+    def cancel(self):
+        """Cancel the queued calls."""
+        calls, self._calls = self._calls, []
+        for future, _, _, _ in calls:
+            future.cancel()
+
+    def send(self):
+        """ Run the queued calls and send their requests together.
+
+        The requests each call makes are collected until every running call
+        either waits for a response or has returned (and no worker is free
+        for a call not started yet), then sent as one round trip.  At most
+        MAX_WORKERS calls run at once.
+
+        :returns: the list of futures (all done).
+        """
+        calls, self._calls = self._calls, []
+        if not calls:
+            return []
+        workers = min(len(calls), MAX_WORKERS)
+        pool = WorkerPool(max_workers=workers)
+        with self._condition:
+            self._queued = len(calls)
+        for future, func, args, kwargs in calls:
+            pool.submit(self._run, future, func, args, kwargs)
+        try:
+            while True:
+                with self._condition:
+                    while self._running > len(self._ops) or \
+                            (self._queued and self._running < workers):
+                        # a (long) timeout keeps the wait interruptible on
+                        # Python 2
+                        self._condition.wait(3600)
+                    if not self._running:
+                        break
+                    ops, self._ops = self._ops, []
+                for start in xrange(0, len(ops), MAX_OPERATIONS):
+                    self._send_round(ops[start:start + MAX_OPERATIONS])
+        finally:
+            # release calls still waiting if sending was interrupted (and
+            # cancel those not started yet)
+            with self._condition:
+                ops, self._ops = self._ops, []
+            for operation in ops:
+                operation.fail(PaletteCancelledError())
+            for future, _, _, _ in calls:
+                future.cancel()
+            pool.shutdown(wait=False)
+        return [call[0] for call in calls]
+
+    def _run(self, future, func, args, kwargs):
+        """Run a queued call in a worker thread."""
+        with self._condition:
+            self._queued -= 1
+            self._running += 1
+        _LOCAL.batch = self
+        try:
+            run_future(future, func, self.server, *args, **kwargs)
+        finally:
+            _LOCAL.batch = None
+            with self._condition:
+                self._running -= 1
+                self._condition.notify_all()
+
+    def collect(self, method, url, required, kwargs):
+        """Collect a request of a queued call (see :func:`active_batch`)
+        and wait until the batch has sent it.
+
+        :returns: the operation -- if its `direct` flag is set the caller
+          sends the request itself.
+        """
+        operation = _Operation(method, url, required, kwargs)
+        with self._condition:
+            self._ops.append(operation)
+            self._condition.notify_all()
+        operation.event.wait()
+        return operation
+
+    def _send_round(self, ops):
+        """Send the collected requests in one multi-operation request or,
+        if the server does not support it, concurrently."""
+        if len(ops) > 1 and self.server.batch_endpoint is not False:
+            try:
+                responses = self._send_multi(ops)
+            except HTTPError as ex:
+                if ex.response is None \
+                        or ex.response.status_code not in (404, 405):
+                    for operation in ops:
+                        operation.fail(ex)
+                    return
+                logger.info("'%s' does not support batch requests",
+                            self.server.url)
+                self.server.batch_endpoint = False
+            except Exception as ex: # pylint: disable=broad-except
+                for operation in ops:
+                    operation.fail(ex)
+                return
+            else:
+                self.server.batch_endpoint = True
+                for operation, item in zip(ops, responses):
+                    operation.decode(item)
+                return
+        # every call sends its own request, over the pooled connections
+        for operation in ops:
+            operation.send_directly()
+
+    def _send_multi(self, ops):
+        body = json.dumps({'requests': [op.encode() for op in ops]})
+        res = self.server.request('POST', self.PATH_INFO, data=body,
+                                  headers={'Content-Type': 'application/json'})
+        data = decoder.loads(res.content)
+        raise_for_json(data, required='responses')
+        responses = data['responses']
+        if len(responses) != len(ops):
+            fmt = 'Expected {0} batch responses, got {1}'
+            raise PaletteInternalError(fmt.format(len(ops), len(responses)),
+                                       data=data)
+        return responses
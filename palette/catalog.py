@@ -0,0 +1,265 @@
+""" A local SQLite catalog of backup metadata.
+
+The catalog mirrors the backups of one or more servers so questions about
+backup history are answered locally instead of paging through the API:
+
+>>> catalog = BackupCatalog('/var/lib/palette/backups.db')
+>>> catalog.sync(server)        # only fetches backups newer than last time
+3
+>>> catalog.summary()
+{'https://one.example.com': {'count': 212, 'total_size': ...}}
+>>> catalog.query(older_than=30 * 86400, order_by='size', limit=5)
+[<BackupRecord ...>, ...]
+
+Backups deleted on a server are only noticed by a full sync
+(``sync(server, full=True)``).
+"""
+from __future__ import absolute_import
+
+import json
+import time
+import sqlite3
+import calendar
+import datetime
+import threading
+
+from . import logger
+from .backup import Backup, BackupRecord
+from .internal import parse_time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS backups (
+    server TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    url TEXT,
+    size INTEGER,
+    created REAL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (server, id)
+);
+CREATE INDEX IF NOT EXISTS backups_created ON backups (server, created);
+CREATE INDEX IF NOT EXISTS backups_size ON backups (server, size);
+CREATE INDEX IF NOT EXISTS backups_all_created ON backups (created);
+CREATE TABLE IF NOT EXISTS servers (
+    server TEXT PRIMARY KEY,
+    synced REAL
+);
+"""
+
+# the columns query() may sort by
+ORDER_COLUMNS = {'id': 'id', 'size': 'size', 'creation-time': 'created',
+                 'server': 'server'}
+
+def _timestamp(value):
+    """Accept seconds since the epoch or a (naive, UTC) datetime."""
+    if isinstance(value, datetime.datetime):
+        return calendar.timegm(value.utctimetuple())
+    return value
+
+
+class BackupCatalog(object):
+    """ Backup metadata of one or more servers in a SQLite database.
+
+    :param path: the database file (default: in memory)
+    :type path: str
+
+    Servers are identified by URL.  The instance may be shared between
+    threads.
+    """
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._servers = {}
+
+    def close(self):
+        """Close the database."""
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def sync(self, *servers, **kwargs):
+        """ Fetch the backups created since the last sync of each server.
+
+        :param servers: PaletteServer instances (or a PaletteFleet, using
+          ``catalog.sync(*fleet)``)
+        :param full: fetch every backup and forget those that no longer
+          exist on the server.
+        :type full: bool
+        :returns: int -- the number of backups added.
+        :raises: HTTPError
+        """
+        full = kwargs.pop('full', False)
+        if kwargs:
+            raise TypeError('Unexpected arguments: ' + ', '.join(kwargs))
+        added = 0
+        for server in servers:
+            added += self._sync(server, full)
+        return added
+
+    def _sync(self, server, full):
+        self._servers[server.url] = server
+        cursor = None if full else self.last_id(server.url)
+        seen = set()
+        batch = []
+        added = 0
+        for backup in Backup.iter_all(server, desc=False, cursor=cursor,
+                                      compact=True):
+            seen.add(backup['id'])
+            batch.append(self._row(server.url, backup))
+            if len(batch) >= Backup.MAX_LIMIT:
+                added += self._insert(batch)
+                batch = []
+        added += self._insert(batch)
+        with self._lock:
+            with self._conn:
+                if full:
+                    ids = [row[0] for row in self._conn.execute(
+                        'SELECT id FROM backups WHERE server = ?',
+                        (server.url,))]
+                    gone = [(server.url, backup_id) for backup_id in ids
+                            if backup_id not in seen]
+                    self._conn.executemany(
+                        'DELETE FROM backups WHERE server = ? AND id = ?',
+                        gone)
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO servers VALUES (?, ?)',
+                    (server.url, time.time()))
+        logger.info("Catalog sync of '%s': %d new backup(s)",
+                    server.url, added)
+        return added
+
+    @staticmethod
+    def _row(url, backup):
+        data = dict(backup)
+        return (url, data['id'], data.get('url'), data.get('size'),
+                parse_time(data.get('creation-time')), json.dumps(data))
+
+    def _insert(self, rows):
+        if not rows:
+            return 0
+        with self._lock:
+            with self._conn:
+                before = self._conn.total_changes
+                self._conn.executemany(
+                    'INSERT OR IGNORE INTO backups VALUES (?, ?, ?, ?, ?, ?)',
+                    rows)
+                return self._conn.total_changes - before
+
+    def last_id(self, url):
+        """Return the largest backup id of the server `url` (or None)."""
+        return self._scalar('SELECT MAX(id) FROM backups WHERE server = ?',
+                            (url,))
+
+    def servers(self):
+        """Return a mapping of server URL to the time of its last sync."""
+        with self._lock:
+            return dict(self._conn.execute('SELECT server, synced '
+                                           'FROM servers'))
+
+    @staticmethod
+    def _where(server=None, since=None, before=None, older_than=None,
+               min_size=None, max_size=None):
+        """Build the WHERE clause of the filters shared by the queries."""
+        # pylint: disable=too-many-arguments
+        clauses = []
+        params = []
+        if server is not None:
+            clauses.append('server = ?')
+            params.append(getattr(server, 'url', server))
+        if older_than is not None:
+            before = time.time() - older_than
+        if since is not None:
+            clauses.append('created >= ?')
+            params.append(_timestamp(since))
+        if before is not None:
+            clauses.append('created < ?')
+            params.append(_timestamp(before))
+        if min_size is not None:
+            clauses.append('size >= ?')
+            params.append(min_size)
+        if max_size is not None:
+            clauses.append('size <= ?')
+            params.append(max_size)
+        if not clauses:
+            return '', params
+        return ' WHERE ' + ' AND '.join(clauses), params
+
+    def query(self, order_by='creation-time', desc=True, limit=None,
+              compact=True, **filters):
+        """ Return the backups matching the filters.
+
+        :param order_by: 'creation-time', 'size', 'id' or 'server'
+        :param desc: sort descending or not
+        :param limit: the maximum number of backups returned
+        :param compact: return BackupRecord (instead of Backup) instances
+        :param server: only backups of this server (instance or URL)
+        :param since: created at or after (seconds since the epoch or a
+          UTC datetime)
+        :param before: created before
+        :param older_than: created more than this many seconds ago
+        :param min_size: at least this many bytes
+        :param max_size: at most this many bytes
+        :returns: list -- the server of each backup is the PaletteServer
+          instance if it was synced by this catalog (otherwise None).
+        :raises: ValueError
+        """
+        # pylint: disable=too-many-arguments
+        if order_by not in ORDER_COLUMNS:
+            raise ValueError("Invalid 'order_by': " + repr(order_by))
+        where, params = self._where(**filters)
+        sql = 'SELECT server, data FROM backups' + where
+        sql += ' ORDER BY {0} {1}'.format(ORDER_COLUMNS[order_by],
+                                          'DESC' if desc else 'ASC')
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(int(limit))
+        cls = BackupRecord if compact else Backup
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [cls(self._servers.get(url), json.loads(data))
+                for url, data in rows]
+
+    def count(self, **filters):
+        """Return the number of backups matching the filters (see query)."""
+        where, params = self._where(**filters)
+        return self._scalar('SELECT COUNT(*) FROM backups' + where, params)
+
+    def total_size(self, **filters):
+        """Return the total bytes of the backups matching the filters."""
+        where, params = self._where(**filters)
+        return self._scalar('SELECT COALESCE(SUM(size), 0) FROM backups'
+                            + where, params)
+
+    def summary(self, **filters):
+        """ Aggregate the backups matching the filters per server.
+
+        :returns: dict -- server URL to a dict with the keys 'count',
+          'total_size', 'min_size', 'max_size', 'oldest' and 'newest'
+          (seconds since the epoch).
+        """
+        where, params = self._where(**filters)
+        sql = ('SELECT server, COUNT(*), SUM(size), MIN(size), MAX(size), '
+               'MIN(created), MAX(created) FROM backups' + where +
+               ' GROUP BY server')
+        keys = ('count', 'total_size', 'min_size', 'max_size', 'oldest',
+                'newest')
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return dict((row[0], dict(zip(keys, row[1:]))) for row in rows)
+
+    def execute(self, sql, params=()):
+        """Run an arbitrary (read-only) SQL statement against the 'backups'
+        table and return the rows."""
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _scalar(self, sql, params):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()[0]
@@ -0,0 +1,169 @@
+""" The 'palette' command line tool and its agent.
+
+>>> palette --url https://one.example.com state
+RUNNING
+>>> palette --url https://one.example.com system get socket-timeout
+60
+
+Without an agent every invocation connects (and authenticates) by itself.
+A long running agent keeps authenticated, pooled connections to any number
+of servers so that commands finish in milliseconds:
+
+>>> palette agent &
+>>> palette --url https://one.example.com backup --async
+
+Commands are sent to the agent whenever it is running.  The agent listens
+on a Unix socket (default: ~/.palette_agent.sock) which only its owner may
+use.  The client does not import the transport stack (requests) at all.
+
+The URL may also be given by the PALETTE_URL environment variable and the
+credentials default to those of ~/.palette (read by the agent).
+"""
+from __future__ import absolute_import
+
+import os
+import sys
+import json
+import errno
+import socket
+import logging
+import argparse
+
+from . import logger
+from .commands import MANAGE_COMMANDS, STOP_COMMAND, execute, to_json
+
+DEFAULT_SOCKET = '~/.palette_agent.sock'
+
+# the command line options that are not passed to execute()
+GLOBAL_OPTIONS = ('url', 'username', 'password', 'socket', 'no_agent',
+                  'command')
+
+def parser():
+    """Return the argument parser of the 'palette' command."""
+    result = argparse.ArgumentParser(
+        prog='palette', description='Manage Tableau servers through Palette.')
+    result.add_argument('--url', default=os.environ.get('PALETTE_URL'),
+                        help='the Palette server (default: $PALETTE_URL)')
+    result.add_argument('--username', help='default: from ~/.palette')
+    result.add_argument('--password', help='default: from ~/.palette')
+    result.add_argument('--socket', default=os.environ.get(
+        'PALETTE_AGENT_SOCKET', DEFAULT_SOCKET), help='the agent socket')
+    result.add_argument('--no-agent', action='store_true',
+                        help='connect directly even if an agent is running')
+    commands = result.add_subparsers(dest='command')
+    commands.add_parser('state', help='print the environment state')
+    for name in MANAGE_COMMANDS:
+        command = commands.add_parser(name, help='run ' + name)
+        command.add_argument('--async', dest='nowait', action='store_true',
+                             help='do not wait for completion')
+    command = commands.add_parser('restore', help='restore a backup')
+    command.add_argument('backup', help='the URL or local path of the file')
+    command.add_argument('--data-only', action='store_true')
+    command.add_argument('--async', dest='nowait', action='store_true',
+                         help='do not wait for completion')
+    command = commands.add_parser('backups', help='list recent backups')
+    command.add_argument('--limit', type=int, default=7)
+    command = commands.add_parser('system', help='read or set system keys')
+    command.add_argument('operation', choices=('get', 'set', 'list'))
+    command.add_argument('key', nargs='?')
+    command.add_argument('value', nargs='?')
+    command = commands.add_parser('agent', help='run the agent')
+    command.add_argument('--stop', action='store_true',
+                         help='stop the running agent')
+    return result
+
+def send(path, request):
+    """ Send a request to the agent listening on `path`.
+
+    :returns: dict -- the response or None if no agent is running.
+    :raises: socket.error
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(path)
+        except socket.error as ex:
+            if ex.errno in (errno.ENOENT, errno.ECONNREFUSED):
+                return None
+            raise
+        sock.sendall(json.dumps(request) + '\n')
+        chunks = []
+        while True:
+            chunk = sock.recv(64 * 1024)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        sock.close()
+    return json.loads(''.join(chunks))
+
+def run_direct(request):
+    """Connect and run a request in this process (without an agent)."""
+    from .server import connect
+    server = connect(request['url'], username=request['username'],
+                     password=request['password'])
+    try:
+        result = execute(server, request['command'], request['options'])
+        return json.loads(json.dumps(result, default=to_json))
+    finally:
+        server.close()
+
+def output(result):
+    """Print a command result."""
+    if result is True or result is None:
+        return
+    if isinstance(result, basestring):
+        print result
+    elif isinstance(result, (dict, list)):
+        print json.dumps(result, indent=2, sort_keys=True)
+    else:
+        print result
+
+def main(argv=None):
+    """ The entry point of the 'palette' command.
+
+    :returns: int -- the exit status.
+    """
+    args = parser().parse_args(argv)
+    path = os.path.expanduser(args.socket)
+    try:
+        if args.command == 'agent':
+            if args.stop:
+                if send(path, {'command': STOP_COMMAND}) is None:
+                    raise ValueError('the agent is not running')
+                return 0
+            from .agent import Agent
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter(
+                '%(asctime)s %(levelname)s %(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            Agent(path).run()
+            return 0
+        if not args.url:
+            raise ValueError('--url (or PALETTE_URL) is required')
+        options = dict((key, value) for key, value in vars(args).iteritems()
+                       if key not in GLOBAL_OPTIONS)
+        if args.command == 'restore' and '://' not in args.backup:
+            # the agent may have another working directory
+            options['backup'] = os.path.abspath(args.backup)
+        request = {'url': args.url, 'username': args.username,
+                   'password': args.password, 'command': args.command,
+                   'options': options}
+        response = None if args.no_agent else send(path, request)
+        if response is None:
+            result = run_direct(request)
+        elif response['status'] == 'OK':
+            result = response['result']
+        else:
+            raise ValueError(response['error'])
+    except KeyboardInterrupt:
+        return 130
+    except Exception as ex: # pylint: disable=broad-except
+        sys.stderr.write('palette: error: {0}\n'.format(ex))
+        return 1
+    output(result)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
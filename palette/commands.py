@@ -0,0 +1,59 @@
+""" The commands of the 'palette' command line tool, run by the tool
+itself or by its agent (see :mod:`palette.cli`).
+"""
+from __future__ import absolute_import
+
+MANAGE_COMMANDS = ('start', 'stop', 'restart', 'backup', 'repair-license',
+                   'ziplogs')
+
+# the message asking the agent to exit
+STOP_COMMAND = 'agent-stop'
+
+def execute(server, command, options):
+    # pylint: disable=too-many-return-statements
+    """ Run a command against a server.
+
+    :param server: The server instance
+    :type server: PaletteServer
+    :param command: the command name e.g. 'state'
+    :param options: the options of the command (see :func:`palette.cli.parser`)
+    :type options: dict
+    :returns: the (JSON serializable) result
+    :raises: ValueError, HTTPError
+    """
+    sync = not options.get('nowait')
+    if command == 'state':
+        return server.state
+    if command in MANAGE_COMMANDS:
+        return getattr(server, command.replace('-', '_'))(sync=sync)
+    if command == 'restore':
+        return server.restore(options['backup'],
+                              data_only=options.get('data_only', False),
+                              sync=sync)
+    if command == 'backups':
+        return server.Backup.list_all(limit=options.get('limit', 7),
+                                      compact=True)
+    if command == 'system':
+        operation = options['operation']
+        if operation == 'list':
+            return server.System.list_all()
+        if not options.get('key'):
+            raise ValueError('a system table key is required')
+        if operation == 'get':
+            return server.System.get(options['key'])
+        if options.get('value') is None:
+            raise ValueError('a value is required')
+        server.System.save(options['key'], options['value'])
+        return True
+    raise ValueError("Unknown command '{0}'".format(command))
+
+def to_json(value):
+    """Encode a command result (`default` of json.dumps)."""
+    from .job import Job
+    if isinstance(value, Job):
+        return {'action': value.action, 'state': value.state,
+                'started': value.started}
+    if hasattr(value, 'iteritems'):
+        # e.g. BackupRecord
+        return dict(value.iteritems())
+    raise TypeError(repr(value) + ' is not JSON serializable')
@@ -5,6 +5,17 @@ from ConfigParser import SafeConfigParser
 
 SECTION_CREDENTIALS = 'Credentials'
 
-PARSER = SafeConfigParser()
-if 'HOME' in os.environ:
-    PARSER.read(os.path.abspath(os.path.expanduser('~/.palette')))
+# the settings file (only read when a setting is needed)
+PATH = '~/.palette'
+
+_PARSER = None
+
+def parser():
+    """Return the parsed settings file, reading it on first use."""
+    global _PARSER # pylint: disable=global-statement
+    if _PARSER is None:
+        settings = SafeConfigParser()
+        if 'HOME' in os.environ:
+            settings.read(os.path.abspath(os.path.expanduser(PATH)))
+        _PARSER = settings
+    return _PARSER
@@ -0,0 +1,283 @@
+""" The JSON decoder used for server responses.
+
+The fastest installed backend is used: `ujson`, then `simplejson` and
+otherwise the standard library `json` module.  A backend may also be
+selected explicitly:
+
+>>> palette.decoder.set_backend('json')
+
+:class:`ArrayStream` parses a response incrementally, yielding the elements
+of one array member (e.g. 'backups') as they arrive without building the
+whole document.
+"""
+from __future__ import absolute_import
+
+import re
+import json
+import importlib
+
+from .error import PaletteInternalError
+
+# backend module names in order of preference
+BACKENDS = ('ujson', 'simplejson', 'json')
+
+# the number of bytes read from the response at once when streaming
+CHUNK_SIZE = 16 * 1024
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_WHITESPACE_CHARS = ' \t\n\r'
+# the characters that matter when looking for the end of a value
+_STRUCTURE = re.compile(r'[][{}"]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+# the end of a number or literal
+_DELIMITER = re.compile(r'[,\]} \t\n\r]')
+
+_BACKEND = None
+
+def set_backend(name=None):
+    """Select the JSON backend by module name.  With no name, the first
+    backend of BACKENDS that is installed is used.
+
+    :returns: str -- the name of the backend.
+    :raises: ImportError
+    """
+    global _BACKEND # pylint: disable=global-statement
+    if name is not None:
+        _BACKEND = importlib.import_module(name)
+        return name
+    for candidate in BACKENDS:
+        try:
+            _BACKEND = importlib.import_module(candidate)
+        except ImportError:
+            continue
+        return candidate
+    return None
+
+def backend():
+    """Return the name of the JSON backend in use."""
+    if _BACKEND is None:
+        set_backend()
+    return _BACKEND.__name__
+
+def loads(text):
+    """Decode a JSON document.
+
+    :raises: ValueError
+    """
+    if _BACKEND is None:
+        set_backend()
+    return _BACKEND.loads(text)
+
+
+class ArrayStream(object):
+    """ Incrementally parse a JSON object read as a sequence of chunks.
+
+    Iterating yields the elements of the array member `key` one at a time
+    (converted by `factory` if given).  Every other member of the object
+    is collected in `members`; `before(members)` is called with the
+    members seen so far when the array starts, e.g. to check the status
+    of the response before any element is parsed.
+
+    :param chunks: an iterable of str (e.g. ``response.iter_content()``)
+    :param key: the name of the array member
+    :type key: str
+
+    :ivar members: the other members of the object
+    :ivar found: whether or not the array member was present
+    :ivar bytes: the number of bytes read so far
+    """
+    # pylint: disable=too-many-arguments,too-many-instance-attributes
+
+    def __init__(self, chunks, key, factory=None, before=None):
+        self.chunks = iter(chunks)
+        self.key = key
+        self.factory = factory
+        self.before = before
+        self.members = {}
+        self.found = False
+        self.bytes = 0
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        # the state of the scan for the end of a value (see _scan)
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def __iter__(self):
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            name = self._value()
+            self._expect(':')
+            if name == self.key and self._peek() == '[':
+                self.found = True
+                if self.before is not None:
+                    self.before(self.members)
+                for item in self._array():
+                    yield item
+            else:
+                self.members[name] = self._value()
+            if self._next_token() == '}':
+                return
+
+    def _array(self):
+        self._expect('[')
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        scan = self._decoder.scan_once
+        skip = _WHITESPACE.match
+        factory = self.factory
+        while True:
+            # fast path: a complete element followed by its separator
+            buf, pos = self._buffer, self._pos
+            try:
+                item, end = scan(buf, skip(buf, pos).end())
+                token = buf[end]
+                if token in _WHITESPACE_CHARS:
+                    end = skip(buf, end).end()
+                    token = buf[end]
+                if token not in ',]':
+                    # e.g. a number split by the end of a chunk
+                    raise ValueError(token)
+            except (StopIteration, ValueError, IndexError):
+                item = self._value()
+                token = self._peek()
+                end = self._pos
+            if token not in ',]':
+                raise PaletteInternalError(
+                    "Invalid JSON response: unexpected '{0}'".format(token))
+            self._pos = end + 1
+            if factory is not None:
+                item = factory(item)
+            yield item
+            if token == ']':
+                return
+
+    def _read(self):
+        """Return the next chunk (or None at the end of the input)."""
+        if self._eof:
+            return None
+        try:
+            chunk = next(self.chunks)
+        except StopIteration:
+            self._eof = True
+            return None
+        self.bytes += len(chunk)
+        return chunk
+
+    def _fill(self):
+        """Read the next chunk.  Returns False at the end of the input."""
+        chunk = self._read()
+        if chunk is None:
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self):
+        """Return the next non-whitespace character (not consumed)."""
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                raise PaletteInternalError("Truncated JSON response.")
+
+    def _next_token(self):
+        """Consume a ',' or closing bracket and return it."""
+        token = self._peek()
+        if token not in ',]}':
+            raise PaletteInternalError(
+                "Invalid JSON response: unexpected '{0}'".format(token))
+        self._pos += 1
+        return token
+
+    def _expect(self, token):
+        if self._peek() != token:
+            raise PaletteInternalError(
+                "Invalid JSON response: expected '{0}'".format(token))
+        self._pos += 1
+
+    def _value(self):
+        """Decode the next complete JSON value from the buffer."""
+        if self._peek() in '{["':
+            return self._composite()
+        # a number or literal: read up to the character that ends it
+        while not _DELIMITER.search(self._buffer, self._pos):
+            if not self._fill():
+                break
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, self._pos)
+        except ValueError:
+            raise PaletteInternalError("Invalid JSON response.")
+        self._pos = end
+        return value
+
+    def _composite(self):
+        """Decode the next object, array or string.
+
+        The value may span many chunks: the input is scanned once for the
+        end of the value (the scan state is kept across chunks) and the
+        value is decoded once it is complete, in linear time.
+        """
+        self._depth, self._in_string, self._escape = 0, False, False
+        end = self._scan(self._buffer, self._pos)
+        if end is None:
+            parts = [self._buffer[self._pos:]]
+            while end is None:
+                chunk = self._read()
+                if chunk is None:
+                    raise PaletteInternalError("Truncated JSON response.")
+                parts.append(chunk)
+                end = self._scan(chunk, 0)
+            self._buffer = ''.join(parts)
+            self._pos = 0
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, self._pos)
+        except ValueError:
+            raise PaletteInternalError("Invalid JSON response.")
+        self._pos = end
+        return value
+
+    def _scan(self, text, pos):
+        """Advance the scan for the end of a value over text[pos:].
+
+        :returns: the offset after the end of the value in `text`, or None
+          if the value continues in the next chunk.
+        """
+        while True:
+            if self._escape:
+                if pos >= len(text):
+                    return None
+                pos += 1
+                self._escape = False
+            if self._in_string:
+                match = _STRING_SPECIAL.search(text, pos)
+                if match is None:
+                    return None
+                pos = match.end()
+                if match.group() == '\\':
+                    self._escape = True
+                    continue
+                self._in_string = False
+                if self._depth == 0:
+                    return pos
+                continue
+            match = _STRUCTURE.search(text, pos)
+            if match is None:
+                return None
+            pos = match.end()
+            char = match.group()
+            if char == '"':
+                self._in_string = True
+            elif char in '[{':
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    return pos
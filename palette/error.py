@@ -26,3 +26,41 @@ class PaletteJsonError(PaletteInternalError):
     def __init__(self, key, data=None):
         message = "JSON data did not contain '{0}'".format(key)
         super(PaletteJsonError, self).__init__(message, data=data)
+
+class PaletteTimeoutError(PaletteError):
+    """The operation did not complete within the given timeout."""
+    def __init__(self, message='Operation timed out'):
+        super(PaletteTimeoutError, self).__init__(message)
+
+class PaletteCancelledError(PaletteError):
+    """The operation was cancelled before it completed."""
+    def __init__(self, message='Operation cancelled'):
+        super(PaletteCancelledError, self).__init__(message)
+
+class PaletteCircuitOpenError(PaletteError):
+    """Requests to the server are suspended after repeated failures.
+    The `retry_in` attribute is the number of seconds until the next
+    request is attempted."""
+    def __init__(self, url=None, retry_in=None):
+        message = "Too many failures of '{0}', retry in {1:.1f} seconds"
+        super(PaletteCircuitOpenError, self).__init__(
+            message.format(url, retry_in or 0))
+        self.retry_in = retry_in
+
+class PaletteChecksumError(PaletteError):
+    """A transferred file does not have the expected size or digest."""
+    def __init__(self, url, expected, actual):
+        message = "'{0}' is corrupt: expected {1}, got {2}".format(
+            url, expected, actual)
+        super(PaletteChecksumError, self).__init__(message)
+        self.expected = expected
+        self.actual = actual
+
+class PaletteFleetError(PaletteError):
+    """One or more servers of a fleet operation failed.
+    The `errors` attribute maps each failed PaletteServer to its exception."""
+    def __init__(self, errors):
+        message = '{0} server(s) failed: {1}'.format(
+            len(errors), ', '.join(sorted(server.url for server in errors)))
+        super(PaletteFleetError, self).__init__(message)
+        self.errors = errors
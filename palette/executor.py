@@ -0,0 +1,294 @@
+""" Futures and a bounded worker pool for running SDK calls concurrently.
+
+The interface follows ``concurrent.futures`` so that the objects returned
+by the SDK may be used interchangeably with the standard library (Python 3)
+or the ``futures`` backport (Python 2) without requiring either.
+"""
+import sys
+import time
+import threading
+import Queue as queue
+
+from . import logger
+from .error import PaletteTimeoutError, PaletteCancelledError
+
+DEFAULT_MAX_WORKERS = 16
+
+PENDING = 'PENDING'
+RUNNING = 'RUNNING'
+CANCELLED = 'CANCELLED'
+FINISHED = 'FINISHED'
+
+class Future(object):
+    """ The result of an operation that may not have completed yet. """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._state = PENDING
+        self._result = None
+        self._exception = None
+        self._traceback = None
+        self._callbacks = []
+
+    def __repr__(self):
+        return '<{0} state={1}>'.format(type(self).__name__, self._state)
+
+    def cancel(self):
+        """Cancel the operation if it has not started yet.
+
+        :returns: bool -- whether or not the operation was cancelled.
+        """
+        with self._condition:
+            if self._state in (RUNNING, FINISHED):
+                return False
+            if self._state == PENDING:
+                self._state = CANCELLED
+                self._condition.notify_all()
+        self._invoke_callbacks()
+        return True
+
+    def cancelled(self):
+        """Return True if the operation was cancelled."""
+        return self._state == CANCELLED
+
+    def running(self):
+        """Return True if the operation is currently executing."""
+        return self._state == RUNNING
+
+    def done(self):
+        """Return True if the operation completed or was cancelled."""
+        return self._state in (CANCELLED, FINISHED)
+
+    def wait(self, timeout=None):
+        """Wait for the operation to complete.
+
+        :param timeout: maximum number of seconds to wait (None = forever)
+        :type timeout: float
+        :returns: bool -- whether or not the operation is done.
+        """
+        with self._condition:
+            if timeout is None:
+                while not self.done():
+                    # a (long) timeout keeps the wait interruptible on Python 2
+                    self._condition.wait(3600)
+            else:
+                deadline = time.time() + timeout
+                while not self.done():
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+            return self.done()
+
+    def result(self, timeout=None):
+        """Return the result of the operation, waiting if needed.
+
+        :param timeout: maximum number of seconds to wait (None = forever)
+        :type timeout: float
+        :raises: PaletteTimeoutError, PaletteCancelledError or the exception
+          raised by the operation itself.
+        """
+        if not self.wait(timeout):
+            raise PaletteTimeoutError()
+        if self._state == CANCELLED:
+            raise PaletteCancelledError()
+        if self._exception is not None:
+            raise type(self._exception), self._exception, self._traceback
+        return self._result
+
+    def exception(self, timeout=None):
+        """Return the exception raised by the operation (or None).
+
+        :raises: PaletteTimeoutError, PaletteCancelledError
+        """
+        if not self.wait(timeout):
+            raise PaletteTimeoutError()
+        if self._state == CANCELLED:
+            raise PaletteCancelledError()
+        return self._exception
+
+    def add_done_callback(self, func):
+        """Call `func` with this future as the only argument once it is done.
+        If the future is already done, `func` is called immediately.
+        """
+        with self._condition:
+            if not self.done():
+                self._callbacks.append(func)
+                return
+        self._call(func)
+
+    def set_running_or_notify_cancel(self):
+        """Mark the future as running.
+
+        :returns: bool -- False if the future was cancelled.
+        """
+        with self._condition:
+            if self._state == CANCELLED:
+                return False
+            self._state = RUNNING
+            return True
+
+    def set_result(self, result):
+        """Complete the future with `result`."""
+        with self._condition:
+            self._result = result
+            self._state = FINISHED
+            self._condition.notify_all()
+        self._invoke_callbacks()
+
+    def set_exception(self, exception, traceback=None):
+        """Complete the future with `exception`."""
+        with self._condition:
+            self._exception = exception
+            self._traceback = traceback
+            self._state = FINISHED
+            self._condition.notify_all()
+        self._invoke_callbacks()
+
+    def _invoke_callbacks(self):
+        with self._condition:
+            callbacks, self._callbacks = self._callbacks, []
+        for func in callbacks:
+            self._call(func)
+
+    def _call(self, func):
+        try:
+            func(self)
+        except Exception: # pylint: disable=broad-except
+            logger.exception("Future callback %r raised an exception", func)
+
+
+def run_future(future, func, *args, **kwargs):
+    """Run `func` and store its result (or exception) in `future`."""
+    if not future.set_running_or_notify_cancel():
+        return
+    try:
+        result = func(*args, **kwargs)
+    except Exception as ex: # pylint: disable=broad-except
+        future.set_exception(ex, sys.exc_info()[2])
+    else:
+        future.set_result(result)
+
+
+class WorkerPool(object):
+    """ A bounded pool of daemon threads that run submitted calls.
+
+    Threads are started on demand up to `max_workers` so that an idle pool
+    costs nothing.  Many servers may (and should) share one pool.
+
+    :param max_workers: the maximum number of concurrent calls.
+    :type max_workers: int
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+        if max_workers < 1:
+            raise ValueError("'max_workers' must be greater than 0")
+        self.max_workers = max_workers
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._idle = 0
+        self._shutdown = False
+
+    def submit(self, func, *args, **kwargs):
+        """Schedule `func(*args, **kwargs)` to be run by the pool.
+
+        :returns: a :class:`Future <palette.executor.Future>` instance
+        :raises: RuntimeError
+        """
+        future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError('cannot submit after shutdown')
+            self._queue.put((future, func, args, kwargs))
+            if self._idle > 0:
+                self._idle -= 1
+            elif len(self._threads) < self.max_workers:
+                self._start_thread()
+        return future
+
+    def map(self, func, *iterables):
+        """Like the builtin ``map`` but each call runs in the pool.
+
+        :returns: a list of futures, one per call.
+        """
+        return [self.submit(func, *args) for args in zip(*iterables)]
+
+    def shutdown(self, wait=True):
+        """Stop accepting work and (optionally) wait for queued calls."""
+        with self._lock:
+            self._shutdown = True
+            threads = list(self._threads)
+        for _ in threads:
+            self._queue.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def _start_thread(self):
+        name = 'palette-worker-{0}'.format(len(self._threads))
+        thread = threading.Thread(target=self._worker, name=name)
+        thread.daemon = True
+        self._threads.append(thread)
+        thread.start()
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, func, args, kwargs = item
+            run_future(future, func, *args, **kwargs)
+            del item, future
+            with self._lock:
+                self._idle += 1
+
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+def default_pool(name='default'):
+    """Return the process-wide WorkerPool shared by default.
+
+    A call that waits on a future must not depend on a worker of the pool
+    it runs in (all workers may be waiting), so the SDK runs its internal
+    work -- job polling ('poll') and page prefetching ('prefetch') -- in
+    pools of their own, by name.
+
+    :param name: the purpose of the pool
+    :type name: str
+    """
+    with _POOLS_LOCK:
+        pool = _POOLS.get(name)
+        if pool is None:
+            pool = _POOLS[name] = WorkerPool()
+        return pool
+
+
+def as_completed(futures, timeout=None):
+    """Yield the given futures as they complete (finished or cancelled).
+
+    :param timeout: the maximum number of seconds to wait for all futures.
+    :type timeout: float
+    :raises: PaletteTimeoutError
+    """
+    futures = set(futures)
+    finished = queue.Queue()
+    for future in futures:
+        future.add_done_callback(finished.put)
+    deadline = None if timeout is None else time.time() + timeout
+    for _ in xrange(len(futures)):
+        if deadline is None:
+            # a (long) timeout keeps the wait interruptible on Python 2
+            while True:
+                try:
+                    future = finished.get(True, 3600)
+                    break
+                except queue.Empty:
+                    continue
+        else:
+            try:
+                future = finished.get(True, max(0, deadline - time.time()))
+            except queue.Empty:
+                raise PaletteTimeoutError()
+        yield future
@@ -0,0 +1,374 @@
+""" Export metrics of Palette servers to Prometheus.
+
+A :class:`FleetExporter` collects the state, system table and recent
+backups of every server concurrently on a schedule and serves the values
+in the Prometheus text exposition format:
+
+>>> exporter = FleetExporter(['https://one.example.com',
+...                           'https://two.example.com'], interval=60)
+>>> exporter.start(port=9463)
+'http://0.0.0.0:9463/metrics'
+
+Scrapes are answered from the snapshot of the last collection, so they
+never send requests to the servers.  Besides the collected values the
+snapshot contains derived gauges (backup age, backup size trend, time in
+the current state) and the request latency histograms and circuit breaker
+counters each PaletteServer keeps anyway.
+"""
+from __future__ import absolute_import
+
+import time
+import threading
+import BaseHTTPServer
+import SocketServer
+from collections import OrderedDict
+
+from . import logger
+from .fleet import PaletteFleet
+from .internal import parse_time
+
+DEFAULT_PORT = 9463
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# every 4th latency bucket bound (a factor of 2 apart)
+LATENCY_BUCKET_STEP = 4
+
+# the CircuitBreaker counters exported
+CIRCUIT_COUNTERS = (
+    ('failures', 'Failed requests seen by the circuit breaker.'),
+    ('successes', 'Successful requests seen by the circuit breaker.'),
+    ('rejected', 'Requests rejected while the circuit was open.'),
+    ('opened', 'The number of times the circuit opened.'),
+)
+
+def _escape(value):
+    """Escape a label value."""
+    return unicode(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float):
+        return repr(value)
+    return str(int(value))
+
+def _number(value):
+    """Return a numeric (or boolean) system table value as a number, or
+    None for other values."""
+    if isinstance(value, (bool, int, long, float)):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def size_trend(backups):
+    """ Return the growth of the backup size in bytes per second (the
+    least squares slope of size over creation time) or None if it cannot
+    be estimated.
+
+    :param backups: Backup (or BackupRecord) instances
+    """
+    points = []
+    for backup in backups:
+        created = parse_time(backup.get('creation-time'))
+        if created is not None and backup.get('size') is not None:
+            points.append((created, backup['size']))
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / float(len(points))
+    mean_y = sum(y for _, y in points) / float(len(points))
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if not variance:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+
+class Metrics(object):
+    """ Samples grouped by metric, rendered in the text exposition format.
+    """
+
+    def __init__(self):
+        self._metrics = OrderedDict()
+
+    def add(self, name, kind, doc, value, labels=None, suffix=''):
+        """ Add a sample of the metric `name`.
+
+        :param kind: 'gauge', 'counter' or 'histogram'
+        :param doc: the help text of the metric
+        :param labels: (name, value) pairs
+        :param suffix: appended to the sample name e.g. '_bucket'
+        """
+        # pylint: disable=too-many-arguments
+        if value is None:
+            return
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = (kind, doc, [])
+        metric[2].append((name + suffix, labels or (), value))
+
+    def render(self):
+        """Return the text exposition of the samples."""
+        lines = []
+        for name, (kind, doc, samples) in self._metrics.iteritems():
+            lines.append('# HELP {0} {1}'.format(name, doc))
+            lines.append('# TYPE {0} {1}'.format(name, kind))
+            for sample, labels, value in samples:
+                if labels:
+                    sample += '{' + ','.join(
+                        u'{0}="{1}"'.format(key, _escape(label))
+                        for key, label in labels) + '}'
+                lines.append(u'{0} {1}'.format(sample, _format_value(value)))
+        return u'\n'.join(lines).encode('utf-8') + '\n'
+
+
+def collect(server, history=7):
+    """ Retrieve the values exported for `server` in one batch.
+
+    :returns: dict with the keys 'state', 'system' and 'backups' (the
+      `history` most recent backups, newest first).
+    """
+    with server.batch() as batch:
+        state = batch.state
+        system = batch.System.list_all()
+        backups = batch.Backup.list_all(limit=history, compact=True)
+    return {'state': state.result(), 'system': system.result(),
+            'backups': backups.result()}
+
+
+class FleetExporter(object):
+    """ Collect metrics of Palette servers on a schedule and serve them
+    over HTTP from a cached snapshot.
+
+    :param servers: a PaletteFleet or the servers of one (see
+      :class:`PaletteFleet <palette.PaletteFleet>`); a fleet created by the
+      exporter is closed by :meth:`stop`.
+    :param interval: seconds between collections
+    :type interval: float
+    :param timeout: the per-server timeout of a collection (default:
+      `interval`)
+    :type timeout: float
+    :param history: the number of recent backups the size trend is
+      computed from
+    :type history: int
+
+    Any additional keyword arguments are passed to PaletteFleet.
+
+    :ivar snapshot: the text exposition of the last collection (None
+      before the first one completes)
+    :ivar collected: the time of the last collection
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, servers, interval=60.0, timeout=None, history=7,
+                 **kwargs):
+        if timeout is None:
+            timeout = interval
+        self._owns_fleet = not isinstance(servers, PaletteFleet)
+        if self._owns_fleet:
+            servers = PaletteFleet(servers, timeout=timeout, **kwargs)
+        self.fleet = servers
+        self.interval = interval
+        self.timeout = timeout
+        self.history = history
+        self.snapshot = None
+        self.collected = None
+        self.httpd = None
+        # server -> (state, time of the last change, transitions)
+        self._states = {}
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def collect(self):
+        """ Collect the metrics of every server and replace the snapshot.
+
+        :returns: str -- the new snapshot.
+        """
+        started = time.time()
+        results = self.fleet.run(collect, kwargs={'history': self.history},
+                                 timeout=self.timeout)
+        metrics = Metrics()
+        # (the index tells servers with the same URL apart)
+        indexes = dict((server, index)
+                       for index, server in enumerate(self.fleet.servers))
+        for result in results:
+            self._add_server(metrics, result, indexes[result.server], started)
+        elapsed = time.time() - started
+        metrics.add('palette_exporter_collection_duration_seconds', 'gauge',
+                    'Seconds the last collection took.', elapsed)
+        metrics.add('palette_exporter_last_collection_timestamp_seconds',
+                    'gauge', 'Time of the last collection.', started)
+        self.snapshot = metrics.render()
+        self.collected = started
+        logger.info("Exporter collected %d server(s) in %.3fs",
+                    len(results), elapsed)
+        return self.snapshot
+
+    def _add_server(self, metrics, result, index, now):
+        labels = (('server', result.server.url), ('index', str(index)))
+        metrics.add('palette_up', 'gauge',
+                    'Whether the last collection succeeded.',
+                    int(result.ok), labels)
+        metrics.add('palette_collection_duration_seconds', 'gauge',
+                    'Seconds the collection of the server took.',
+                    result.elapsed, labels)
+        if result.ok:
+            self._add_state(metrics, labels, result.server,
+                            result.result['state'], now)
+            self._add_backups(metrics, labels, result.result['backups'], now)
+            for key, value in sorted(result.result['system'].iteritems()):
+                metrics.add('palette_system_value', 'gauge',
+                            'The numeric values of the system table.',
+                            _number(value), labels + (('key', key),))
+        _add_latency(metrics, labels, result.server.latency)
+        if result.server.circuit is not None:
+            _add_circuit(metrics, labels, result.server.circuit.counters())
+
+    # pylint: disable=too-many-arguments
+    def _add_state(self, metrics, labels, server, state, now):
+        previous, since, transitions = self._states.get(server,
+                                                        (None, now, 0))
+        if previous is not None and state != previous:
+            since = now
+            transitions += 1
+        self._states[server] = (state, since, transitions)
+        metrics.add('palette_state', 'gauge',
+                    'The state of the environment (1 for the current one).',
+                    1, labels + (('state', state),))
+        metrics.add('palette_state_duration_seconds', 'gauge',
+                    'Seconds since the state last changed (as observed by '
+                    'the exporter).', now - since, labels)
+        metrics.add('palette_state_transitions_total', 'counter',
+                    'State changes observed by the exporter.',
+                    transitions, labels)
+
+    @staticmethod
+    def _add_backups(metrics, labels, backups, now):
+        if not backups:
+            return
+        latest = backups[0]
+        created = parse_time(latest.get('creation-time'))
+        if created is not None:
+            metrics.add('palette_backup_age_seconds', 'gauge',
+                        'Seconds since the latest backup was created.',
+                        now - created, labels)
+        metrics.add('palette_backup_size_bytes', 'gauge',
+                    'The size of the latest backup.', latest.get('size'),
+                    labels)
+        metrics.add('palette_backup_size_trend_bytes_per_second', 'gauge',
+                    'The growth of the backup size over the recent backups.',
+                    size_trend(backups), labels)
+
+    def run(self):
+        """Collect every `interval` seconds until stopped."""
+        while not self._stopped.is_set():
+            started = time.time()
+            try:
+                self.collect()
+            except Exception: # pylint: disable=broad-except
+                logger.exception("Exporter collection failed")
+            self._stopped.wait(max(0, started + self.interval - time.time()))
+
+    def start(self, port=DEFAULT_PORT, address=''):
+        """ Start collecting and serving the snapshot (in daemon threads).
+
+        :param port: the port to listen on (0: any free port)
+        :type port: int
+        :param address: the address to listen on (default: all)
+        :type address: str
+        :returns: str -- the URL of the metrics.
+        """
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self.run,
+                                        name='palette-exporter')
+        self._thread.daemon = True
+        self._thread.start()
+        self.httpd = _HTTPServer((address, port), _Handler)
+        self.httpd.exporter = self
+        thread = threading.Thread(target=self.httpd.serve_forever,
+                                  name='palette-exporter-http')
+        thread.daemon = True
+        thread.start()
+        return 'http://{0}:{1}/metrics'.format(*self.httpd.server_address)
+
+    def stop(self):
+        """Stop collecting and serving (and close the fleet if the exporter
+        created it)."""
+        self._stopped.set()
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._owns_fleet:
+            self.fleet.close()
+
+
+def _add_latency(metrics, labels, stats):
+    """Add the request latency histograms of a LatencyStats."""
+    name = 'palette_request_duration_seconds'
+    doc = 'Latency of the requests made to the server.'
+    snapshot = stats.snapshot()
+    for endpoint, histogram, _ in snapshot:
+        tags = labels + (('endpoint', endpoint),)
+        buckets = histogram.buckets()
+        for bound, count in buckets[LATENCY_BUCKET_STEP - 1:-1:
+                                    LATENCY_BUCKET_STEP] + buckets[-1:]:
+            metrics.add(name, 'histogram', doc, count,
+                        tags + (('le', _format_value(bound)),), '_bucket')
+        metrics.add(name, 'histogram', doc, histogram.sum, tags, '_sum')
+        metrics.add(name, 'histogram', doc, histogram.count, tags, '_count')
+    for endpoint, _, errors in snapshot:
+        metrics.add('palette_request_errors_total', 'counter',
+                    'Failed requests made to the server.', errors,
+                    labels + (('endpoint', endpoint),))
+
+def _add_circuit(metrics, labels, counters):
+    """Add the state and counters of a CircuitBreaker."""
+    metrics.add('palette_circuit_state', 'gauge',
+                'The circuit breaker state (1 for the current one).', 1,
+                labels + (('state', counters['state']),))
+    for key, doc in CIRCUIT_COUNTERS:
+        metrics.add('palette_circuit_{0}_total'.format(key), 'counter', doc,
+                    counters[key], labels)
+    metrics.add('palette_circuit_consecutive_failures', 'gauge',
+                'Failures since the last success.',
+                counters['consecutive_failures'], labels)
+
+
+class _HTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    exporter = None
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serve the snapshot of the exporter."""
+
+    def log_message(self, fmt, *args): # pylint: disable=arguments-differ
+        logger.debug("Exporter: " + fmt, *args)
+
+    def do_GET(self): # pylint: disable=invalid-name
+        """Handle a GET request."""
+        snapshot = self.server.exporter.snapshot
+        if self.path.split('?', 1)[0] != '/metrics':
+            code, body = 404, 'Not Found\n'
+        elif snapshot is None:
+            code, body = 503, 'No metrics collected yet\n'
+        else:
+            code, body = 200, snapshot
+        self.send_response(code)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
@@ -0,0 +1,336 @@
+"""Run operations across many Palette servers concurrently.
+
+>>> fleet = palette.PaletteFleet(['https://one.example.com',
+...                               'https://two.example.com'])
+>>> for res in fleet.state():
+...     print res.url, res.result if res.ok else res.error
+"""
+from __future__ import absolute_import
+
+import time
+import threading
+import Queue as queue
+
+from . import logger
+from .error import PaletteFleetError, PaletteTimeoutError
+from .executor import Future, WorkerPool, default_pool, run_future
+from .internal import ApiObject
+from .server import PaletteServer
+
+# how often unstarted tasks are checked when a timeout is in effect
+TIMEOUT_TICK = 0.5
+
+class ServerResult(object):
+    """The outcome of a fleet operation on one server.
+
+    :ivar server: the PaletteServer instance
+    :ivar result: the value returned by the operation (if successful)
+    :ivar error: the exception raised by the operation (or None)
+    :ivar elapsed: the number of seconds the operation ran for
+    """
+
+    def __init__(self, server, result=None, error=None, elapsed=None):
+        self.server = server
+        self.result = result
+        self.error = error
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        if self.ok:
+            return '<ServerResult {0} result={1!r}>'.format(self.url,
+                                                            self.result)
+        return '<ServerResult {0} error={1!r}>'.format(self.url, self.error)
+
+    @property
+    def url(self):
+        """The URL of the server."""
+        return self.server.url
+
+    @property
+    def ok(self): # pylint: disable=invalid-name
+        """True if the operation succeeded."""
+        return self.error is None
+
+
+class _Task(object):
+    """Bookkeeping for one server of a fleet operation."""
+
+    def __init__(self, server):
+        self.server = server
+        self.future = Future()
+        self.started = None
+
+    def run(self, func, args, kwargs):
+        """Run the operation in a worker thread."""
+        run_future(self.future, self._call, func, args, kwargs)
+
+    def _call(self, func, args, kwargs):
+        self.started = time.time()
+        if self.server.auth_tkt is None:
+            self.server.authenticate(cached=True)
+        return func(self.server, *args, **kwargs)
+
+
+class FleetResult(object):
+    """The per-server results of a fleet operation.
+
+    Iterating over the instance yields a :class:`ServerResult` for each
+    server as soon as that server completes (or exceeds the timeout).
+    The `results` and `errors` properties wait for every server.
+    """
+
+    def __init__(self, tasks, timeout=None):
+        self.timeout = timeout
+        self._pending = set(tasks)
+        self._completed = []
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        for task in tasks:
+            task.future.add_done_callback(
+                lambda future, task=task: self._queue.put(task))
+
+    def __iter__(self):
+        index = 0
+        while True:
+            with self._lock:
+                if index < len(self._completed):
+                    item = self._completed[index]
+                elif not self._pending:
+                    return
+                else:
+                    item = self._next()
+            index += 1
+            yield item
+
+    def __len__(self):
+        return len(self._pending) + len(self._completed)
+
+    def _next(self):
+        """Wait for the next server to complete or time out."""
+        while True:
+            wait = None
+            if self.timeout is not None:
+                now = time.time()
+                wait = TIMEOUT_TICK
+                for task in self._pending:
+                    if task.started is None:
+                        continue
+                    remaining = task.started + self.timeout - now
+                    if remaining <= 0:
+                        return self._timed_out(task)
+                    wait = min(wait, remaining)
+            try:
+                if wait is None:
+                    # a (long) timeout keeps the wait interruptible on Python 2
+                    task = self._queue.get(True, 3600)
+                else:
+                    task = self._queue.get(True, wait)
+            except queue.Empty:
+                continue
+            if task in self._pending:
+                return self._finished(task)
+
+    def _finished(self, task):
+        self._pending.discard(task)
+        elapsed = None
+        if task.started is not None:
+            elapsed = time.time() - task.started
+        error = task.future.exception()
+        if error is None:
+            item = ServerResult(task.server, result=task.future.result(),
+                                elapsed=elapsed)
+        else:
+            item = ServerResult(task.server, error=error, elapsed=elapsed)
+            logger.info("Fleet operation failed on '%s': %s",
+                        task.server.url, error)
+        self._completed.append(item)
+        return item
+
+    def _timed_out(self, task):
+        self._pending.discard(task)
+        error = PaletteTimeoutError(
+            "No response from '{0}' within {1} seconds".format(
+                task.server.url, self.timeout))
+        logger.info("Fleet operation timed out on '%s'", task.server.url)
+        item = ServerResult(task.server, error=error,
+                            elapsed=time.time() - task.started)
+        self._completed.append(item)
+        return item
+
+    def wait(self):
+        """Wait for every server to complete (or time out).
+
+        :returns: the list of ServerResult instances.
+        """
+        return list(self)
+
+    @property
+    def results(self):
+        """A mapping of PaletteServer instance to the result for successful
+        servers (a fleet may contain several servers with the same URL)."""
+        return dict((item.server, item.result) for item in self if item.ok)
+
+    @property
+    def errors(self):
+        """A mapping of PaletteServer instance to the exception for failed
+        servers."""
+        return dict((item.server, item.error) for item in self if not item.ok)
+
+    def raise_for_errors(self):
+        """Raise PaletteFleetError if the operation failed on any server.
+
+        :raises: PaletteFleetError
+        """
+        errors = self.errors
+        if errors:
+            raise PaletteFleetError(errors)
+
+
+class FleetApiObject(ApiObject):
+    """Expose the class methods of a resource class across a fleet.
+    Here `server` is the PaletteFleet instance."""
+
+    def bind(self, method):
+        def run(*args, **kwargs):
+            """Run the class method on every server of the fleet."""
+            return self.server.run(method, args=args, kwargs=kwargs)
+        return run
+
+
+class PaletteFleet(object):
+    """A collection of Palette servers operated on concurrently.
+
+    Each entry of `servers` may be a URL, a PaletteServer instance, a
+    (url, username, password) tuple or a dict of PaletteServer keyword
+    arguments.  Servers are authenticated on first use.
+
+    :param servers: the servers of the fleet
+    :type servers: list
+    :param username: the default username for servers specified by URL
+    :type username: str
+    :param password: the default password for servers specified by URL
+    :type password: str
+    :param timeout: the per-server timeout in seconds (None = no timeout)
+    :type timeout: float
+    :param max_workers: the maximum number of servers operated on at once
+      (default: the shared worker pool); the fleet shuts down the pool it
+      creates when it is closed.
+    :type max_workers: int
+    :param pool: the worker pool to use instead of `max_workers`
+    :type pool: WorkerPool
+    :raises: ValueError
+
+    Any additional keyword arguments are passed to the PaletteServer
+    constructor of servers created by the fleet.
+    """
+    # pylint: disable=too-many-arguments
+
+    def __init__(self, servers, username=None, password=None, timeout=None,
+                 max_workers=None, pool=None, **kwargs):
+        self.timeout = timeout
+        self._owns_pool = False
+        if pool is None:
+            if max_workers is None:
+                pool = default_pool()
+            else:
+                pool = WorkerPool(max_workers=max_workers)
+                self._owns_pool = True
+        self.pool = pool
+        kwargs.setdefault('timeout', timeout)
+        defaults = {'username': username, 'password': password}
+        defaults.update(kwargs)
+        self._owned = set()
+        self.servers = [self._make_server(spec, defaults) for spec in servers]
+
+    def _make_server(self, spec, defaults):
+        if isinstance(spec, PaletteServer):
+            return spec
+        kwargs = dict(defaults)
+        if isinstance(spec, basestring):
+            kwargs['url'] = spec
+        elif isinstance(spec, dict):
+            kwargs.update(spec)
+        elif isinstance(spec, (tuple, list)):
+            kwargs.update(zip(('url', 'username', 'password'), spec))
+        else:
+            raise ValueError("Invalid server specification: " + repr(spec))
+        server = PaletteServer(**kwargs)
+        self._owned.add(server)
+        return server
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.servers)
+
+    def __iter__(self):
+        return iter(self.servers)
+
+    def __getattr__(self, name):
+        return FleetApiObject.attach(self, name)
+
+    def close(self):
+        """Close the pooled connections of the servers and shut down the
+        worker pool the fleet created itself."""
+        for server in self.servers:
+            if server in self._owned:
+                server.close()
+        if self._owns_pool:
+            self.pool.shutdown(wait=False)
+
+    def run(self, func, args=(), kwargs=None, timeout=None):
+        """Call ``func(server, *args, **kwargs)`` for every server.
+
+        :param timeout: the per-server timeout (default: the fleet timeout)
+        :type timeout: float
+        :returns: a :class:`FleetResult` instance
+        """
+        if kwargs is None:
+            kwargs = {}
+        if timeout is None:
+            timeout = self.timeout
+        tasks = []
+        for server in self.servers:
+            task = _Task(server)
+            self.pool.submit(task.run, func, args, kwargs)
+            tasks.append(task)
+        return FleetResult(tasks, timeout=timeout)
+
+    def connect(self):
+        """Authenticate every server.
+
+        :returns: a :class:`FleetResult` instance
+        """
+        return self.run(PaletteServer.authenticate)
+
+    def state(self):
+        """Retrieve the state of every server."""
+        return self.run(lambda server: server.state)
+
+    def start(self, sync=True):
+        """Start the Tableau server on every server."""
+        return self.run(PaletteServer.start, kwargs={'sync': sync})
+
+    def stop(self, sync=True):
+        """Stop the Tableau server on every server."""
+        return self.run(PaletteServer.stop, kwargs={'sync': sync})
+
+    def restart(self, sync=True):
+        """Restart the Tableau server on every server."""
+        return self.run(PaletteServer.restart, kwargs={'sync': sync})
+
+    def backup(self, sync=True):
+        """Take a Tableau backup on every server."""
+        return self.run(PaletteServer.backup, kwargs={'sync': sync})
+
+    def repair_license(self, sync=True):
+        """Repair the Tableau Server license on every server."""
+        return self.run(PaletteServer.repair_license, kwargs={'sync': sync})
+
+    def ziplogs(self, sync=True):
+        """Cleanup the Tableau Server logs on every server."""
+        return self.run(PaletteServer.ziplogs, kwargs={'sync': sync})
@@ -1,41 +1,96 @@
 """ Internal class that are not part of the API. """
 
-import inspect
+import time
+import calendar
+import functools
+import importlib
 
 from .error import PaletteError, PaletteJsonError, PaletteInternalError
 
 API_PATH_INFO = '/api/v1'
 
-class ClassMethod(object):
-    """Wrapper around an exposed class method."""
-    def __init__(self, server, method):
-        self.server = server
-        self.method = method
+# The resource classes exposed as attributes of PaletteServer (and of
+# its asynchronous, batch and fleet counterparts): name -> class, or the
+# submodule defining a class of that name (imported on first use).
+_RESOURCES = {
+    'Backup': 'backup',
+    'LogBundle': 'logbundle',
+    'System': 'system',
+}
+
+def register_resource(name, cls):
+    """ Expose the class methods of `cls` as ``server.<name>``.
+
+    :param name: the attribute name e.g. 'Backup'
+    :type name: str
+    :param cls: the resource class
+    :type cls: type
+    """
+    _RESOURCES[name] = cls
+
+def resource_class(name):
+    """Return the resource class registered as `name` (or None)."""
+    cls = _RESOURCES.get(name)
+    if isinstance(cls, basestring):
+        module = importlib.import_module(
+            '.' + cls, __name__.rpartition('.')[0])
+        cls = _RESOURCES[name] = getattr(module, name)
+    return cls
 
-    def __call__(self, *args, **kwargs):
-        return self.method(self.server, *args, **kwargs)
 
 class ApiObject(object):
-    """Wrapper for exposing class methods of base classes from PaletteServer."""
+    """Wrapper for exposing class methods of base classes from PaletteServer.
+
+    Both the wrapper (see :meth:`attach`) and the methods it binds are
+    cached as attributes, so only the first access of each goes through
+    ``__getattr__``.
+    """
 
     def __init__(self, server, cls):
         self.server = server
         self.cls = cls
 
+    @classmethod
+    def attach(cls, server, name):
+        """ Return the wrapper of the resource `name` for `server` and cache
+        it as an attribute of `server`.
+
+        :raises: AttributeError if no resource `name` is registered.
+        """
+        resource = resource_class(name)
+        if resource is None:
+            fmt = "'{0}' object has no attribute '{1}'"
+            raise AttributeError(fmt.format(type(server).__name__, name))
+        result = cls(server, resource)
+        setattr(server, name, result)
+        return result
+
     def __getattr__(self, name):
         # raises AttributeError if not found...
         method = getattr(self.cls, name)
-        # test for a classmethod
-        if inspect.ismethod(method) and method.__self__ is self.cls:
-            return ClassMethod(self.server, method)
-        fmt = "type object '{0}' has no classmethod '{1}'"
-        raise AttributeError(fmt.format(self.cls.__name__, name))
+        # only a classmethod is bound to the class itself
+        if getattr(method, '__self__', None) is not self.cls:
+            fmt = "type object '{0}' has no classmethod '{1}'"
+            raise AttributeError(fmt.format(self.cls.__name__, name))
+        result = self.bind(method)
+        setattr(self, name, result)
+        return result
+
+    def bind(self, method):
+        """Return a callable invoking the classmethod for this server."""
+        return functools.partial(method, self.server)
 
 
+# Cache of property name -> JSON key for DictObject instances.
+_JSON_KEYS = {}
+
 class DictObject(dict):
     """Base class that makes a dict function like an objects by exposing the
     keys of the dict as properties."""
 
+    # The compact Record subclass used when `compact=True` (if any).
+    RECORD = None
+
     def __init__(self, server, data=None):
         self.server = server
         dict.__init__(self, data)
@@ -43,11 +98,147 @@ class DictObject(dict):
     def __getattr__(self, name):
         if name == 'unique_id':
             return self['id']
-        key = translate_to_json_key(name)
+        try:
+            key = _JSON_KEYS[name]
+        except KeyError:
+            key = _JSON_KEYS[name] = translate_to_json_key(name)
         if key in self:
             return self[key]
         fmt = "object '{0}' has no property '{1}'"
-        raise AttributeError(fmt.format(self.cls.__name__, name))
+        raise AttributeError(fmt.format(type(self).__name__, name))
+
+    @classmethod
+    def from_json(cls, server, data, compact=False):
+        """ Convert a JSON object (as a dictionary) to an instance of `cls`
+        or of the compact `cls.RECORD` type.
+        """
+        if not 'id' in data:
+            message = "JSON object '{0}' does not contain an 'id'"
+            raise PaletteInternalError(message.format(cls.__name__))
+        if compact and cls.RECORD is not None:
+            return cls.RECORD(server, data) # pylint: disable=not-callable
+        return cls(server, data)
+
+
+class RecordType(type):
+    """Metaclass creating the slots of a Record from its FIELDS."""
+
+    def __new__(mcs, name, bases, namespace):
+        if '__slots__' not in namespace:
+            fields = namespace.get('FIELDS', ())
+            slots = tuple(translate_to_variable_name(key) for key in fields)
+            namespace['__slots__'] = slots
+            namespace['_slots'] = dict(zip(fields, slots))
+        return super(RecordType, mcs).__new__(mcs, name, bases, namespace)
+
+
+class Record(object):
+    """Compact, fixed-layout alternative to a DictObject.
+
+    Subclasses list the JSON keys in FIELDS; each becomes a slot (with
+    the key translated to a variable name once, when the class is
+    created).  Records support the read-only mapping interface of a
+    DictObject, so ``record['creation-time']`` and
+    ``record.creation_time`` both work.  JSON keys that are not in FIELDS
+    are kept in a (rarely used) extra dict.
+    """
+    __metaclass__ = RecordType
+    __slots__ = ('server', '_extra')
+    FIELDS = ()
+    _slots = {}
+
+    def __init__(self, server, data=None):
+        self.server = server
+        self._extra = None
+        if data is None:
+            return
+        slots = self._slots
+        for key, value in data.iteritems():
+            if key in slots:
+                setattr(self, slots[key], value)
+            else:
+                if self._extra is None:
+                    self._extra = {}
+                self._extra[key] = value
+
+    def __getattr__(self, name):
+        # only called for unset slots and names which are not slots.
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if name == 'unique_id':
+            return self['id']
+        if self._extra is not None:
+            key = translate_to_json_key(name)
+            if key in self._extra:
+                return self._extra[key]
+        fmt = "object '{0}' has no property '{1}'"
+        raise AttributeError(fmt.format(type(self).__name__, name))
+
+    def __getitem__(self, key):
+        slot = self._slots.get(key)
+        if slot is not None:
+            try:
+                return getattr(self, slot)
+            except AttributeError:
+                raise KeyError(key)
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, (dict, Record)):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def get(self, key, default=None):
+        """D.get(k[,d]) -> D[k] if k in D, else d."""
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        """Return a list of the JSON keys that are set."""
+        keys = [key for key in self.FIELDS if key in self]
+        if self._extra is not None:
+            keys.extend(self._extra)
+        return keys
+
+    def values(self):
+        """Return a list of the values."""
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        """Return a list of (key, value) pairs."""
+        return [(key, self[key]) for key in self.keys()]
+
+    def iteritems(self):
+        """Iterate over the (key, value) pairs."""
+        return iter(self.items())
 
     @classmethod
     def from_json(cls, server, data):
@@ -67,6 +258,38 @@ class JsonKeys(object):
     BACKUPS = 'backups'
 
 
+class States(object):
+    """Environment states reported by the 'state' endpoint."""
+    RUNNING = 'RUNNING'
+    DEGRADED = 'DEGRADED'
+    STOPPED = 'STOPPED'
+
+# states in which the environment is not in transition
+RUNNING_STATES = (States.RUNNING, States.DEGRADED)
+SETTLED_STATES = RUNNING_STATES + (States.STOPPED,)
+
+
+class Backoff(object):
+    """An adaptive polling interval: grows geometrically from `initial` up
+    to `maximum` and drops back to `initial` when reset()."""
+
+    def __init__(self, initial=1.0, maximum=30.0, factor=1.5):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.interval = initial
+
+    def next(self):
+        """Return the current interval and grow it for next time."""
+        interval = self.interval
+        self.interval = min(self.interval * self.factor, self.maximum)
+        return interval
+
+    def reset(self):
+        """Return to the initial interval (e.g. when activity is seen)."""
+        self.interval = self.initial
+
+
 def status_ok(data):
     """Check if the server responded with 'status: OK' in the JSON data.
     """
@@ -103,3 +326,18 @@ def translate_to_variable_name(key):
 def translate_to_json_key(key):
     """Convert a variable name to a 'pretty' JSON key."""
     return key.replace('_', '-')
+
+def parse_time(value):
+    """Convert a 'creation-time' (ISO 8601, UTC) to seconds since the
+    epoch.  Returns None if `value` cannot be parsed."""
+    if not value:
+        return None
+    try:
+        seconds = calendar.timegm(time.strptime(value[:19],
+                                                '%Y-%m-%dT%H:%M:%S'))
+    except ValueError:
+        return None
+    fraction = value[19:].rstrip('Z')
+    if fraction.startswith('.') and fraction[1:].isdigit():
+        seconds += float(fraction)
+    return seconds
@@ -0,0 +1,185 @@
+""" Handles for asynchronous 'manage' actions.
+
+Asynchronous actions (``sync=False``) return a :class:`Job` that completes
+once the server settles into a state that ends the action.  A single
+background poller checks every outstanding job, polling each server with
+an adaptive interval, so any number of jobs may be outstanding at once.
+
+>>> job = server.backup(sync=False)
+>>> ...
+>>> backup = job.result(timeout=3600)
+"""
+import time
+import heapq
+import threading
+
+from . import logger
+from .error import PaletteError
+from .executor import Future, default_pool
+from .internal import Backoff
+
+# polling intervals (seconds) for outstanding jobs
+POLL_INITIAL = 1.0
+POLL_MAXIMUM = 30.0
+POLL_FACTOR = 1.5
+
+class Job(Future): # pylint: disable=too-many-instance-attributes
+    """ A running 'manage' action on a Palette server.
+
+    Jobs are :class:`Future <palette.executor.Future>` instances: use
+    ``done()``, ``wait(timeout)``, ``result(timeout)`` or
+    ``add_done_callback(func)``.  A job cannot be cancelled because the
+    action is already running on the server.
+
+    The server may acknowledge an asynchronous request before it enters
+    the action's transitional state, so a settled state is only taken as
+    the outcome once the action has been seen in progress.  The exceptions
+    are a `result` function that returns a value (e.g. the new backup) and
+    `instant` actions, which may end in one of `ok_states` without ever
+    being seen in progress (e.g. stopping a stopped server): those complete
+    from the first poll on.  A job whose `result` function still returns
+    None after the action was seen in progress fails.
+
+    :ivar server: the PaletteServer instance
+    :ivar action: the action name e.g. 'backup'
+    :ivar state: the last observed state of the environment (or None)
+    :ivar started: when the action was requested (seconds since the epoch)
+    :ivar active: whether or not a transitional state has been observed
+    :ivar instant: whether or not the action may complete unobserved
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, server, action, done_states, ok_states=None,
+                 result=None, instant=False):
+        super(Job, self).__init__()
+        self.server = server
+        self.action = action
+        self.done_states = frozenset(done_states)
+        if ok_states is None:
+            ok_states = done_states
+        self.ok_states = frozenset(ok_states)
+        self.result_func = result
+        self.instant = instant
+        self.state = None
+        self.started = time.time()
+        self.active = False
+        self.backoff = Backoff(POLL_INITIAL, POLL_MAXIMUM, POLL_FACTOR)
+        self.set_running_or_notify_cancel()
+
+    def __repr__(self):
+        return '<Job {0} {1} state={2}>'.format(self.server.url, self.action,
+                                                self.state)
+
+    def poll(self):
+        """Check the server state once and complete the job if it is done.
+
+        :returns: bool -- whether or not the job is done.
+        """
+        if self.done():
+            return True
+        try:
+            state = self.server.state
+            if state != self.state:
+                # activity: check again soon
+                self.backoff.reset()
+                self.state = state
+            if state not in self.done_states:
+                self.active = True
+                return False
+            if not self.active and not self._may_be_done(state):
+                # the action has not started yet
+                return False
+            if state not in self.ok_states:
+                fmt = "'{0}' failed, the environment is {1}"
+                raise PaletteError(fmt.format(self.action, state))
+            result = True
+            if self.result_func is not None:
+                result = self.result_func(self.server)
+                if result is None:
+                    if not self.active:
+                        # the action has not started yet
+                        return False
+                    fmt = "'{0}' completed without a result"
+                    raise PaletteError(fmt.format(self.action))
+        except Exception as ex: # pylint: disable=broad-except
+            self.set_exception(ex)
+            logger.info("Job '%s' failed on '%s': %s",
+                        self.action, self.server.url, ex)
+            return True
+        self.set_result(result)
+        logger.info("Job '%s' completed on '%s'",
+                    self.action, self.server.url)
+        return True
+
+    def _may_be_done(self, state):
+        """Whether or not `state` may be the outcome of an action that has
+        not been seen in progress."""
+        if state not in self.ok_states:
+            return False
+        if self.result_func is not None:
+            return True # decided by the result
+        return self.instant and time.time() - self.started >= POLL_INITIAL
+
+
+class JobPoller(object):
+    """ Poll outstanding jobs from one scheduling thread.
+
+    The poller only schedules: the requests themselves are performed by
+    the worker pool so a slow server does not delay the other jobs.
+    """
+
+    def __init__(self, pool=None):
+        self.pool = pool
+        self._condition = threading.Condition()
+        self._heap = []
+        self._thread = None
+
+    def add(self, job):
+        """Start polling `job` until it is done."""
+        self._schedule(job, job.backoff.next())
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _schedule(self, job, delay):
+        with self._condition:
+            heapq.heappush(self._heap, (time.time() + delay, id(job), job))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name='palette-job-poller')
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self):
+        pool = self.pool or default_pool('poll')
+        while True:
+            with self._condition:
+                while not self._heap or self._heap[0][0] > time.time():
+                    if self._heap:
+                        self._condition.wait(
+                            max(0, self._heap[0][0] - time.time()))
+                        continue
+                    # exit when idle, add() starts a new thread as needed.
+                    self._condition.wait(POLL_MAXIMUM)
+                    if not self._heap:
+                        self._thread = None
+                        return
+                _, _, job = heapq.heappop(self._heap)
+            pool.submit(self._poll, job)
+
+    def _poll(self, job):
+        if not job.poll():
+            self._schedule(job, job.backoff.next())
+
+
+_DEFAULT_POLLER = None
+_DEFAULT_POLLER_LOCK = threading.Lock()
+
+def default_poller():
+    """Return the process-wide JobPoller."""
+    global _DEFAULT_POLLER # pylint: disable=global-statement
+    with _DEFAULT_POLLER_LOCK:
+        if _DEFAULT_POLLER is None:
+            _DEFAULT_POLLER = JobPoller()
+        return _DEFAULT_POLLER
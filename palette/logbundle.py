@@ -0,0 +1,359 @@
+""" Log bundles created by ``server.ziplogs()``.
+
+A :class:`LogBundle` describes the zip archive of the Tableau Server logs.
+The archive may be copied to disk or read member by member without
+extracting it:
+
+>>> bundle = server.ziplogs()
+>>> bundle.download('/var/tmp/logs.zip', workers=4)
+>>> for member in bundle.members():
+...     for line in member:
+...         if 'ERROR' in line:
+...             print member.name, line,
+
+The archive is streamed from its storage (see :mod:`palette.storage`) and
+each member is decompressed as it is read, so memory use depends neither
+on the size of the bundle nor on the size of its members.
+"""
+from __future__ import absolute_import
+
+import zlib
+import struct
+
+from . import storage
+from .error import PaletteError, PaletteChecksumError
+from .internal import API_PATH_INFO, DictObject
+
+# the number of (decompressed) bytes produced at once
+CHUNK_SIZE = 64 * 1024
+
+LOCAL_HEADER = 'PK\x03\x04'
+DATA_DESCRIPTOR = 'PK\x07\x08'
+# the records following the last member
+ARCHIVE_TRAILERS = ('PK\x01\x02', 'PK\x05\x06', 'PK\x06\x06', 'PK\x06\x07')
+
+# compression methods
+STORED = 0
+DEFLATED = 8
+
+# general purpose flags
+FLAG_ENCRYPTED = 0x1
+FLAG_DATA_DESCRIPTOR = 0x8
+FLAG_UTF8 = 0x800
+
+ZIP64_EXTRA = 0x0001
+ZIP64_LIMIT = 0xffffffff
+
+class _Stream(object):
+    """Read a byte stream given as an iterator of chunks."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = ''
+        self._offset = 0
+
+    def read(self, count):
+        """Return up to `count` bytes (fewer only at the end)."""
+        parts = []
+        while count > 0:
+            if self._offset >= len(self._buffer):
+                self._buffer = next(self._chunks, '')
+                self._offset = 0
+                if not self._buffer:
+                    break
+            part = self._buffer[self._offset:self._offset + count]
+            self._offset += len(part)
+            count -= len(part)
+            parts.append(part)
+        return ''.join(parts)
+
+    def read_exactly(self, count):
+        """Return `count` bytes.
+
+        :raises: PaletteError if the stream ends first.
+        """
+        data = self.read(count)
+        if len(data) != count:
+            raise PaletteError('Truncated zip archive')
+        return data
+
+    def skip(self, count):
+        """Discard `count` bytes."""
+        while count > 0:
+            data = self.read(min(count, storage.CHUNK_SIZE))
+            if not data:
+                raise PaletteError('Truncated zip archive')
+            count -= len(data)
+
+    def unread(self, data):
+        """Push back `data`, which was read too far."""
+        self._buffer = data + self._buffer[self._offset:]
+        self._offset = 0
+
+
+def _zip64_sizes(extra, compressed_size, size):
+    """Return the sizes of a member, replacing the 32-bit placeholders by
+    the values of the ZIP64 extra field."""
+    while len(extra) >= 4:
+        tag, length = struct.unpack('<HH', extra[:4])
+        if tag == ZIP64_EXTRA:
+            values = list(struct.unpack('<{0}Q'.format(length // 8),
+                                        extra[4:4 + length // 8 * 8]))
+            if size == ZIP64_LIMIT and values:
+                size = values.pop(0)
+            if compressed_size == ZIP64_LIMIT and values:
+                compressed_size = values.pop(0)
+            return compressed_size, size, True
+        extra = extra[4 + length:]
+    return compressed_size, size, False
+
+
+class LogMember(object):
+    """ A file of a log bundle, decompressed as it is read.
+
+    Iterating over a member yields its lines.  The data of a member is
+    only available until the next member of the bundle is requested.
+
+    :ivar name: the path of the file in the archive
+    :ivar size: the size in bytes (None if the archive does not record it
+      before the data)
+    :ivar compressed_size: the size in the archive (None if unknown)
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, stream, header, name, extra):
+        (_, flags, self.method, _, _, self.crc, compressed_size, size,
+         _, _) = header
+        if flags & FLAG_ENCRYPTED:
+            raise PaletteError("'{0}' is encrypted".format(name))
+        if self.method not in (STORED, DEFLATED):
+            fmt = "'{0}' uses the unsupported compression method {1}"
+            raise PaletteError(fmt.format(name, self.method))
+        self.name = name
+        compressed_size, size, self._zip64 = _zip64_sizes(
+            extra, compressed_size, size)
+        self._descriptor = bool(flags & FLAG_DATA_DESCRIPTOR)
+        if self._descriptor:
+            if self.method == STORED:
+                fmt = "'{0}' has no size and cannot be streamed"
+                raise PaletteError(fmt.format(name))
+            compressed_size = size = None
+        self.size = size
+        self.compressed_size = compressed_size
+        self._stream = stream
+        self._data = _Stream(self._decompress())
+        self._started = False
+        self._done = False
+
+    def __repr__(self):
+        return "<LogMember '{0}' {1} bytes>".format(self.name, self.size)
+
+    def read(self, count=-1):
+        """Return up to `count` decompressed bytes ('' at the end), or the
+        rest of the file if `count` is negative."""
+        if count is None or count < 0:
+            parts = []
+            while True:
+                data = self._data.read(CHUNK_SIZE)
+                if not data:
+                    return ''.join(parts)
+                parts.append(data)
+        return self._data.read(count)
+
+    def __iter__(self):
+        tail = ''
+        while True:
+            chunk = self.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            data = tail + chunk
+            start = 0
+            while True:
+                end = data.find('\n', start)
+                if end < 0:
+                    break
+                yield data[start:end + 1]
+                start = end + 1
+            tail = data[start:]
+        if tail:
+            yield tail
+
+    def close(self):
+        """Skip the rest of the member (without decompressing it if its
+        size is known)."""
+        if self._done:
+            return
+        if not self._started and self.compressed_size is not None:
+            self._stream.skip(self.compressed_size)
+            self._data = _Stream(())
+            self._done = True
+            return
+        while self._data.read(CHUNK_SIZE):
+            pass
+
+    def _decompress(self):
+        """Generate the decompressed data, checking its CRC-32."""
+        self._started = True
+        crc = 0
+        if self.method == STORED:
+            chunks = self._compressed()
+        else:
+            chunks = self._inflate()
+        for chunk in chunks:
+            crc = zlib.crc32(chunk, crc)
+            yield chunk
+        if self._descriptor:
+            self._read_descriptor()
+        self._done = True
+        if crc & 0xffffffff != self.crc:
+            raise PaletteChecksumError(self.name, '{0:08x}'.format(self.crc),
+                                       '{0:08x}'.format(crc & 0xffffffff))
+
+    def _compressed(self):
+        """Generate the data of the member as stored in the archive (only
+        if its size is known)."""
+        remaining = self.compressed_size
+        while remaining:
+            data = self._stream.read_exactly(min(remaining,
+                                                 storage.CHUNK_SIZE))
+            remaining -= len(data)
+            yield data
+
+    def _inflate(self):
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        if self._descriptor:
+            # the end of the deflate stream is the end of the member
+            chunks = iter(lambda: self._stream.read(storage.CHUNK_SIZE), '')
+        else:
+            chunks = self._compressed()
+        for chunk in chunks:
+            # bounded output: log files compress very well
+            data = decompressor.decompress(chunk, CHUNK_SIZE)
+            while data:
+                yield data
+                data = decompressor.decompress(decompressor.unconsumed_tail,
+                                               CHUNK_SIZE)
+            if decompressor.unused_data:
+                self._stream.unread(decompressor.unused_data)
+                break
+        else:
+            if self._descriptor:
+                raise PaletteError('Truncated zip archive')
+        data = decompressor.flush()
+        if data:
+            yield data
+
+    def _read_descriptor(self):
+        """Read the CRC-32 and sizes following the data."""
+        data = self._stream.read_exactly(4)
+        if data == DATA_DESCRIPTOR:
+            data = self._stream.read_exactly(4)
+        self.crc = struct.unpack('<I', data)[0]
+        if self._zip64:
+            self.compressed_size, self.size = struct.unpack(
+                '<QQ', self._stream.read_exactly(16))
+        else:
+            self.compressed_size, self.size = struct.unpack(
+                '<II', self._stream.read_exactly(8))
+
+
+def iter_members(chunks):
+    """ Iterate over the files of a zip archive given as an iterator of
+    chunks (e.g. as read from storage), without seeking.
+
+    Each :class:`LogMember` must be read before requesting the next one;
+    whatever remains of it is skipped.  Directories are skipped.
+
+    :raises: PaletteError, PaletteChecksumError
+    """
+    stream = _Stream(chunks)
+    while True:
+        signature = stream.read(4)
+        if not signature or signature in ARCHIVE_TRAILERS:
+            return
+        if signature != LOCAL_HEADER:
+            raise PaletteError('Invalid zip archive')
+        header = struct.unpack('<HHHHHIIIHH', stream.read_exactly(26))
+        name = stream.read_exactly(header[8])
+        extra = stream.read_exactly(header[9])
+        name = name.decode('utf-8' if header[1] & FLAG_UTF8 else 'cp437')
+        member = LogMember(stream, header, name, extra)
+        if not name.endswith('/'):
+            yield member
+        member.close()
+
+
+class LogBundle(DictObject):
+    """ A zip archive of the Tableau Server logs.
+
+    Returned by :meth:`PaletteServer.ziplogs
+    <palette.PaletteServer.ziplogs>`; previous bundles are available via
+    ``server.LogBundle.list_all()``.  Like a Backup, a bundle has the
+    properties `id`, `url`, `size` and `creation_time`.
+    """
+
+    MAX_LIMIT = 100
+    PATH_INFO = API_PATH_INFO + '/logs'
+
+    @classmethod
+    def get(cls, server, bundle_id):
+        """ Return information about a log bundle by unique id.
+
+        :param server: The server instance
+        :type server: PaletteServer
+        :param bundle_id: the unique identifier of a log bundle.
+        :type bundle_id: int
+        :rtype: LogBundle instance
+        :raises: HTTPError
+        """
+        path_info = cls.PATH_INFO + '/' + str(bundle_id)
+        return cls.from_json(server, server.get(path_info, required=('id')))
+
+    @classmethod
+    def list_all(cls, server, limit=7):
+        """ Return the most recent log bundles (newest first).
+
+        :param server: The server instance
+        :type server: PaletteServer
+        :param limit: the maximum number of log bundles returned (max=100).
+        :type limit: int
+        :rtype: list of LogBundle instances
+        :raises: ValueError, HTTPError
+        """
+        if limit > cls.MAX_LIMIT:
+            fmt = "The value of 'limit' must be less than or equal to {0}'"
+            raise ValueError(fmt.format(cls.MAX_LIMIT))
+        json = server.get(cls.PATH_INFO, params={'limit': int(limit)},
+                          required=('logs'))
+        return [cls.from_json(server, obj) for obj in json['logs']]
+
+    def download(self, path, **kwargs):
+        """ Download the archive to the local `path`.
+
+        Keyword arguments (e.g. `workers`, `resume`, `digest` or
+        `progress`) are passed to :func:`palette.storage.download`.
+
+        :returns: a :class:`TransferResult <palette.storage.TransferResult>`
+        :raises: PaletteChecksumError, PaletteError, ValueError, IOError
+        """
+        kwargs.setdefault('size', dict.get(self, 'size'))
+        return storage.download(self['url'], path, **kwargs)
+
+    def iter_content(self, chunk_size=storage.CHUNK_SIZE):
+        """Iterate over the bytes of the archive in chunks, as read from
+        its storage."""
+        backend = storage.get_backend(self['url'])
+        size = dict.get(self, 'size')
+        if size is None:
+            size = backend.size(self['url'])
+        return backend.read(self['url'], 0, size, chunk_size=chunk_size)
+
+    def members(self):
+        """ Iterate over the files of the archive, streaming it from storage
+        and decompressing each file as it is read (see
+        :func:`iter_members`).
+
+        :returns: generator of :class:`LogMember` instances
+        :raises: PaletteError, PaletteChecksumError
+        """
+        return iter_members(self.iter_content())
@@ -0,0 +1,108 @@
+""" Streamed multipart/form-data request bodies.
+
+A :class:`MultipartUpload` is a file-like object producing the encoded
+form on demand, so a file of any size is sent with constant memory use.
+Its length is known in advance so the request has a Content-Length
+(rather than chunked transfer encoding).
+"""
+import os
+import binascii
+
+# the maximum number of bytes returned by one read()
+CHUNK_SIZE = 64 * 1024
+
+class MultipartUpload(object):
+    """ A multipart/form-data body with form `fields` and one file.
+
+    :param fields: the form fields (name -> value)
+    :type fields: dict
+    :param name: the form field name of the file
+    :type name: str
+    :param fileobj: the file to upload (opened in binary mode)
+    :param filename: the file name sent to the server
+    :type filename: str
+    :param size: the number of bytes to read from `fileobj` (default:
+      the rest of the file)
+    :type size: int
+    :param progress: called with (bytes sent, total bytes) of the file
+    """
+    # pylint: disable=too-many-arguments,too-many-instance-attributes
+
+    def __init__(self, fields, name, fileobj, filename, size=None,
+                 progress=None):
+        # (not uuid: importing it loads ctypes, slowing down startup)
+        self.boundary = binascii.hexlify(os.urandom(16))
+        self.fileobj = fileobj
+        self.filename = filename
+        if size is None:
+            size = _remaining(fileobj)
+        self.size = size
+        self.progress = progress
+        self.sent = 0
+        head = []
+        for key, value in sorted(fields.iteritems()):
+            head.append(self._part_header(
+                'form-data; name="{0}"'.format(key)))
+            head.append(_encode(value) + '\r\n')
+        head.append(self._part_header(
+            'form-data; name="{0}"; filename="{1}"'.format(
+                name, filename.replace('"', '')),
+            'Content-Type: application/octet-stream\r\n'))
+        self._head = ''.join(head)
+        self._tail = '\r\n--{0}--\r\n'.format(self.boundary)
+        self._buffer = self._head
+        self._stage = 0 # 0: head, 1: file, 2: tail, 3: done
+
+    def __repr__(self):
+        fmt = "<MultipartUpload '{0}' {1} bytes>"
+        return fmt.format(self.filename, self.size)
+
+    def __len__(self):
+        return len(self._head) + self.size + len(self._tail)
+
+    @property
+    def content_type(self):
+        """The Content-Type header value of the request."""
+        return 'multipart/form-data; boundary=' + self.boundary
+
+    def _part_header(self, disposition, extra=''):
+        return '--{0}\r\nContent-Disposition: {1}\r\n{2}\r\n'.format(
+            self.boundary, disposition, extra)
+
+    def read(self, count=-1):
+        """Return up to `count` bytes of the body ('' at the end)."""
+        if count is None or count < 0:
+            count = CHUNK_SIZE
+        while not self._buffer and self._stage < 3:
+            if self._stage == 1:
+                chunk = self.fileobj.read(min(count, CHUNK_SIZE,
+                                              self.size - self.sent))
+                if chunk:
+                    self.sent += len(chunk)
+                    if self.progress is not None:
+                        self.progress(self.sent, self.size)
+                    return chunk
+                if self.sent != self.size:
+                    raise IOError("'{0}' is shorter than {1} bytes".format(
+                        self.filename, self.size))
+                self._buffer = self._tail
+            self._stage += 1
+        result, self._buffer = self._buffer[:count], self._buffer[count:]
+        return result
+
+
+def _encode(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+def _remaining(fileobj):
+    """Return the number of bytes from the position to the end of file."""
+    try:
+        return os.fstat(fileobj.fileno()).st_size - fileobj.tell()
+    except (AttributeError, IOError, OSError):
+        position = fileobj.tell()
+        fileobj.seek(0, os.SEEK_END)
+        size = fileobj.tell() - position
+        fileobj.seek(position)
+        return size
@@ -0,0 +1,63 @@
+""" Lazy rendering of request and response payloads for debug logging.
+
+Payloads are wrapped in a :class:`Payload` and passed to the logger as an
+argument so sanitizing and formatting only happen if the record is
+actually emitted.  Long lists are summarized and the result is truncated
+to `LIMIT` characters:
+
+>>> palette.payload.LIMIT = 4096  # or None for no limit
+"""
+import re
+
+# the maximum number of characters of a logged payload (None = no limit)
+LIMIT = 1024
+
+# the number of items of a list shown before it is summarized
+LIST_ITEMS = 3
+
+def sanitize(data):
+    """Return a string representation of the data with passwords removed."""
+    data = data.copy()
+    for key in data:
+        if 'password' in key.lower():
+            data[key] = re.sub('.', '*', data[key])
+    return str(data)
+
+def summarize(data, items=LIST_ITEMS):
+    """Return a copy of the JSON data with long lists shortened."""
+    if isinstance(data, dict):
+        return dict((key, summarize(value, items))
+                    for key, value in data.iteritems())
+    if isinstance(data, list) and len(data) > items:
+        result = [summarize(value, items) for value in data[:items]]
+        result.append('... {0} more'.format(len(data) - items))
+        return result
+    return data
+
+def truncate(text, limit=None):
+    """Truncate `text` to `limit` characters (default: LIMIT)."""
+    if limit is None:
+        limit = LIMIT
+    if limit is None or len(text) <= limit:
+        return text
+    return '{0}... ({1} more characters)'.format(text[:limit],
+                                                 len(text) - limit)
+
+
+class Payload(object):
+    """ A logging argument rendering `data` when the record is formatted.
+
+    :param data: the payload (usually a dict)
+    :param secret: remove passwords before rendering
+    :type secret: bool
+    """
+    __slots__ = ('data', 'secret')
+
+    def __init__(self, data, secret=False):
+        self.data = data
+        self.secret = secret
+
+    def __str__(self):
+        if self.secret and isinstance(self.data, dict):
+            return truncate(sanitize(self.data))
+        return truncate(str(summarize(self.data)))
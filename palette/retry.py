@@ -0,0 +1,226 @@
+""" Retry policies and circuit breakers for transient failures.
+
+Each PaletteServer retries idempotent requests that fail with a connection
+error or a 502, 503 or 504 response, waiting an exponentially increasing,
+randomized (jittered) delay between attempts.  A per-server
+:class:`CircuitBreaker` stops sending requests to a server after repeated
+failures and fails fast with
+:class:`PaletteCircuitOpenError <palette.error.PaletteCircuitOpenError>`
+until the server has had time to recover.
+
+>>> server = palette.connect(URL, retry=RetryPolicy(total=5))
+>>> server.circuit.state
+'closed'
+"""
+from __future__ import absolute_import
+
+import time
+import random
+import threading
+
+import requests
+
+from .error import PaletteCircuitOpenError
+
+class RetryPolicy(object):
+    """ When and how long to wait before retrying a request.
+
+    :param total: the maximum number of retries (0 = never retry)
+    :type total: int
+    :param backoff: the maximum delay before the first retry (seconds)
+    :type backoff: float
+    :param maximum: the maximum delay between attempts (seconds)
+    :type maximum: float
+    :param factor: the growth of the delay with each attempt
+    :type factor: float
+    :param jitter: randomize the delay ("full jitter") so many clients do
+      not retry in lock step
+    :type jitter: bool
+    :param status: the response status codes that are retried
+    :type status: tuple
+    :param methods: the HTTP methods that are safe to repeat
+    :type methods: tuple
+    :param allow_post: also retry POST (e.g. 'manage') requests after errors
+      that may have reached the server.
+    :type allow_post: bool
+    """
+    # pylint: disable=too-many-arguments,too-many-instance-attributes
+
+    IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+    RETRY_STATUS = (502, 503, 504)
+
+    def __init__(self, total=3, backoff=0.5, maximum=10.0, factor=2.0,
+                 jitter=True, status=RETRY_STATUS, methods=IDEMPOTENT_METHODS,
+                 allow_post=False):
+        self.total = total
+        self.backoff = backoff
+        self.maximum = maximum
+        self.factor = factor
+        self.jitter = jitter
+        self.status = frozenset(status)
+        self.methods = frozenset(methods)
+        self.allow_post = allow_post
+
+    def __repr__(self):
+        return '<RetryPolicy total={0}>'.format(self.total)
+
+    def idempotent(self, method):
+        """Return True if requests with `method` may be repeated."""
+        return method in self.methods or (self.allow_post and method == 'POST')
+
+    def should_retry(self, method, attempt, status=None, error=None,
+                     idempotent=None):
+        """ Decide whether a failed attempt is retried.
+
+        :param method: the HTTP method of the request
+        :param attempt: the number of retries already made
+        :param status: the response status code (if there was a response)
+        :param error: the exception raised (if there was no response)
+        :param idempotent: overrides the method-based idempotency check
+        :returns: bool
+        """
+        if attempt >= self.total:
+            return False
+        if idempotent is None:
+            idempotent = self.idempotent(method)
+        if error is not None:
+            if isinstance(error, requests.exceptions.ConnectTimeout):
+                # the request never reached the server
+                return True
+            return idempotent and isinstance(
+                error, (requests.ConnectionError, requests.Timeout))
+        return idempotent and status in self.status
+
+    def delay(self, attempt, response=None):
+        """Return the number of seconds to wait before retry `attempt`
+        (0 for the first retry).  A Retry-After header is honored."""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), self.maximum)
+        delay = min(self.maximum, self.backoff * self.factor ** attempt)
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+
+class CircuitStates(object):
+    """The states of a CircuitBreaker."""
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker(object):
+    """ Fail fast while a server is unhealthy.
+
+    After `threshold` consecutive failures (connection errors, timeouts or
+    502, 503 and 504 responses) the circuit opens and requests are
+    rejected for `reset_timeout` seconds.  The next request is then let
+    through as a trial: success closes the circuit, failure opens it
+    again.  Any other response (e.g. a 500 for a bad request) shows that
+    the server is up and counts as a success.
+
+    :param threshold: consecutive failures that open the circuit
+    :type threshold: int
+    :param reset_timeout: seconds the circuit stays open
+    :type reset_timeout: float
+    :param status: the response status codes counted as failures
+    :type status: tuple
+
+    :ivar failures: the total number of failures
+    :ivar successes: the total number of successes
+    :ivar rejected: the number of requests rejected while open
+    :ivar opened: the number of times the circuit opened
+    :ivar consecutive_failures: failures since the last success
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    FAILURE_STATUS = (502, 503, 504)
+
+    def __init__(self, threshold=5, reset_timeout=30.0,
+                 status=FAILURE_STATUS):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.status = frozenset(status)
+        self.failures = 0
+        self.successes = 0
+        self.rejected = 0
+        self.opened = 0
+        self.consecutive_failures = 0
+        self._opened_at = None
+        self._trial = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<CircuitBreaker {0} failures={1}>'.format(
+            self.state, self.consecutive_failures)
+
+    @property
+    def state(self):
+        """One of the CircuitStates values."""
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return CircuitStates.CLOSED
+        # a trial request is outstanding until it completes (or times out)
+        since = max(self._opened_at, self._trial or 0)
+        if time.time() - since < self.reset_timeout:
+            return CircuitStates.OPEN
+        return CircuitStates.HALF_OPEN
+
+    def counters(self):
+        """Return the state and counters as a dict."""
+        with self._lock:
+            return {'state': self._state(),
+                    'failures': self.failures,
+                    'successes': self.successes,
+                    'rejected': self.rejected,
+                    'opened': self.opened,
+                    'consecutive_failures': self.consecutive_failures}
+
+    def allow(self, url=None):
+        """Check that a request may be sent.
+
+        :raises: PaletteCircuitOpenError
+        """
+        with self._lock:
+            state = self._state()
+            if state == CircuitStates.CLOSED:
+                return
+            if state == CircuitStates.HALF_OPEN:
+                self._trial = time.time()
+                return
+            self.rejected += 1
+            since = max(self._opened_at, self._trial or 0)
+            retry_in = since + self.reset_timeout - time.time()
+        raise PaletteCircuitOpenError(url, max(0.0, retry_in))
+
+    def record_success(self):
+        """Record a successful request (closes the circuit)."""
+        with self._lock:
+            self.successes += 1
+            self.consecutive_failures = 0
+            self._opened_at = None
+            self._trial = None
+
+    def record_failure(self):
+        """Record a failed request (may open the circuit)."""
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            if self._trial or (self._opened_at is None and
+                               self.consecutive_failures >= self.threshold):
+                self.opened += 1
+                self._opened_at = time.time()
+                self._trial = None
+
+    def reset(self):
+        """Close the circuit and clear the counters."""
+        with self._lock:
+            self.failures = self.successes = self.rejected = self.opened = 0
+            self.consecutive_failures = 0
+            self._opened_at = None
+            self._trial = None
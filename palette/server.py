@@ -1,16 +1,30 @@
 """Server classes for Palette"""
-import re
+import os
+import time
+import logging
 import urlparse
+import threading
 import ConfigParser as configparser
 import requests
 
 from urllib import urlencode
+from requests.adapters import HTTPAdapter, DEFAULT_POOLSIZE
 
-from .config import PARSER, SECTION_CREDENTIALS
+from .config import SECTION_CREDENTIALS, parser
 from .error import PaletteAuthenticationError, PaletteInternalError
+from .error import PaletteError
 
 from . import logger
 from .internal import ApiObject, JsonKeys, API_PATH_INFO, raise_for_json
+from .internal import register_resource # pylint: disable=unused-import
+from .internal import States, RUNNING_STATES, SETTLED_STATES
+from .job import Job, default_poller
+from .trace import Span, LatencyStats
+from .retry import RetryPolicy, CircuitBreaker
+from . import decoder
+from .multipart import MultipartUpload
+from .batch import Batch, active_batch
+from .payload import Payload, sanitize # pylint: disable=unused-import
 
 class ManageActions(object):
     """Allowable actions for the 'manage' endpoint."""
@@ -18,6 +32,7 @@ class ManageActions(object):
     STOP = 'stop'
     RESTART = 'restart'
     BACKUP = 'backup'
+    RESTORE = 'restore'
     REPAIR_LICENSE = 'repair-license'
     ZIPLOGS = 'ziplogs'
 
@@ -40,15 +55,8 @@ def display_url(url, params=None):
         return url + '?' + urlencode(params)
     return url
 
-def sanitize(data):
-    """Return a string representation of the data with passwords removed."""
-    data = data.copy()
-    for key in data:
-        if 'password' in key.lower():
-            data[key] = re.sub('.', '*', data[key])
-    return str(data)
-
 class PaletteServer(object):
+    # pylint: disable=too-many-instance-attributes,too-many-public-methods
     """An interface to a particular Palette Server. The values
     passed to the constructor override any corresponding values in ~/.palette.
 
@@ -56,7 +64,47 @@ class PaletteServer(object):
     :type username: str
     :param password: The password for `username`
     :type password: str
+    :param pool_connections: The number of per-host connection pools to cache
+    :type pool_connections: int
+    :param pool_maxsize: The maximum number of keep-alive connections per host
+    :type pool_maxsize: int
+    :param pool_block: Whether to block when no free connection is available
+    :type pool_block: bool
+    :param timeout: Seconds to wait for the server on each request
+      (None = wait forever)
+    :type timeout: float
+    :param system_ttl: Seconds that the cached system table (``system``)
+      is used before being revalidated (None = forever)
+    :type system_ttl: float
+    :param ticket_cache: Share authentication tickets through an on-disk
+      :class:`TicketCache <palette.ticket.TicketCache>` (or its path, or
+      True for the default path)
+    :type ticket_cache: TicketCache
+    :param retry: The retry policy for transient failures (default:
+      :class:`RetryPolicy() <palette.retry.RetryPolicy>`, False = never
+      retry)
+    :type retry: RetryPolicy
+    :param circuit_breaker: The circuit breaker of this server (default:
+      :class:`CircuitBreaker() <palette.retry.CircuitBreaker>`,
+      False = none)
+    :type circuit_breaker: CircuitBreaker
     :raises: ValueError
+
+    A request rejected with 401 or 403 (e.g. because the ticket expired)
+    is retried once after authenticating again.  Idempotent requests
+    failing with a connection error or a 502, 503 or 504 response are
+    retried according to `retry`; while `circuit` is open, requests fail
+    immediately with PaletteCircuitOpenError.
+
+    Every request emits a :class:`Span <palette.trace.Span>` to the hooks
+    registered with :meth:`add_hook` and the latency of each endpoint is
+    available from :meth:`stats`.
+
+    Connections are kept alive and reused between requests.  The instance
+    may be used as a context manager to release them when done:
+
+    >>> with palette.connect(URL) as server:
+    ...     print server.state
     """
     LOGIN_PATH_INFO = '/login/authenticate'
     STATE_PATH_INFO = API_PATH_INFO + '/state'
@@ -64,36 +112,143 @@ class PaletteServer(object):
 
     COOKIE_AUTH_TKT = 'auth_tkt'
 
-    def __init__(self, url, username=None, password=None, security_token=None):
+    # responses that cause authentication and a retry
+    REAUTH_STATUS = (401, 403)
+
+    DEFAULT_SYSTEM_TTL = 60
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, url, username=None, password=None, security_token=None,
+                 pool_connections=DEFAULT_POOLSIZE,
+                 pool_maxsize=DEFAULT_POOLSIZE, pool_block=False,
+                 timeout=None, system_ttl=DEFAULT_SYSTEM_TTL,
+                 ticket_cache=None, retry=None, circuit_breaker=None):
         """Initialize the instance with the given parameters."""
+        # pylint: disable=too-many-locals
         self.url = check_url(url)
         if username is None:
             try:
-                self.username = PARSER.get(SECTION_CREDENTIALS, 'username')
+                self.username = parser().get(SECTION_CREDENTIALS, 'username')
             except configparser.Error:
                 raise ValueError("'username' is required.")
         else:
             self.username = username
         if password is None:
             try:
-                self.password = PARSER.get(SECTION_CREDENTIALS, 'password')
+                self.password = parser().get(SECTION_CREDENTIALS, 'password')
             except configparser.Error:
                 raise ValueError("'password' is required.")
         else:
             self.password = password
         self.security_token = security_token
-        self.auth_tkt = None
+        self.timeout = timeout
+        self.system_ttl = system_ttl
+        if ticket_cache is True or isinstance(ticket_cache, basestring):
+            from .ticket import TicketCache
+            path = None if ticket_cache is True else ticket_cache
+            ticket_cache = TicketCache(path)
+        self.ticket_cache = ticket_cache
+        if retry is None:
+            retry = RetryPolicy()
+        elif retry is False:
+            retry = RetryPolicy(total=0)
+        self.retry = retry
+        if circuit_breaker is None:
+            circuit_breaker = CircuitBreaker()
+        self.circuit = circuit_breaker or None
+        # whether the server supports multi-operation requests (if known)
+        self.batch_endpoint = None
+        self._auth_lock = threading.Lock()
+        self._system = None
+        self._stats = LatencyStats()
+        self._hooks = [self._stats]
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections,
+                              pool_maxsize=pool_maxsize,
+                              pool_block=pool_block)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close all pooled connections held by this instance.
+        The instance may still be used afterwards, but new connections
+        will have to be established.
+        """
+        self.session.close()
+
+    @property
+    def auth_tkt(self):
+        """The authentication ticket (cookie) for this server or None."""
+        return self.session.cookies.get(self.COOKIE_AUTH_TKT)
+
+    @auth_tkt.setter
+    def auth_tkt(self, value):
+        # remove any existing ticket (for any domain) before setting a new one
+        self.session.cookies.set(self.COOKIE_AUTH_TKT, None)
+        if value is not None:
+            self.session.cookies.set(self.COOKIE_AUTH_TKT, value)
+
+    def add_hook(self, func):
+        """Call ``func(span)`` after each request made by this instance.
+        Exceptions raised by hooks are logged and otherwise ignored.
+
+        :param func: called with a :class:`Span <palette.trace.Span>`
+        """
+        self._hooks.append(func)
+
+    def remove_hook(self, func):
+        """Remove a hook added with :meth:`add_hook`.
+
+        :raises: ValueError
+        """
+        self._hooks.remove(func)
+
+    def stats(self, reset=False):
+        """Return the request latency statistics of this instance.
+
+        The result maps each endpoint e.g. 'GET /api/v1/backups/{id}' to a
+        dict with the keys 'count', 'errors', 'sum', 'max', 'p50', 'p95'
+        and 'p99' (seconds).  The histograms themselves are available from
+        ``server.latency.histograms`` for exporting.
+
+        :param reset: discard the statistics after reading them.
+        :type reset: bool
+        :returns: dict
+        """
+        result = self._stats.summary()
+        if reset:
+            self._stats.reset()
+        return result
+
+    @property
+    def latency(self):
+        """The :class:`LatencyStats <palette.trace.LatencyStats>`
+        aggregating the spans of this instance."""
+        return self._stats
 
     def __getattr__(self, name):
-        if name == 'Backup':
-            from .backup import Backup
-            return ApiObject(self, Backup)
-        if name == 'System':
-            from .system import System
-            return ApiObject(self, System)
-        if name == 'system':
+        return ApiObject.attach(self, name)
+
+    @property
+    def system(self):
+        """ The system table as a cached, dict-like
+        :class:`SystemMapping <palette.system.SystemMapping>`.
+
+        The cached table is revalidated with the server once it is older
+        than `system_ttl` seconds.
+        """
+        if self._system is None:
             from .system import SystemMapping
-            return SystemMapping(self)
+            self._system = SystemMapping(self, ttl=self.system_ttl)
+        elif self._system.stale:
+            self._system.refresh()
+        return self._system
 
     @property
     def state(self):
@@ -106,17 +261,54 @@ class PaletteServer(object):
         data = self.get(self.STATE_PATH_INFO)
         return data[JsonKeys.STATE]
 
-    def authenticate(self):
+    def watch_state(self, **kwargs):
+        """Iterate over changes of the environment state.
+
+        Keyword arguments are passed to
+        :class:`StateWatcher <palette.watch.StateWatcher>`.
+
+        >>> for change in server.watch_state():
+        ...     print change.previous, '->', change.state
+
+        :returns: a :class:`StateWatcher <palette.watch.StateWatcher>`
+        """
+        from .watch import StateWatcher
+        return StateWatcher(self, **kwargs)
+
+    def subscribe_state(self, callback, **kwargs):
+        """Call `callback` with each change of the environment state from
+        a background thread.
+
+        :param callback: called with a :class:`StateChange` argument
+        :returns: a :class:`StateSubscription
+          <palette.watch.StateSubscription>` -- call `cancel()` to stop.
+        """
+        from .watch import StateSubscription
+        return StateSubscription(self, callback, **kwargs)
+
+    def authenticate(self, cached=False):
         """Authenticate the user against this Palette server.
 
+        :param cached: use the ticket from `ticket_cache` (if any) instead
+          of logging in.
+        :type cached: bool
         :raises: PaletteAuthenticationError
         """
+        if cached and self.ticket_cache is not None:
+            ticket = self.ticket_cache.get(self.url, self.username)
+            if ticket is not None:
+                self.auth_tkt = ticket
+                logger.info("Using cached ticket for username '%s'",
+                            self.username)
+                return
         payload = {'username': self.username, 'password': self.password}
-        logger.debug('POST ' + self.LOGIN_PATH_INFO + ' ' + sanitize(payload))
+        logger.debug('POST %s %s', self.LOGIN_PATH_INFO,
+                     Payload(payload, secret=True))
 
-        url = self._url(self.LOGIN_PATH_INFO)
-        res = requests.post(url, data=payload, allow_redirects=False)
-        logger.debug(str(res.status_code) + ' ' + str(res.reason))
+        res, span = self._send('POST', self.LOGIN_PATH_INFO, data=payload,
+                               idempotent=True, allow_redirects=False)
+        self._emit(span)
+        logger.debug('%s %s', res.status_code, res.reason)
 
         if res.status_code >= 400:
             # returns a 3xx status code (redirect) on success
@@ -124,26 +316,66 @@ class PaletteServer(object):
         if self.COOKIE_AUTH_TKT not in res.cookies:
             raise PaletteInternalError("'auth_tkt' is missing from response.")
         self.auth_tkt = res.cookies[self.COOKIE_AUTH_TKT]
+        if self.ticket_cache is not None:
+            self.ticket_cache.set(self.url, self.username, self.auth_tkt)
         logger.info("Authenticated username '%s'", self.username)
 
+    def _reauthenticate(self, rejected):
+        """Authenticate again after the ticket `rejected` was refused,
+        unless another thread already did."""
+        with self._auth_lock:
+            if self.auth_tkt == rejected:
+                logger.info("Ticket rejected by '%s', authenticating again",
+                            self.url)
+                if self.ticket_cache is not None:
+                    self.ticket_cache.discard(self.url, self.username)
+                self.authenticate()
+
     def _manage(self, action, sync=True):
         """Perform a generic 'manage' operation on the server."""
         payload = {'action': action, 'sync': sync}
         return self.post(self.MANAGE_PATH_INFO, data=payload)
 
+    # pylint: disable=too-many-arguments
+    def _job(self, action, done_states, ok_states=None, result=None,
+             instant=False):
+        """Create a Job for an asynchronous action and start polling it."""
+        job = Job(self, action, done_states, ok_states=ok_states,
+                  result=result, instant=instant)
+        default_poller().add(job)
+        return job
+
+    def _created_after_now(self, name):
+        """Return a Job result function for an action which creates an
+        instance of the resource `name` e.g. 'Backup'.
+
+        The function returns the most recent instance once it is newer than
+        the most recent one at the time of this call, and None until then.
+        """
+        latest = getattr(self, name).list_all(limit=1)
+        previous = latest[0]['id'] if latest else None
+        def result(server):
+            """Return the new instance (or None)."""
+            latest = getattr(server, name).list_all(limit=1)
+            if latest and (previous is None or latest[0]['id'] > previous):
+                return latest[0]
+            return None
+        return result
+
     def start(self, sync=True):
         """Start the Tableau server.
 
         :param sync: whether or not to wait for the action to complete.
         :type sync: bool
-        :returns: True
+        :returns: True or a Job if asynchronous (sync == False)
         :raises: HTTPError
         """
         self._manage(ManageActions.START, sync=sync)
-        if sync:
-            logger.info("Tableau server started.")
-        else:
+        if not sync:
             logger.info("Tableau server starting...")
+            return self._job(ManageActions.START, SETTLED_STATES,
+                             ok_states=RUNNING_STATES, instant=True)
+        logger.info("Tableau server started.")
         return True
 
     def stop(self, sync=True):
@@ -151,14 +383,15 @@ class PaletteServer(object):
 
         :param sync: whether or not to wait for the action to complete.
         :type sync: bool
-        :returns: True
+        :returns: True or a Job if asynchronous (sync == False)
         :raises: HTTPError
         """
         self._manage(ManageActions.STOP, sync=sync)
-        if sync:
-            logger.info("Tableau server stopped.")
-        else:
+        if not sync:
             logger.info("Tableau server stopping...")
+            return self._job(ManageActions.STOP, SETTLED_STATES,
+                             ok_states=(States.STOPPED,), instant=True)
+        logger.info("Tableau server stopped.")
         return True
 
     def restart(self, sync=True):
@@ -166,14 +399,15 @@ class PaletteServer(object):
 
         :param sync: whether or not to wait for the action to complete.
         :type sync: bool
-        :returns: True
+        :returns: True or a Job if asynchronous (sync == False)
         :raises: HTTPError
         """
         self._manage(ManageActions.RESTART, sync=sync)
-        if sync:
-            logger.info("Tableau server restarted.")
-        else:
+        if not sync:
             logger.info("Tableau server restarting...")
+            # the environment passes through STOPPED while restarting
+            return self._job(ManageActions.RESTART, RUNNING_STATES)
+        logger.info("Tableau server restarted.")
         return True
 
 
@@ -182,22 +416,32 @@ class PaletteServer(object):
 
         :param sync: whether or not to wait for the action to complete.
         :type sync: bool
-        :returns: a Backup instance or True if asynchronous (sync == False)
+        :returns: a Backup instance or a Job if asynchronous (sync == False)
+          whose result is the Backup instance.
         :raises: HTTPError
         """
+        if not sync:
+            result = self._created_after_now('Backup')
         data = self._manage(ManageActions.BACKUP, sync=sync)
         if not sync:
             logger.info("Backup in progress...")
-            return True
+            return self._job(ManageActions.BACKUP, SETTLED_STATES,
+                             result=result)
 
         result = self.Backup.from_json(data)
         logger.info("Backup completed '%d': %s", data['id'], data['url'])
         return result
 
-    def restore(self, backup, data_only=False, password=None, sync=True):
+    def restore(self, backup, data_only=False, password=None, sync=True,
+                progress=None):
         """Restore Tableau from a tsbak file.
 
-        :param backup: the Backup instance or URL of the file.
+        The file may be stored remotely (a Backup instance or the URL of the
+        file) or locally (a path or a file-like object opened in binary
+        mode).  A local file is streamed to the server as a multipart
+        upload using constant memory.
+
+        :param backup: the Backup instance, URL, local path or file object.
         :type path: str
         :param data_only: restore only data and not config.
         :type data_only: bool
@@ -205,53 +449,114 @@ class PaletteServer(object):
         :type password: str
         :param sync: whether or not to wait for the action to complete.
         :type sync: bool
-        :returns: True
-        :raises: HTTPError
+        :param progress: called with (bytes sent, total bytes) while a local
+          file is uploaded.
+        :returns: True or a Job if asynchronous (sync == False)
+        :raises: HTTPError, IOError
         """
-        if not isinstance(backup, basestring):
-            backup = backup.url
-        elif not backup or not isinstance(backup, basestring):
-            raise ValueError("Invalid 'backup' specified.")
-        payload = {'action': 'restore', 'url': backup, 'sync': sync}
+        # pylint: disable=too-many-arguments
+        payload = {'action': ManageActions.RESTORE, 'sync': sync}
         if password:
             payload['password'] = password
         if data_only:
             payload['data-only'] = data_only
-        self.post(self.MANAGE_PATH_INFO, data=payload)
+        if hasattr(backup, 'read'):
+            self._upload_restore(payload, backup, progress)
+        elif isinstance(backup, basestring) and '://' not in backup \
+                and os.path.isfile(backup):
+            with open(backup, 'rb') as fileobj:
+                self._upload_restore(payload, fileobj, progress)
+        else:
+            if not isinstance(backup, basestring):
+                backup = backup.url
+            elif not backup:
+                raise ValueError("Invalid 'backup' specified.")
+            payload['url'] = backup
+            self.post(self.MANAGE_PATH_INFO, data=payload)
+        if not sync:
+            logger.info("Restore in progress...")
+            return self._job(ManageActions.RESTORE, SETTLED_STATES)
         return True
 
+    def _upload_restore(self, payload, fileobj, progress):
+        """Send a 'restore' request with the file attached."""
+        filename = os.path.basename(getattr(fileobj, 'name', 'backup.tsbak'))
+        body = MultipartUpload(payload, 'file', fileobj, filename,
+                               progress=progress)
+        logger.info("Uploading '%s' (%d bytes) for restore",
+                    filename, body.size)
+        self._json('POST', self.MANAGE_PATH_INFO, data=body,
+                   headers={'Content-Type': body.content_type})
+
     def repair_license(self, sync=True):
         """Repair the Tableau Server license.
         This effectively runs 'tabadmin licenses --repair_service'
 
         :param sync: whether or not to wait for the action to complete.
         :type sync: bool
-        :returns: True
+        :returns: True or a Job if asynchronous (sync == False)
         :raises: HTTPError
         """
         self._manage(ManageActions.REPAIR_LICENSE, sync=sync)
-        if sync:
-            logger.info("License repair completed")
-        else:
+        if not sync:
             logger.info("License repair in progress...")
+            return self._job(ManageActions.REPAIR_LICENSE, SETTLED_STATES,
+                             instant=True)
+        logger.info("License repair completed")
         return True
 
     def ziplogs(self, sync=True):
-        """Cleanup the Tableau Server logs.
+        """Zip (and cleanup) the Tableau Server logs.
         This effectively runs 'tabadmin ziplogs'
 
         :param sync: whether or not to wait for the action to complete.
         :type sync: bool
-        :returns: True
+        :returns: a :class:`LogBundle <palette.logbundle.LogBundle>` or a
+          Job if asynchronous (sync == False) whose result is the LogBundle.
+          Servers which do not report log bundles return True instead.
         :raises: HTTPError
         """
-        # Return information about the resulting zip file (like backup)
-        self._manage(ManageActions.ZIPLOGS, sync=sync)
-        if sync:
-            logger.info("Ziplogs completed")
-        else:
+        if not sync:
+            try:
+                result = self._created_after_now('LogBundle')
+            except (requests.HTTPError, PaletteError):
+                # no 'logs' endpoint: the job result is True
+                result = None
+            self._manage(ManageActions.ZIPLOGS, sync=False)
             logger.info("Ziplogs in progress...")
-        return True
+            return self._job(ManageActions.ZIPLOGS, SETTLED_STATES,
+                             result=result)
+        data = self._manage(ManageActions.ZIPLOGS, sync=True)
+        bundle = None
+        if 'id' in data:
+            bundle = self.LogBundle.from_json(data)
+        else:
+            # the action is over: the latest bundle is the new one
+            try:
+                latest = self.LogBundle.list_all(limit=1)
+            except (requests.HTTPError, PaletteError):
+                latest = None
+            if latest:
+                bundle = latest[0]
+        if bundle is None:
+            logger.info("Ziplogs completed")
+            return True
+        logger.info("Ziplogs completed '%d': %s", bundle['id'], bundle['url'])
+        return bundle
+
+    def batch(self):
+        """ Queue calls to be sent together in (about) one round trip.
+
+        >>> with server.batch() as batch:
+        ...     state = batch.state
+        ...     latest = batch.Backup.list_all(limit=1)
+        >>> print state.result(), latest.result()
+
+        :returns: a :class:`Batch <palette.batch.Batch>` -- its methods
+          mirror those of this class but return futures, which are done
+          when the ``with`` block exits.
+        """
+        return Batch(self)
 
     def get(self, url, params=None, required=None):
         """Send a GET request to the server and receives a JSON response back.
@@ -263,16 +568,9 @@ class PaletteServer(object):
         :type params: dict
         :returns: dict -- the JSON response
         """
-        cookies = {self.COOKIE_AUTH_TKT: self.auth_tkt}
-        logger.debug('GET %s', display_url(url, params))
-        res = requests.get(self._url(url), params=params, cookies=cookies)
-        res.raise_for_status()
-        json = res.json()
-        logger.debug('%s %s %s', str(res.status_code), str(res.reason), json)
-        raise_for_json(json, required=required)
-        return json
+        return self._json('GET', url, params=params, required=required)
 
-    def post(self, url, data=None, required=None):
+    def post(self, url, data=None, required=None, idempotent=None):
         """Send a POST request to the server and receives a JSON response back.
         This method should rarely be needed outside of internal use.
 
@@ -280,30 +578,234 @@ class PaletteServer(object):
         :type url: str
         :param data: The data payload to send with the request
         :type data: dict
+        :param idempotent: the request may be retried after a transient
+          failure (POST requests are not retried by default).
+        :type idempotent: bool
         :returns: dict -- the JSON response
         """
-        cookies = {self.COOKIE_AUTH_TKT: self.auth_tkt}
-        logger.debug('POST %s %s', url, sanitize(data))
-        res = requests.post(self._url(url), data=data, cookies=cookies)
-        res.raise_for_status()
-        json = res.json()
-        logger.debug('%s %s %s', str(res.status_code), str(res.reason), json)
+        return self._json('POST', url, data=data, required=required,
+                          idempotent=idempotent)
+
+    def delete(self, url, required=None):
+        """Send a DELETE request to the server and receives a JSON response
+        back.  This method should rarely be needed outside of internal use.
+
+        :param url: The Palette Server URL
+        :type url: str
+        :returns: dict -- the JSON response
+        """
+        return self._json('DELETE', url, required=required)
+
+    def _json(self, method, url, required=None, **kwargs):
+        """Send a request and decode the JSON response, tracing both."""
+        batch = active_batch(self)
+        if batch is not None:
+            operation = batch.collect(method, url, required, kwargs)
+            if not operation.direct:
+                return operation.value()
+        res, span = self._send(method, url, **kwargs)
+        try:
+            res.raise_for_status()
+            start = time.time()
+            json = decoder.loads(res.content)
+            span.decode_time = time.time() - start
+        except Exception as ex:
+            span.error = ex
+            raise
+        finally:
+            span.elapsed += span.decode_time
+            self._emit(span)
+        logger.debug('%s %s %s', res.status_code, res.reason, Payload(json))
         raise_for_json(json, required=required)
         return json
 
+    def iter_json(self, url, key, params=None, factory=None):
+        """Send a GET request and iterate over the elements of the array
+        `key` of the JSON response as they are received, without decoding
+        the whole response at once.
+        This method should rarely be needed outside of internal use.
+
+        :param url: The Palette Server URL
+        :type url: str
+        :param key: The name of the array in the response e.g. 'backups'
+        :type key: str
+        :param params: Any query string information
+        :type params: dict
+        :param factory: Called with each element, the result is yielded.
+        :returns: generator
+        :raises: HTTPError, PaletteError
+        """
+        if active_batch(self) is not None:
+            # the response is part of a batch response
+            json = self._json('GET', url, params=params, required=key)
+            for item in json[key]:
+                yield item if factory is None else factory(item)
+            return
+        res, span = self._send('GET', url, params=params, stream=True)
+        stream = decoder.ArrayStream(res.iter_content(decoder.CHUNK_SIZE),
+                                     key, factory=factory,
+                                     before=_check_status)
+        try:
+            res.raise_for_status()
+            start = time.time()
+            for item in stream:
+                span.decode_time += time.time() - start
+                yield item
+                start = time.time()
+            span.decode_time += time.time() - start
+            logger.debug('%s %s %s', res.status_code, res.reason,
+                         Payload(stream.members))
+            raise_for_json(stream.members,
+                           required=None if stream.found else key)
+        except Exception as ex:
+            span.error = ex
+            raise
+        finally:
+            res.close()
+            span.bytes = stream.bytes
+            span.elapsed += span.decode_time
+            self._emit(span)
+
+    # pylint: disable=too-many-arguments
+    def request(self, method, url, params=None, data=None, headers=None,
+                timeout=None):
+        """Send a request to the server and return the raw response.
+        This method should rarely be needed outside of internal use.
+
+        :param method: The HTTP method e.g. 'GET'
+        :type method: str
+        :param url: The Palette Server URL
+        :type url: str
+        :param params: Any query string information
+        :type params: dict
+        :param data: The data payload to send with the request
+        :type data: dict
+        :param headers: Additional HTTP request headers
+        :type headers: dict
+        :param timeout: Overrides the instance timeout for this request
+        :type timeout: float
+        :returns: requests.Response
+        :raises: HTTPError
+        """
+        res, span = self._send(method, url, params=params, data=data,
+                               headers=headers, timeout=timeout)
+        self._emit(span)
+        res.raise_for_status()
+        return res
+
+    def _send(self, method, url, params=None, data=None, timeout=None,
+              idempotent=None, record=True, **kwargs):
+        """Send a request through the session, retrying transient failures
+        according to the retry policy.
+
+        With `record` False (e.g. for long polls, whose duration says nothing
+        about the server) the outcome is neither recorded by the circuit
+        breaker nor passed to the request hooks.
+
+        :returns: (response, span) -- the caller emits the span unless the
+          request itself raised.
+        """
+        # pylint: disable=too-many-locals,too-many-branches
+        if logger.isEnabledFor(logging.DEBUG):
+            if data is None:
+                logger.debug('%s %s', method, display_url(url, params))
+            else:
+                logger.debug('%s %s %s', method, display_url(url, params),
+                             Payload(data, secret=True))
+        if timeout is None:
+            timeout = self.timeout
+        # streamed bodies cannot be sent twice
+        replayable = data is None or isinstance(data, (dict, basestring))
+        reauthenticated = False
+        span = Span(method, url)
+        try:
+            while True:
+                if self.circuit is not None:
+                    self.circuit.allow(self.url)
+                ticket = self.auth_tkt
+                try:
+                    res = self.session.request(method, self._url(url),
+                                               params=params, data=data,
+                                               timeout=timeout, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as ex:
+                    if record:
+                        self._record()
+                    if not replayable or not self.retry.should_retry(
+                            method, span.retries, error=ex,
+                            idempotent=idempotent):
+                        raise
+                    delay = self.retry.delay(span.retries)
+                    error = ex
+                else:
+                    if record:
+                        self._record(res.status_code)
+                    if res.status_code in self.REAUTH_STATUS \
+                            and not reauthenticated and replayable \
+                            and url != self.LOGIN_PATH_INFO:
+                        res.close()
+                        self._reauthenticate(ticket)
+                        reauthenticated = True
+                        span.retries += 1
+                        continue
+                    if not replayable or not self.retry.should_retry(
+                            method, span.retries, status=res.status_code,
+                            idempotent=idempotent):
+                        break
+                    res.close()
+                    delay = self.retry.delay(span.retries, res)
+                    error = res.status_code
+                logger.info("%s %s failed (%s), retrying in %.1f seconds",
+                            method, url, error, delay)
+                span.retries += 1
+                time.sleep(delay)
+        except Exception as ex:
+            span.finish(error=ex)
+            if record:
+                self._emit(span)
+            raise
+        span.finish(res)
+        return res, span
+
+    def _record(self, status=None):
+        """Record the outcome of an attempt in the circuit breaker: the
+        response `status`, or None after a connection error or timeout."""
+        if self.circuit is None:
+            return
+        if status is None or status in self.circuit.status:
+            self.circuit.record_failure()
+        else:
+            self.circuit.record_success()
+
+    def _emit(self, span):
+        """Pass a finished span to every hook."""
+        for hook in list(self._hooks):
+            try:
+                hook(span)
+            except Exception as ex: # pylint: disable=broad-except
+                logger.warning("Request hook %r failed: %s", hook, ex)
+
     def _url(self, path_info):
         """Build the full url for the specified path_info."""
         return urlparse.urljoin(self.url, path_info)
 
 
-def connect(url, username=None, password=None, security_token=None):
+def _check_status(members):
+    """Fail a streamed response early if its status was already received."""
+    if JsonKeys.STATUS in members:
+        raise_for_json(dict(members))
+
+
+def connect(url, username=None, password=None, security_token=None,
+            **kwargs):
     """Create a PaletteServer instance and authenticate.
+    Any additional keyword arguments are passed to the
+    :class:`PaletteServer <palette.PaletteServer>` constructor.
 
     :returns: a :class:`PaletteServer <palette.PaletteServer>` instance
     :raises: PaletteAuthenticationError, ValueError
     """
     server = PaletteServer(url, username=username, password=password,
-                           security_token=security_token)
-    server.authenticate()
+                           security_token=security_token, **kwargs)
+    server.authenticate(cached=True)
     logger.info("Connected to server '%s'", url)
     return server
@@ -0,0 +1,497 @@
+""" Transfer backup files between storage and the local filesystem.
+
+Files are copied in fixed size chunks so memory use does not depend on the
+file size.  Large files are split into parts which may be transferred in
+parallel (``workers``) and an interrupted transfer resumes with the parts
+that are still missing.  A SHA-256 digest is computed while the data is
+in flight and may be checked against an expected value.
+
+>>> backup = server.Backup.list_all(limit=1)[0]
+>>> result = backup.download('/var/backups/latest.tsbak', workers=4)
+>>> print result.digest
+
+The storage of a URL is chosen by its scheme: local paths and ``file://``
+URLs are handled by :class:`FileStorage` and ``http(s)://`` URLs by
+:class:`HttpStorage`.  Other schemes (e.g. ``s3``) may be supported by
+registering a backend with :func:`register_backend`.
+"""
+from __future__ import absolute_import
+
+import os
+import time
+import json
+import errno
+import urllib
+import hashlib
+import urlparse
+import threading
+from collections import namedtuple
+
+import requests
+
+from . import logger
+from .error import PaletteError, PaletteChecksumError
+from .executor import WorkerPool
+
+# the number of bytes read or written at once
+CHUNK_SIZE = 1024 * 1024
+
+# the size of the parts of a transfer (the unit of parallelism and resume)
+PART_SIZE = 64 * 1024 * 1024
+
+PART_SUFFIX = '.part'
+STATE_SUFFIX = '.part.json'
+
+class TransferResult(namedtuple('TransferResult',
+                                ['url', 'path', 'size', 'digest', 'resumed',
+                                 'elapsed'])):
+    """The outcome of a download or upload: `size` bytes were transferred
+    between `url` and `path`, the file has the SHA-256 `digest` (hex) and
+    `resumed` bytes were already present from an interrupted transfer."""
+    __slots__ = ()
+
+
+class Storage(object):
+    """ Base class of storage backends.
+
+    A backend reports the size of a file, reads byte ranges and writes
+    whole files.  Backends must be safe to use from several threads.
+    """
+    # whether or not upload() may write parts of a file in any order
+    # (via the local path returned by local_path())
+    ranges = False
+
+    def size(self, url):
+        """Return the size of the file in bytes."""
+        raise NotImplementedError()
+
+    def stat(self, url):
+        """Return the size of the file and its version (e.g. an ETag) or
+        None if the backend cannot tell when the file changes."""
+        return self.size(url), None
+
+    def read(self, url, start, end, chunk_size=CHUNK_SIZE):
+        """Iterate over the bytes [start, end) of the file in chunks."""
+        raise NotImplementedError()
+
+    def write(self, url, fileobj, size):
+        """Store `size` bytes read from the file-like `fileobj`."""
+        raise NotImplementedError()
+
+    def local_path(self, url): # pylint: disable=no-self-use
+        """The local path of `url` (only for backends with `ranges`)."""
+        raise ValueError("'{0}' is not a local file".format(url))
+
+
+class FileStorage(Storage):
+    """ Files on the local filesystem addressed by path or ``file://`` URL.
+    """
+    ranges = True
+
+    def local_path(self, url):
+        parts = urlparse.urlsplit(url)
+        if parts.scheme == 'file':
+            return urllib.url2pathname(parts.path)
+        return url
+
+    def size(self, url):
+        return os.path.getsize(self.local_path(url))
+
+    def stat(self, url):
+        info = os.stat(self.local_path(url))
+        return info.st_size, info.st_mtime
+
+    def read(self, url, start, end, chunk_size=CHUNK_SIZE):
+        with open(self.local_path(url), 'rb') as handle:
+            for chunk in _read_file(handle, start, end, chunk_size):
+                yield chunk
+
+    def write(self, url, fileobj, size):
+        path = self.local_path(url)
+        with open(path + PART_SUFFIX, 'wb') as handle:
+            while True:
+                chunk = fileobj.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                handle.write(chunk)
+        os.rename(path + PART_SUFFIX, path)
+
+
+class HttpStorage(Storage):
+    """ Files served over HTTP(S), e.g. presigned object storage URLs.
+
+    Reads use 'Range' requests; writes are a single streamed PUT.
+
+    :param session: the session used for requests (default: a new one)
+    :type session: requests.Session
+    :param timeout: seconds to wait for the server on each request
+    :type timeout: float
+    """
+
+    def __init__(self, session=None, timeout=None):
+        self.session = session or requests.Session()
+        self.timeout = timeout
+
+    def size(self, url):
+        return self.stat(url)[0]
+
+    def stat(self, url):
+        res = self.session.head(url, allow_redirects=True,
+                                timeout=self.timeout)
+        res.raise_for_status()
+        version = res.headers.get('ETag') or res.headers.get('Last-Modified')
+        return int(res.headers['Content-Length']), version
+
+    def read(self, url, start, end, chunk_size=CHUNK_SIZE):
+        headers = {'Range': 'bytes={0}-{1}'.format(start, end - 1)}
+        res = self.session.get(url, headers=headers, stream=True,
+                               timeout=self.timeout)
+        try:
+            res.raise_for_status()
+            if res.status_code != 206 and start != 0:
+                raise PaletteError("'{0}' does not support ranges".format(url))
+            remaining = end - start
+            for chunk in res.iter_content(chunk_size):
+                if len(chunk) > remaining:
+                    chunk = chunk[:remaining]
+                remaining -= len(chunk)
+                yield chunk
+                if not remaining:
+                    break
+        finally:
+            res.close()
+
+    def write(self, url, fileobj, size):
+        headers = {'Content-Length': str(size)}
+        res = self.session.put(url, data=fileobj, headers=headers,
+                               timeout=self.timeout)
+        res.raise_for_status()
+
+
+_BACKENDS = {}
+
+def register_backend(scheme, backend):
+    """Use the Storage instance `backend` for URLs with `scheme`."""
+    _BACKENDS[scheme] = backend
+
+def get_backend(url):
+    """Return the Storage instance for `url`.
+
+    :raises: ValueError
+    """
+    scheme = urlparse.urlsplit(url).scheme
+    if len(scheme) < 2:
+        # no scheme (or a Windows drive letter): a local path
+        scheme = 'file'
+    try:
+        return _BACKENDS[scheme]
+    except KeyError:
+        raise ValueError("No storage backend for '{0}' URLs".format(scheme))
+
+register_backend('file', FileStorage())
+register_backend('http', HttpStorage())
+register_backend('https', HttpStorage())
+
+
+def _read_file(handle, start, end, chunk_size):
+    handle.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        chunk = handle.read(min(chunk_size, remaining))
+        if not chunk:
+            raise PaletteError('Unexpected end of file')
+        remaining -= len(chunk)
+        yield chunk
+
+
+class _Progress(object):
+    """Thread-safe byte counter reporting to a callback."""
+
+    def __init__(self, total, callback=None):
+        self.total = total
+        self.done = 0
+        self.callback = callback
+        self._lock = threading.Lock()
+
+    def add(self, count):
+        """Count `count` more bytes."""
+        with self._lock:
+            self.done += count
+            done = self.done
+        if self.callback is not None:
+            self.callback(done, self.total)
+
+
+class _OrderedDigest(object):
+    """ Hash parts that may complete in any order.
+
+    Chunks of the next part in file order are hashed as they arrive.
+    Parts completed out of order are read back (normally from the page
+    cache) once every part before them has been hashed.
+    """
+
+    def __init__(self, parts, read_back):
+        self.parts = parts
+        self.read_back = read_back
+        self.hasher = hashlib.sha256()
+        self.next = 0
+        self._live = None   # the part being hashed live, if any
+        self._completed = set()
+        self._lock = threading.Lock()
+
+    def start(self, index):
+        """Part `index` is about to be transferred: hash it live if it is
+        next in order."""
+        with self._lock:
+            if index == self.next and self._live is None:
+                self._live = index
+
+    def update(self, index, chunk):
+        """Hash `chunk` if part `index` is hashed live."""
+        if self._live == index:
+            self.hasher.update(chunk)
+
+    def complete(self, index):
+        """Part `index` is complete (on disk)."""
+        with self._lock:
+            self._completed.add(index)
+            if self._live == index:
+                self._live = None
+                self.next += 1
+            while self._live is None and self.next in self._completed \
+                    and self.next < len(self.parts):
+                start, end = self.parts[self.next]
+                for chunk in self.read_back(start, end):
+                    self.hasher.update(chunk)
+                self.next += 1
+
+    def hexdigest(self):
+        """The digest of the whole file."""
+        if self.next < len(self.parts):
+            raise PaletteError('Digest of an incomplete transfer')
+        return self.hasher.hexdigest()
+
+
+def _split(size, part_size):
+    if not size:
+        return [(0, 0)]
+    return [(start, min(start + part_size, size))
+            for start in xrange(0, size, part_size)]
+
+
+def _source(url, version):
+    """Identify the source of a transfer: its URL without the query string
+    (presigned URLs change on every request) and its version."""
+    parts = urlparse.urlsplit(url)
+    return {'url': urlparse.urlunsplit(parts[:3] + ('', '')),
+            'version': version}
+
+
+def _load_state(path, key):
+    """Return the indexes of the parts already transferred, unless the
+    saved state does not match `key` (e.g. the source file changed)."""
+    try:
+        with open(path) as handle:
+            state = json.load(handle)
+    except (IOError, ValueError):
+        return set()
+    if any(state.get(name) != value for name, value in key.iteritems()):
+        return set()
+    return set(state.get('done', []))
+
+
+def _save_state(path, key, done):
+    state = dict(key, done=sorted(done))
+    with open(path + '.tmp', 'w') as handle:
+        json.dump(state, handle)
+    os.rename(path + '.tmp', path)
+
+
+def _ranged_copy(read, dest, size, workers, resume, part_size, progress,
+                 chunk_size, source):
+    """ Copy `size` bytes from ``read(start, end)`` into the file `dest`,
+    part by part.  `source` (see :func:`_source`) is saved with the parts
+    done so that a transfer only resumes from the same file.
+
+    :returns: (digest, resumed bytes)
+    """
+    # pylint: disable=too-many-arguments,too-many-locals
+    partial = dest + PART_SUFFIX
+    state_path = dest + STATE_SUFFIX
+    parts = _split(size, part_size)
+    key = dict(source, size=size, part_size=part_size)
+    done = _load_state(state_path, key) if resume else set()
+    if not done or not os.path.exists(partial):
+        done = set()
+        with open(partial, 'wb') as handle:
+            handle.truncate(size)
+    resumed = sum(parts[index][1] - parts[index][0] for index in done)
+    if resumed:
+        logger.info("Resuming transfer to '%s' (%d of %d bytes present)",
+                    dest, resumed, size)
+        progress.add(resumed)
+
+    def read_back(start, end):
+        """Read part of the partial file (for the digest)."""
+        with open(partial, 'rb') as handle:
+            for chunk in _read_file(handle, start, end, chunk_size):
+                yield chunk
+
+    digest = _OrderedDigest(parts, read_back)
+    lock = threading.Lock()
+
+    def copy_part(index):
+        """Transfer one part and record it as done."""
+        start, end = parts[index]
+        digest.start(index)
+        with open(partial, 'r+b') as handle:
+            handle.seek(start)
+            for chunk in read(start, end) if end > start else ():
+                handle.write(chunk)
+                digest.update(index, chunk)
+                progress.add(len(chunk))
+            if handle.tell() != end:
+                raise PaletteError('Incomplete transfer of bytes {0}-{1}'
+                                   .format(start, end))
+        with lock:
+            done.add(index)
+            _save_state(state_path, key, done)
+        digest.complete(index)
+
+    for index in sorted(done):
+        digest.complete(index)
+    pending = [index for index in xrange(len(parts)) if index not in done]
+    if workers > 1 and len(pending) > 1:
+        pool = WorkerPool(max_workers=min(workers, len(pending)))
+        try:
+            futures = [pool.submit(copy_part, index) for index in pending]
+            for future in futures:
+                future.result()
+        finally:
+            pool.shutdown(wait=True)
+    else:
+        for index in pending:
+            copy_part(index)
+
+    os.rename(partial, dest)
+    os.unlink(state_path)
+    return digest.hexdigest(), resumed
+
+
+def _check_digest(url, digest, expected):
+    if expected is not None and digest != expected.lower():
+        raise PaletteChecksumError(url, expected, digest)
+
+
+def download(url, path, workers=1, resume=True, size=None, digest=None,
+             progress=None, part_size=PART_SIZE, chunk_size=CHUNK_SIZE):
+    """ Download the file at `url` to the local `path`.
+
+    :param url: the URL of the file (or a local path)
+    :type url: str
+    :param path: the local destination
+    :type path: str
+    :param workers: the number of parts transferred in parallel
+    :type workers: int
+    :param resume: continue an interrupted download of the same file
+    :type resume: bool
+    :param size: the expected size of the file (default: ask the storage)
+    :type size: int
+    :param digest: the expected SHA-256 digest (hex) of the file
+    :type digest: str
+    :param progress: called with (bytes done, total bytes) as data arrives
+    :returns: a :class:`TransferResult`
+    :raises: PaletteChecksumError, PaletteError, ValueError, IOError
+    """
+    # pylint: disable=too-many-arguments,too-many-locals
+    backend = get_backend(url)
+    started = time.time()
+    actual, version = backend.stat(url)
+    if size is not None and int(size) != actual:
+        raise PaletteChecksumError(url, 'size {0}'.format(size),
+                                   'size {0}'.format(actual))
+    read = lambda start, end: backend.read(url, start, end, chunk_size)
+    hexdigest, resumed = _ranged_copy(read, path, actual, workers, resume,
+                                      part_size, _Progress(actual, progress),
+                                      chunk_size, _source(url, version))
+    try:
+        _check_digest(url, hexdigest, digest)
+    except PaletteChecksumError:
+        _remove(path)
+        raise
+    logger.info("Downloaded '%s' to '%s' (%d bytes)", url, path, actual)
+    return TransferResult(url, path, actual, hexdigest, resumed,
+                          time.time() - started)
+
+
+class _Reader(object):
+    """ A file-like object reading a local file in chunks while hashing
+    it and reporting progress.  `len()` is the number of bytes to read.
+    """
+
+    def __init__(self, handle, size, progress):
+        self.handle = handle
+        self.size = size
+        self.progress = progress
+        self.hasher = hashlib.sha256()
+
+    def __len__(self):
+        return self.size
+
+    def read(self, count=-1):
+        """Read up to `count` bytes (or everything)."""
+        if count is None or count < 0:
+            count = self.size
+        chunk = self.handle.read(min(count, CHUNK_SIZE))
+        if chunk:
+            self.hasher.update(chunk)
+            self.progress.add(len(chunk))
+        return chunk
+
+
+def upload(path, url, workers=1, resume=True, digest=None, progress=None,
+           part_size=PART_SIZE, chunk_size=CHUNK_SIZE):
+    """ Upload the local file `path` to `url`.
+
+    Parallel parts and resuming require a backend supporting ranged writes
+    (e.g. FileStorage); otherwise the file is streamed in one request.
+    See :func:`download` for the parameters.
+
+    :returns: a :class:`TransferResult`
+    :raises: PaletteChecksumError, PaletteError, ValueError, IOError
+    """
+    # pylint: disable=too-many-arguments,too-many-locals
+    backend = get_backend(url)
+    started = time.time()
+    info = os.stat(path)
+    size = info.st_size
+    counter = _Progress(size, progress)
+    resumed = 0
+    if backend.ranges:
+        def read(start, end):
+            """Read part of the local file."""
+            with open(path, 'rb') as handle:
+                for chunk in _read_file(handle, start, end, chunk_size):
+                    yield chunk
+        hexdigest, resumed = _ranged_copy(read, backend.local_path(url),
+                                          size, workers, resume, part_size,
+                                          counter, chunk_size,
+                                          _source(os.path.abspath(path),
+                                                  info.st_mtime))
+    else:
+        with open(path, 'rb') as handle:
+            reader = _Reader(handle, size, counter)
+            backend.write(url, reader, size)
+        hexdigest = reader.hasher.hexdigest()
+    _check_digest(path, hexdigest, digest)
+    logger.info("Uploaded '%s' to '%s' (%d bytes)", path, url, size)
+    return TransferResult(url, path, size, hexdigest, resumed,
+                          time.time() - started)
+
+
+def _remove(path):
+    try:
+        os.unlink(path)
+    except OSError as ex:
+        if ex.errno != errno.ENOENT:
+            raise
@@ -1,6 +1,11 @@
 """ Classes and functions for handling the Palette system table """
 from __future__ import absolute_import
-from .internal import API_PATH_INFO, DictObject
+import time
+import threading
+from contextlib import contextmanager
+
+from . import decoder
+from .internal import API_PATH_INFO, DictObject, raise_for_json
 
 class System(DictObject):
     """ The low-level Palette Server system table interface.
@@ -14,6 +19,12 @@ class System(DictObject):
     >>> print server.system['backup-user-retain-count']
     3
 
+    Several changes may be sent as a single update:
+
+    >>> with server.system.batch() as system:
+    ...     system['backup-user-retain-count'] = 5
+    ...     system['socket-timeout'] = 120
+
     """
     # pylint: disable=too-many-public-methods
     PATH_INFO = API_PATH_INFO + '/system'
@@ -52,6 +63,7 @@ class System(DictObject):
         :raises: HTTPError
         """
         server.post(cls.PATH_INFO, data=data)
+        _update_cache(server, data)
 
     @classmethod
     def save(cls, server, key, value):
@@ -65,16 +77,154 @@ class System(DictObject):
         """
         path_info = cls.PATH_INFO + '/' + str(key)
         server.post(path_info, data={'value': value})
+        _update_cache(server, {key: value})
+
+
+def _update_cache(server, data):
+    """ Apply values just saved to the cached system table of `server` (if
+    any) rather than fetching the whole table again. """
+    mapping = getattr(server, '_system', None)
+    if mapping is not None:
+        dict.update(mapping, data)
+
 
+class SystemMapping(dict): # pylint: disable=too-many-instance-attributes
+    """ Interface to the system table that acts like a standard dict()
 
-class SystemMapping(dict):
-    """ Interface to the system table that acts like a standard dict() """
+    The contents are a snapshot of the system table.  ``server.system``
+    keeps one instance per server and revalidates it after `ttl` seconds,
+    using a conditional request (ETag/Last-Modified) when the server
+    supports it.  Values saved through the SDK update the snapshot
+    directly.
 
-    def __init__(self, server):
+    :param server: The server instance
+    :type server: PaletteServer
+    :param ttl: Seconds before the snapshot is stale (None = never)
+    :type ttl: float
+    """
+
+    def __init__(self, server, ttl=None):
+        dict.__init__(self)
         self.server = server
-        data = server.System.list_all()
-        dict.__init__(self, data)
+        self.ttl = ttl
+        self.fetched = None
+        self.etag = None
+        self.last_modified = None
+        self._lock = threading.Lock()
+        # the batch (if any) of each thread
+        self._local = threading.local()
+        self.refresh()
+
+    @property
+    def _pending(self):
+        """ The assignments of the current thread's batch (or None). """
+        return getattr(self._local, 'pending', None)
+
+    @property
+    def _snapshot(self):
+        """ The contents at the start of the current thread's batch. """
+        return getattr(self._local, 'snapshot', None)
 
     def __setitem__(self, key, value):
-        self.server.System.save(key, value)
+        if self._pending is not None:
+            self._pending[key] = value
+        else:
+            self.server.System.save(key, value)
         dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        if self._pending is None:
+            dict.__delitem__(self, key)
+            return
+        # the system table has no way to remove a key: a deletion inside
+        # a batch may only cancel a pending assignment.
+        if key not in self._pending:
+            fmt = "system table key '{0}' cannot be deleted"
+            raise TypeError(fmt.format(key))
+        del self._pending[key]
+        if key in self._snapshot:
+            dict.__setitem__(self, key, self._snapshot[key])
+        else:
+            dict.__delitem__(self, key)
+
+    def update(self, *args, **kwargs): # pylint: disable=arguments-differ
+        """ Set several keys at once using one request. """
+        data = dict(*args, **kwargs)
+        if self._pending is not None:
+            self._pending.update(data)
+        elif data:
+            self.server.System.update(data)
+        dict.update(self, data)
+
+    @contextmanager
+    def batch(self):
+        """ Collect assignments and send them as one update at exit.
+
+        Values equal to the current snapshot are skipped.  If the update
+        fails (or the block raises) the local contents are rolled back.
+        Nested batches are part of the outermost one.  A batch only
+        collects the assignments of the thread that opened it.
+
+        :raises: HTTPError
+        """
+        if self._pending is not None:
+            yield self
+            return
+        snapshot = self._local.snapshot = dict(self)
+        pending = self._local.pending = {}
+        try:
+            yield self
+            changes = dict((key, value)
+                           for key, value in pending.iteritems()
+                           if key not in snapshot or snapshot[key] != value)
+            if changes:
+                self.server.System.update(changes)
+        except:
+            for key in pending:
+                if key in snapshot:
+                    dict.__setitem__(self, key, snapshot[key])
+                else:
+                    dict.pop(self, key, None)
+            raise
+        finally:
+            self._local.pending = None
+            self._local.snapshot = None
+
+    @property
+    def stale(self):
+        """ True if the snapshot must be revalidated before use. """
+        if self.fetched is None:
+            return True
+        if self.ttl is None:
+            return False
+        return time.time() - self.fetched >= self.ttl
+
+    def invalidate(self):
+        """ Force revalidation on the next ``server.system`` access. """
+        self.fetched = None
+
+    def refresh(self):
+        """ Revalidate the snapshot with the server.
+
+        :return: True if the contents changed.
+        :raises: HTTPError
+        """
+        with self._lock:
+            headers = {}
+            if self.etag:
+                headers['If-None-Match'] = self.etag
+            if self.last_modified:
+                headers['If-Modified-Since'] = self.last_modified
+            res = self.server.request('GET', System.PATH_INFO,
+                                      headers=headers)
+            if res.status_code == 304:
+                self.fetched = time.time()
+                return False
+            data = decoder.loads(res.content)
+            raise_for_json(data)
+            dict.clear(self)
+            dict.update(self, data)
+            self.etag = res.headers.get('ETag')
+            self.last_modified = res.headers.get('Last-Modified')
+            self.fetched = time.time()
+            return True
@@ -0,0 +1,830 @@
+""" Support for testing and benchmarking without a real Palette server.
+
+:class:`FakePaletteServer` is an in-process HTTP server implementing the
+REST API described in the documentation with configurable latency and
+payload sizes:
+
+>>> with FakePaletteServer(latency=0.01, backups=5000) as fake:
+...     server = palette.connect(fake.url, username=fake.username,
+...                              password=fake.password)
+...     print server.state
+RUNNING
+
+:class:`RecordingAdapter` and :class:`ReplayAdapter` are transport adapters
+that capture the traffic of a PaletteServer once and replay it
+deterministically later (see :func:`record` and :func:`replay`).
+"""
+import re
+import cgi
+import json
+import time
+import uuid
+import base64
+import hashlib
+import zipfile
+import random
+import threading
+import urlparse
+import BaseHTTPServer
+import SocketServer
+
+from Cookie import SimpleCookie
+from collections import deque
+from cStringIO import StringIO
+from urllib import urlencode
+
+from requests import Response
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.cookies import extract_cookies_to_jar
+from requests.structures import CaseInsensitiveDict
+
+from .error import PaletteError
+from .internal import States
+
+# transitional states used by the fake server while performing an action
+STARTING = 'STARTING'
+STOPPING = 'STOPPING'
+BUSY_STATES = {
+    'backup': 'BACKUP',
+    'restore': 'RESTORE',
+    'repair-license': 'REPAIR-LICENSE',
+    'ziplogs': 'ZIPLOGS'
+}
+
+DEFAULT_SYSTEM = {
+    'socket-timeout': 60,
+    'auto-update-enabled': False,
+    'backup-user-retain-count': 1,
+    'backup-auto-retain-count': 14,
+    'alerts-enabled': True,
+    'alerts-admin-enabled': False,
+    'alerts-new-user-enabled': False,
+}
+
+# the files of the log bundles created by 'ziplogs' (besides a manifest)
+LOG_FILES = ('vizqlserver/vizqlserver_0.log',
+             'backgrounder/backgrounder_0.log',
+             'httpd/access.log')
+
+def _coerce(value, default):
+    """Convert a form value to the type of `default`."""
+    if isinstance(default, bool):
+        return value.lower() in ('true', '1', 'yes', 'on')
+    if isinstance(default, (int, long)):
+        try:
+            return int(value)
+        except ValueError:
+            return value
+    return value
+
+
+class FakePaletteServer(object):
+    """ An in-process Palette server listening on localhost.
+
+    :param username: the username accepted for authentication
+    :param password: the password accepted for authentication
+    :param latency: seconds added to the handling of every request
+    :type latency: float
+    :param backups: the number of backups initially available
+    :type backups: int
+    :param system_keys: the number of additional (filler) system table keys
+    :type system_keys: int
+    :param action_time: seconds each 'manage' action takes
+    :type action_time: float
+    :param port: the port to listen on (default: any free port)
+    :type port: int
+    :param bulk_delete: support the bulk 'backups/delete' endpoint (as
+      opposed to deleting one backup per request only)
+    :type bulk_delete: bool
+    :param batch: support multi-operation requests ('batch' endpoint)
+    :type batch: bool
+    :param log_lines: the number of lines of each file in the log bundles
+      created by 'ziplogs' (every 100th line is an error)
+    :type log_lines: int
+
+    :ivar requests: the number of requests handled, per path
+    :ivar uploads: the files uploaded for restore (dicts with the keys
+      'filename', 'size' and 'sha256')
+    :ivar log_files: the contents of the log bundle archives, by id
+    """
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+
+    BACKUP_URL = 's3://fake-palette/tableau-backups/{0}.tsbak'
+
+    def __init__(self, username='admin', password='password', latency=0.0,
+                 backups=10, system_keys=0, action_time=0.1, port=0,
+                 bulk_delete=True, batch=True, log_lines=1000):
+        self.username = username
+        self.password = password
+        self.latency = latency
+        self.action_time = action_time
+        self.bulk_delete = bulk_delete
+        self.batch = batch
+        self.log_lines = log_lines
+        self.state = States.RUNNING
+        self.tickets = set()
+        self.requests = {}
+        self.failures = []
+        self.uploads = []
+        self.condition = threading.Condition()
+        self.backups = []
+        self.log_bundles = []
+        self.log_files = {}
+        start = time.time() - backups * 3600
+        for hour in xrange(backups):
+            self.add_backup(start + hour * 3600)
+        self.system = dict(DEFAULT_SYSTEM)
+        for index in xrange(system_keys):
+            self.system['fake-key-{0}'.format(index)] = 'x' * 32
+        self.system_version = 0
+        self.httpd = _HTTPServer(('127.0.0.1', port), _Handler)
+        self.httpd.fake = self
+        self.thread = None
+
+    @property
+    def url(self):
+        """The URL of the running server."""
+        return 'http://{0}:{1}'.format(*self.httpd.server_address)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        """Start serving requests in a daemon thread.
+
+        :returns: str -- the URL of the server.
+        """
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       name='palette-fake-server')
+        self.thread.daemon = True
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        """Stop serving requests."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread = None
+
+    def fail(self, status=503, count=1):
+        """Answer the next `count` requests with the HTTP `status` (e.g. to
+        simulate an overloaded proxy in front of the server)."""
+        with self.condition:
+            self.failures.extend([status] * count)
+
+    def set_state(self, state):
+        """Change the environment state and wake up long polls."""
+        with self.condition:
+            self.state = state
+            self.condition.notify_all()
+
+    def add_backup(self, timestamp=None):
+        """Create a new backup record.
+
+        :returns: dict -- the backup
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        with self.condition:
+            backup_id = self.backups[-1]['id'] + 1 if self.backups else 1
+            name = time.strftime('%Y%m%d_%H%M%S', time.gmtime(timestamp))
+            backup = {
+                'id': backup_id,
+                'url': self.BACKUP_URL.format(name),
+                'size': random.randint(1000000, 100000000),
+                'creation-time': time.strftime('%Y-%m-%dT%H:%M:%S.000000Z',
+                                               time.gmtime(timestamp))
+            }
+            self.backups.append(backup)
+            return backup
+
+    def add_log_bundle(self, timestamp=None):
+        """Create a new log bundle (a zip archive served by this server).
+
+        :returns: dict -- the log bundle
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        buf = StringIO()
+        archive = zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED)
+        archive.writestr(zipfile.ZipInfo('manifest.txt'),
+                         '\n'.join(LOG_FILES) + '\n')
+        for name in LOG_FILES:
+            archive.writestr(name.split('/')[0] + '/', '')
+            lines = []
+            for index in xrange(self.log_lines):
+                level = 'ERROR' if index % 100 == 99 else 'INFO'
+                lines.append('{0} {1} {2}: request {3} completed\n'.format(
+                    time.strftime('%Y-%m-%d %H:%M:%S',
+                                  time.gmtime(timestamp)),
+                    name.split('/')[0], level, index))
+            archive.writestr(name, ''.join(lines))
+        archive.close()
+        with self.condition:
+            bundle_id = len(self.log_bundles) + 1
+            bundle = {
+                'id': bundle_id,
+                'url': '{0}/files/logs/{1}.zip'.format(self.url, bundle_id),
+                'size': len(buf.getvalue()),
+                'creation-time': time.strftime('%Y-%m-%dT%H:%M:%S.000000Z',
+                                               time.gmtime(timestamp))
+            }
+            self.log_bundles.append(bundle)
+            self.log_files[bundle_id] = buf.getvalue()
+            return bundle
+
+    def manage(self, action, sync=True):
+        """Perform a 'manage' action.
+
+        :returns: dict -- any additional response data.
+        """
+        with self.condition:
+            previous = self.state
+        if action == 'start':
+            steps = [(STARTING, 1), (States.RUNNING, 0)]
+        elif action == 'stop':
+            steps = [(STOPPING, 1), (States.STOPPED, 0)]
+        elif action == 'restart':
+            steps = [(STOPPING, 0.5), (States.STOPPED, 0), (STARTING, 0.5),
+                     (States.RUNNING, 0)]
+        elif action in BUSY_STATES:
+            steps = [(BUSY_STATES[action], 1), (previous, 0)]
+        else:
+            raise ValueError("Invalid action '{0}'".format(action))
+        self.set_state(steps[0][0])
+        if sync:
+            return self._perform(action, steps)
+        thread = threading.Thread(target=self._perform, args=(action, steps))
+        thread.daemon = True
+        thread.start()
+        return {}
+
+    def _perform(self, action, steps):
+        for state, fraction in steps[:-1]:
+            self.set_state(state)
+            time.sleep(self.action_time * fraction)
+        result = {}
+        if action == 'backup':
+            result = self.add_backup()
+        elif action == 'ziplogs':
+            result = self.add_log_bundle()
+        self.set_state(steps[-1][0])
+        return result
+
+    def list_backups(self, limit=7, desc=True, cursor=None):
+        """Return backups as the 'backups' endpoint does."""
+        with self.condition:
+            backups = list(self.backups)
+        if desc:
+            backups.reverse()
+        if cursor is not None:
+            if desc:
+                backups = [b for b in backups if b['id'] < cursor]
+            else:
+                backups = [b for b in backups if b['id'] > cursor]
+        return backups[:limit]
+
+    def delete_backup(self, backup_id):
+        """Remove a backup.
+
+        :returns: dict -- the backup (or None if it does not exist)
+        """
+        with self.condition:
+            for index, backup in enumerate(self.backups):
+                if backup['id'] == backup_id:
+                    return self.backups.pop(index)
+        return None
+
+    def update_system(self, data):
+        """Update system table keys from form data."""
+        with self.condition:
+            for key, value in data.iteritems():
+                self.system[key] = _coerce(value, self.system.get(key))
+            self.system_version += 1
+
+
+class _HTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Request handler for FakePaletteServer."""
+    # pylint: disable=too-many-public-methods
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    wbufsize = -1
+    query = None
+    form = None
+    captured = None
+
+    ROUTES = [
+        ('GET', r'/api/v1/state$', 'state'),
+        ('POST', r'/api/v1/manage$', 'manage'),
+        ('GET', r'/api/v1/backups$', 'backups'),
+        ('GET', r'/api/v1/backups/(\d+)$', 'backup'),
+        ('DELETE', r'/api/v1/backups/(\d+)$', 'backup_delete'),
+        ('POST', r'/api/v1/backups/delete$', 'backups_delete'),
+        ('POST', r'/api/v1/batch$', 'batch'),
+        ('GET', r'/api/v1/logs$', 'logs'),
+        ('GET', r'/api/v1/logs/(\d+)$', 'log_bundle'),
+        ('GET', r'/api/v1/system$', 'system'),
+        ('POST', r'/api/v1/system$', 'system_update'),
+        ('GET', r'/api/v1/system/([^/]+)$', 'system_get'),
+        ('POST', r'/api/v1/system/([^/]+)$', 'system_save'),
+    ]
+
+    def log_message(self, fmt, *args): # pylint: disable=arguments-differ
+        pass
+
+    @property
+    def fake(self):
+        """The FakePaletteServer instance."""
+        return self.server.fake
+
+    def do_GET(self): # pylint: disable=invalid-name
+        """Handle a GET request."""
+        self._dispatch('GET')
+
+    def do_POST(self): # pylint: disable=invalid-name
+        """Handle a POST request."""
+        self._dispatch('POST')
+
+    def do_DELETE(self): # pylint: disable=invalid-name
+        """Handle a DELETE request."""
+        self._dispatch('DELETE')
+
+    def do_HEAD(self): # pylint: disable=invalid-name
+        """Handle a HEAD request."""
+        self._dispatch('HEAD')
+
+    def _dispatch(self, method):
+        parts = urlparse.urlsplit(self.path)
+        self.query = dict(urlparse.parse_qsl(parts.query))
+        self.form = {}
+        ctype = self.headers.get('Content-Type', '')
+        if ctype.startswith('multipart/form-data'):
+            self._read_multipart(ctype)
+        else:
+            length = int(self.headers.get('Content-Length', 0))
+            body = self.rfile.read(length) if length else ''
+            if ctype.startswith('application/x-www-form-urlencoded'):
+                self.form = dict(urlparse.parse_qsl(body))
+            elif ctype.startswith('application/json'):
+                self.form = json.loads(body)
+        with self.fake.condition:
+            count = self.fake.requests.get(parts.path, 0)
+            self.fake.requests[parts.path] = count + 1
+            status = self.fake.failures.pop(0) if self.fake.failures else None
+        if status is not None:
+            return self.send_json({'status': 'FAILED',
+                                   'error': 'Injected failure'}, code=status)
+        if self.fake.latency:
+            time.sleep(self.fake.latency)
+        if method == 'POST' and parts.path == '/login/authenticate':
+            return self.authenticate()
+        # the files are public (like presigned URLs)
+        match = re.match(r'/files/logs/(\d+)\.zip$', parts.path)
+        if match and method in ('GET', 'HEAD'):
+            return self.send_file(self.fake.log_files.get(int(match.group(1))),
+                                  head=method == 'HEAD')
+        return self._route(method, parts.path)
+
+    def _route(self, method, path):
+        """Call the handler of a request (or of an operation of a batch)."""
+        for route_method, pattern, name in self.ROUTES:
+            match = re.match(pattern, path)
+            if match and route_method == method:
+                if self.captured is None and not self._authorized():
+                    return self.send_json({'status': 'FAILED',
+                                           'error': 'Forbidden'}, code=403)
+                try:
+                    return getattr(self, 'handle_' + name)(*match.groups())
+                except (KeyError, ValueError) as ex:
+                    return self.send_json({'status': 'FAILED',
+                                           'error': str(ex)}, code=400)
+        return self.send_json({'status': 'FAILED', 'error': 'Not Found'},
+                              code=404)
+
+    def _read_multipart(self, ctype):
+        """Parse a multipart form, hashing (not keeping) any file."""
+        environ = {'REQUEST_METHOD': 'POST', 'CONTENT_TYPE': ctype,
+                   'CONTENT_LENGTH': self.headers.get('Content-Length', 0)}
+        fields = cgi.FieldStorage(fp=self.rfile, headers=self.headers,
+                                  environ=environ)
+        for key in fields.keys():
+            item = fields[key]
+            if item.filename is None:
+                self.form[key] = item.value
+                continue
+            digest = hashlib.sha256()
+            size = 0
+            while True:
+                chunk = item.file.read(64 * 1024)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                size += len(chunk)
+            self.form[key] = 'upload:' + item.filename
+            with self.fake.condition:
+                self.fake.uploads.append({'filename': item.filename,
+                                          'size': size,
+                                          'sha256': digest.hexdigest()})
+
+    def _authorized(self):
+        cookie = SimpleCookie(self.headers.get('Cookie', ''))
+        return 'auth_tkt' in cookie \
+            and cookie['auth_tkt'].value in self.fake.tickets
+
+    def send_json(self, data, code=200, headers=None):
+        """Send a JSON response."""
+        if self.captured is not None:
+            self.captured.append({'status_code': code, 'body': data})
+            return
+        body = json.dumps(data)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).iteritems():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_file(self, data, head=False):
+        """Send a file (or the requested 'Range' of it)."""
+        if data is None:
+            self.send_empty(404)
+            return
+        code = 200
+        headers = {'Content-Type': 'application/zip',
+                   'Accept-Ranges': 'bytes'}
+        match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+        if match:
+            start = int(match.group(1))
+            end = int(match.group(2)) + 1 if match.group(2) else len(data)
+            headers['Content-Range'] = 'bytes {0}-{1}/{2}'.format(
+                start, end - 1, len(data))
+            data = data[start:end]
+            code = 206
+        self.send_response(code)
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in headers.iteritems():
+            self.send_header(key, value)
+        self.end_headers()
+        if not head:
+            self.wfile.write(data)
+
+    def send_empty(self, code, headers=None):
+        """Send a response without a body."""
+        if self.captured is not None:
+            self.captured.append({'status_code': code, 'body': None})
+            return
+        self.send_response(code)
+        self.send_header('Content-Length', '0')
+        for key, value in (headers or {}).iteritems():
+            self.send_header(key, value)
+        self.end_headers()
+
+    def authenticate(self):
+        """POST /login/authenticate"""
+        if 'username' not in self.form or 'password' not in self.form:
+            return self.send_empty(400)
+        if self.form['username'] != self.fake.username \
+           or self.form['password'] != self.fake.password:
+            return self.send_empty(403)
+        ticket = uuid.uuid4().hex
+        with self.fake.condition:
+            self.fake.tickets.add(ticket)
+        headers = {'Set-Cookie': 'auth_tkt={0}; Path=/'.format(ticket),
+                   'Location': '/'}
+        return self.send_empty(302, headers=headers)
+
+    def handle_state(self):
+        """GET /api/v1/state (with optional long polling)"""
+        fake = self.fake
+        with fake.condition:
+            if 'wait' in self.query and 'state' in self.query:
+                deadline = time.time() + float(self.query['wait'])
+                while fake.state == self.query['state']:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    fake.condition.wait(remaining)
+            state = fake.state
+        self.send_json({'status': 'OK', 'state': state})
+
+    def handle_manage(self):
+        """POST /api/v1/manage"""
+        action = self.form['action']
+        sync = self.form.get('sync', 'True').lower() == 'true'
+        data = self.fake.manage(action, sync=sync)
+        result = {'status': 'OK'}
+        result.update(data or {})
+        self.send_json(result)
+
+    def handle_backups(self):
+        """GET /api/v1/backups"""
+        limit = int(self.query.get('limit', 7))
+        desc = self.query.get('desc', 'True').lower() == 'true'
+        cursor = self.query.get('cursor')
+        if cursor is not None:
+            cursor = int(cursor)
+        backups = self.fake.list_backups(limit=limit, desc=desc, cursor=cursor)
+        self.send_json({'status': 'OK', 'backups': backups})
+
+    def handle_backup(self, backup_id):
+        """GET /api/v1/backups/<id>"""
+        for backup in self.fake.list_backups(limit=len(self.fake.backups)):
+            if backup['id'] == int(backup_id):
+                data = {'status': 'OK'}
+                data.update(backup)
+                return self.send_json(data)
+        return self.send_json({'status': 'FAILED', 'error': 'Not Found'},
+                              code=404)
+
+    def handle_backup_delete(self, backup_id):
+        """DELETE /api/v1/backups/<id>"""
+        backup = self.fake.delete_backup(int(backup_id))
+        if backup is None:
+            return self.send_json({'status': 'FAILED', 'error': 'Not Found'},
+                                  code=404)
+        data = {'status': 'OK'}
+        data.update(backup)
+        return self.send_json(data)
+
+    def handle_backups_delete(self):
+        """POST /api/v1/backups/delete"""
+        if not self.fake.bulk_delete:
+            return self.send_json({'status': 'FAILED', 'error': 'Not Found'},
+                                  code=404)
+        deleted = []
+        errors = {}
+        for backup_id in self.form['ids'].split(','):
+            backup = self.fake.delete_backup(int(backup_id))
+            if backup is None:
+                errors[backup_id] = 'Not Found'
+            else:
+                deleted.append({'id': backup['id'], 'size': backup['size']})
+        return self.send_json({'status': 'OK', 'deleted': deleted,
+                               'errors': errors})
+
+    def handle_batch(self):
+        """POST /api/v1/batch"""
+        if not self.fake.batch:
+            return self.send_json({'status': 'FAILED', 'error': 'Not Found'},
+                                  code=404)
+        self.captured = []
+        try:
+            for item in self.form['requests']:
+                self.query = dict((key, unicode(value)) for key, value
+                                  in (item.get('params') or {}).iteritems())
+                self.form = dict((key, unicode(value)) for key, value
+                                 in (item.get('data') or {}).iteritems())
+                self._route(item['method'], item['path'])
+        finally:
+            responses, self.captured = self.captured, None
+        return self.send_json({'status': 'OK', 'responses': responses})
+
+    def handle_logs(self):
+        """GET /api/v1/logs"""
+        limit = int(self.query.get('limit', 7))
+        with self.fake.condition:
+            bundles = list(reversed(self.fake.log_bundles))
+        self.send_json({'status': 'OK', 'logs': bundles[:limit]})
+
+    def handle_log_bundle(self, bundle_id):
+        """GET /api/v1/logs/<id>"""
+        with self.fake.condition:
+            bundles = [bundle for bundle in self.fake.log_bundles
+                       if bundle['id'] == int(bundle_id)]
+        if not bundles:
+            return self.send_json({'status': 'FAILED', 'error': 'Not Found'},
+                                  code=404)
+        data = {'status': 'OK'}
+        data.update(bundles[0])
+        return self.send_json(data)
+
+    def handle_system(self):
+        """GET /api/v1/system (with ETag support)"""
+        with self.fake.condition:
+            data = dict(self.fake.system)
+            etag = '"{0}"'.format(self.fake.system_version)
+        if self.headers.get('If-None-Match') == etag:
+            return self.send_empty(304, headers={'ETag': etag})
+        data['status'] = 'OK'
+        return self.send_json(data, headers={'ETag': etag})
+
+    def handle_system_update(self):
+        """POST /api/v1/system"""
+        self.fake.update_system(self.form)
+        self.send_json({'status': 'OK'})
+
+    def handle_system_get(self, key):
+        """GET /api/v1/system/<key>"""
+        with self.fake.condition:
+            value = self.fake.system[key]
+        self.send_json({'status': 'OK', 'value': value})
+
+    def handle_system_save(self, key):
+        """POST /api/v1/system/<key>"""
+        self.fake.update_system({key: self.form['value']})
+        self.send_json({'status': 'OK'})
+
+
+# recorded in place of secrets
+REDACTED = 'REDACTED'
+# request parameters whose values are not recorded
+SECRET_PARAMS = frozenset(['password'])
+# headers whose cookie values are not recorded (and their separator)
+COOKIE_HEADERS = {'cookie': ';', 'set-cookie': ','}
+
+def _redact_body(request):
+    """Return the body of `request` as recorded (None if not a string)."""
+    body = request.body
+    if body is None or not isinstance(body, basestring):
+        return None
+    content_type = request.headers.get('Content-Type', '')
+    if content_type.startswith('application/x-www-form-urlencoded'):
+        params = urlparse.parse_qsl(body, keep_blank_values=True)
+        if any(name in SECRET_PARAMS for name, _ in params):
+            body = urlencode([(name, REDACTED if name in SECRET_PARAMS
+                               else value) for name, value in params])
+    return body
+
+def _redact_headers(headers):
+    """Return the headers as recorded: cookie values are replaced (their
+    names and attributes are kept)."""
+    result = {}
+    for name, value in headers.iteritems():
+        separator = COOKIE_HEADERS.get(name.lower())
+        if separator is not None:
+            pattern = r'(^|{0}\s*)([^=;,\s]+)=[^;,]*'.format(separator)
+            value = re.sub(pattern, r'\1\2=' + REDACTED, value)
+        result[name] = value
+    return result
+
+def _encode(data):
+    """Return `data` (bytes) as recorded text and its encoding: 'utf-8',
+    or 'base64' for binary data."""
+    if isinstance(data, unicode):
+        return data, 'utf-8'
+    try:
+        return data.decode('utf-8'), 'utf-8'
+    except UnicodeDecodeError:
+        return base64.b64encode(data), 'base64'
+
+def _decode(text, encoding):
+    """The inverse of _encode()."""
+    if encoding == 'base64':
+        return base64.b64decode(text)
+    return text.encode('utf-8')
+
+
+class RecordingAdapter(BaseAdapter):
+    """ A transport adapter that records every exchange to a file.
+
+    Passwords and cookie values are redacted and binary content is
+    base64-encoded, so recordings may be shared.  A replayed login still
+    sets the (redacted) auth_tkt cookie.
+
+    :param path: the file the exchanges are appended to (one JSON object
+      per line)
+    :type path: str
+    :param adapter: the adapter performing the requests
+    :type adapter: requests.adapters.BaseAdapter
+    """
+
+    def __init__(self, path, adapter=None):
+        super(RecordingAdapter, self).__init__()
+        self.path = path
+        self.adapter = adapter or HTTPAdapter()
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs): # pylint: disable=arguments-differ
+        response = self.adapter.send(request, **kwargs)
+        body = _redact_body(request)
+        if body is not None:
+            body, body_encoding = _encode(body)
+        else:
+            body_encoding = None
+        content, encoding = _encode(response.content)
+        exchange = {
+            'method': request.method,
+            'url': request.url,
+            'body': body,
+            'body_encoding': body_encoding,
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': _redact_headers(response.headers),
+            'content': content,
+            'encoding': encoding,
+        }
+        with self._lock:
+            with open(self.path, 'a') as handle:
+                handle.write(json.dumps(exchange) + '\n')
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+class _ReplayHeaders(object):
+    """The minimal httplib.HTTPMessage interface used for cookies."""
+
+    def __init__(self, headers):
+        self.headers = headers
+
+    def getheaders(self, name):
+        """Python 2 interface."""
+        return [value for key, value in self.headers.iteritems()
+                if key.lower() == name.lower()]
+
+    def get_all(self, name, default=None):
+        """Python 3 interface."""
+        return self.getheaders(name) or default
+
+
+class _ReplayRaw(object):
+    """Stand-in for the urllib3 response of a replayed exchange."""
+
+    def __init__(self, headers):
+        self._original_response = self
+        self.msg = _ReplayHeaders(headers)
+
+    def release_conn(self):
+        """Nothing to release."""
+        pass
+
+
+class ReplayAdapter(BaseAdapter):
+    """ A transport adapter that replays exchanges recorded by a
+    RecordingAdapter without any network access.
+
+    Requests are matched by method and URL; exchanges for the same request
+    are replayed in the order they were recorded.
+
+    :param path: the file written by RecordingAdapter
+    :type path: str
+    :raises: IOError
+    """
+
+    def __init__(self, path):
+        super(ReplayAdapter, self).__init__()
+        self.exchanges = {}
+        with open(path) as handle:
+            exchanges = [json.loads(line) for line in handle if line.strip()]
+        for exchange in exchanges:
+            key = (exchange['method'], exchange['url'])
+            self.exchanges.setdefault(key, deque()).append(exchange)
+
+    # pylint: disable=arguments-differ,unused-argument
+    def send(self, request, **kwargs):
+        key = (request.method, request.url)
+        try:
+            exchange = self.exchanges[key].popleft()
+        except (KeyError, IndexError):
+            fmt = "No recorded response for {0} {1}"
+            raise PaletteError(fmt.format(request.method, request.url))
+        response = Response()
+        response.status_code = exchange['status']
+        response.reason = exchange['reason']
+        response.headers = CaseInsensitiveDict(exchange['headers'])
+        # pylint: disable=protected-access
+        response._content = _decode(exchange['content'],
+                                    exchange.get('encoding', 'utf-8'))
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.raw = _ReplayRaw(exchange['headers'])
+        response.encoding = 'utf-8'
+        extract_cookies_to_jar(response.cookies, request, response.raw)
+        return response
+
+    def close(self):
+        pass
+
+
+def _mount(server, adapter):
+    server.session.mount('http://', adapter)
+    server.session.mount('https://', adapter)
+    return adapter
+
+def record(server, path):
+    """Record all traffic of `server` (a PaletteServer) to `path`.
+
+    :returns: the RecordingAdapter
+    """
+    return _mount(server, RecordingAdapter(path,
+                                           server.session.get_adapter(
+                                               server.url)))
+
+def replay(server, path):
+    """Replay the traffic recorded in `path` for `server`.
+
+    :returns: the ReplayAdapter
+    """
+    return _mount(server, ReplayAdapter(path))
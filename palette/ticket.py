@@ -0,0 +1,130 @@
+""" An on-disk cache of authentication tickets shared between processes.
+
+>>> server = palette.connect(URL, ticket_cache=True)
+
+The first process logs in and stores its ticket; later processes (for the
+same URL and username) reuse it without contacting the login endpoint.
+A rejected ticket is replaced transparently by logging in again.
+
+The cache file is only readable by its owner and is locked while it is
+read or written so concurrent processes do not lose each other's updates.
+If the cache cannot be used (e.g. its directory is not writable), a warning
+is logged and the servers authenticate without it.
+"""
+from __future__ import absolute_import
+
+import os
+import json
+import time
+import errno
+import tempfile
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError: # pragma: no cover (Windows)
+    fcntl = None
+
+from . import logger
+
+DEFAULT_PATH = '~/.palette_tickets'
+
+class TicketCache(object):
+    """ A file mapping (url, username) to an authentication ticket.
+
+    :param path: the cache file (default: ~/.palette_tickets)
+    :type path: str
+    :param max_age: seconds a ticket is used for (None = until rejected)
+    :type max_age: float
+    """
+
+    def __init__(self, path=None, max_age=None):
+        if path is None:
+            path = DEFAULT_PATH
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.max_age = max_age
+
+    def __repr__(self):
+        return '<TicketCache {0}>'.format(self.path)
+
+    @staticmethod
+    def _key(url, username):
+        return url.rstrip('/') + ' ' + username
+
+    def get(self, url, username):
+        """Return the cached ticket or None."""
+        try:
+            with self._locked(fcntl.LOCK_SH if fcntl else None):
+                entry = self._read().get(self._key(url, username))
+        except (IOError, OSError) as ex:
+            logger.warning("Cannot read ticket cache '%s': %s", self.path, ex)
+            return None
+        if entry is None:
+            return None
+        if self.max_age is not None \
+                and time.time() - entry.get('created', 0) > self.max_age:
+            return None
+        return entry.get('auth_tkt')
+
+    def set(self, url, username, ticket):
+        """Store (or with ticket=None, remove) the ticket."""
+        key = self._key(url, username)
+        try:
+            with self._locked(fcntl.LOCK_EX if fcntl else None):
+                data = self._read()
+                if ticket is None:
+                    if data.pop(key, None) is None:
+                        return
+                else:
+                    data[key] = {'auth_tkt': ticket, 'created': time.time()}
+                self._write(data)
+        except (IOError, OSError) as ex:
+            logger.warning("Cannot update ticket cache '%s': %s",
+                           self.path, ex)
+
+    def discard(self, url, username):
+        """Remove the ticket from the cache."""
+        self.set(url, username, None)
+
+    @contextmanager
+    def _locked(self, operation):
+        """Hold a lock on the sidecar lock file (no-op without fcntl)."""
+        if operation is None:
+            yield
+            return
+        descriptor = os.open(self.path + '.lock', os.O_RDWR | os.O_CREAT,
+                             0o600)
+        try:
+            fcntl.flock(descriptor, operation)
+            yield
+        finally:
+            os.close(descriptor)
+
+    def _read(self):
+        try:
+            with open(self.path) as handle:
+                data = json.load(handle)
+        except IOError as ex:
+            if ex.errno != errno.ENOENT:
+                logger.warning("Cannot read ticket cache '%s': %s",
+                               self.path, ex)
+            return {}
+        except ValueError:
+            logger.warning("Ignoring corrupt ticket cache '%s'", self.path)
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _write(self, data):
+        # write a private temporary file and rename it over the cache so
+        # readers never see a partial file.
+        dirname = os.path.dirname(self.path)
+        descriptor, tmp = tempfile.mkstemp(prefix='.palette_tickets',
+                                           dir=dirname)
+        try:
+            with os.fdopen(descriptor, 'w') as handle:
+                json.dump(data, handle)
+            os.chmod(tmp, 0o600)
+            os.rename(tmp, self.path)
+        except Exception:
+            os.unlink(tmp)
+            raise
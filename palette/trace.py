@@ -0,0 +1,181 @@
+""" Request tracing and latency statistics.
+
+Every request made by a PaletteServer produces a :class:`Span` which is
+passed to each hook registered with ``server.add_hook(func)`` and is
+aggregated into per-endpoint latency histograms:
+
+>>> server.add_hook(lambda span: statsd.timing(span.endpoint, span.elapsed))
+>>> server.stats()['GET /api/v1/state']['p95']
+0.0042
+"""
+import re
+import time
+import bisect
+import threading
+
+# Path templates used to group requests by endpoint.
+ENDPOINT_PATTERNS = [
+    (re.compile(r'^(/api/v\d+/backups)/\d+$'), r'\1/{id}'),
+    (re.compile(r'^(/api/v\d+/system)/[^/]+$'), r'\1/{key}'),
+]
+
+def endpoint_path(path):
+    """Return the path template of `path` e.g. /api/v1/backups/{id}"""
+    path = path.split('?', 1)[0]
+    for pattern, template in ENDPOINT_PATTERNS:
+        if pattern.match(path):
+            return pattern.sub(template, path)
+    return path
+
+
+class Span(object): # pylint: disable=too-many-instance-attributes
+    """ The record of one HTTP request.
+
+    :ivar method: the HTTP method
+    :ivar path: the path info of the request e.g. /api/v1/state
+    :ivar status: the HTTP status code (None if no response was received)
+    :ivar bytes: the size of the response body
+    :ivar retries: the number of times the request was retried
+    :ivar start: when the request started (seconds since the epoch)
+    :ivar elapsed: the wall time of the request (including decoding)
+    :ivar decode_time: the time spent decoding the JSON response
+    :ivar error: the exception raised by the request (or None)
+    """
+    __slots__ = ('method', 'path', 'status', 'bytes', 'retries', 'start',
+                 'elapsed', 'decode_time', 'error')
+
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.status = None
+        self.bytes = 0
+        self.retries = 0
+        self.start = time.time()
+        self.elapsed = None
+        self.decode_time = 0.0
+        self.error = None
+
+    def __repr__(self):
+        return '<Span {0} {1} status={2} elapsed={3}>'.format(
+            self.method, self.path, self.status, self.elapsed)
+
+    @property
+    def endpoint(self):
+        """The method and path template e.g. 'GET /api/v1/backups/{id}'"""
+        return self.method + ' ' + endpoint_path(self.path)
+
+    def finish(self, response=None, error=None):
+        """Record the response (or error) and the elapsed time."""
+        if response is not None:
+            self.status = response.status_code
+            if response._content_consumed: # pylint: disable=protected-access
+                self.bytes = len(response.content or '')
+        self.error = error
+        self.elapsed = time.time() - self.start
+
+
+class LatencyHistogram(object):
+    """ A histogram of latencies with exponentially sized buckets.
+
+    Percentiles are estimated from the bucket boundaries, which are
+    about 19% apart, from 0.5ms up to about two minutes.
+    """
+    BOUNDS = tuple(0.0005 * 2 ** (index / 4.0) for index in xrange(73))
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        """Add one observation (seconds)."""
+        self.counts[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, percent):
+        """Estimate the given percentile (0-100) or None if empty."""
+        if not self.count:
+            return None
+        rank = percent / 100.0 * self.count
+        total = 0
+        for index, count in enumerate(self.counts):
+            total += count
+            if total >= rank and count:
+                if index < len(self.BOUNDS):
+                    return min(self.BOUNDS[index], self.max)
+                return self.max
+        return self.max
+
+    def copy(self):
+        """Return an independent copy of the histogram."""
+        result = LatencyHistogram()
+        result.counts = list(self.counts)
+        result.count = self.count
+        result.sum = self.sum
+        result.max = self.max
+        return result
+
+    def buckets(self):
+        """Return the cumulative (upper bound, count) pairs, e.g. for
+        exporting to a metrics system.  The last bound is infinity."""
+        result = []
+        total = 0
+        for bound, count in zip(self.BOUNDS + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class LatencyStats(object):
+    """ A span hook keeping a LatencyHistogram per endpoint. """
+
+    PERCENTILES = (50, 95, 99)
+
+    def __init__(self):
+        self.histograms = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, span):
+        endpoint = span.endpoint
+        with self._lock:
+            histogram = self.histograms.get(endpoint)
+            if histogram is None:
+                histogram = self.histograms[endpoint] = LatencyHistogram()
+                self.errors[endpoint] = 0
+            histogram.add(span.elapsed)
+            if span.error is not None or (span.status or 0) >= 400:
+                self.errors[endpoint] += 1
+
+    def summary(self):
+        """Return a mapping of endpoint to a dict with the keys 'count',
+        'errors', 'sum', 'max', 'p50', 'p95' and 'p99' (seconds)."""
+        result = {}
+        with self._lock:
+            for endpoint, histogram in self.histograms.iteritems():
+                data = {'count': histogram.count,
+                        'errors': self.errors[endpoint],
+                        'sum': histogram.sum,
+                        'max': histogram.max}
+                for percent in self.PERCENTILES:
+                    key = 'p{0}'.format(percent)
+                    data[key] = histogram.percentile(percent)
+                result[endpoint] = data
+        return result
+
+    def snapshot(self):
+        """Return a list of (endpoint, histogram, errors) sorted by endpoint,
+        copied so that they do not change while being exported."""
+        with self._lock:
+            return sorted((endpoint, histogram.copy(), self.errors[endpoint])
+                          for endpoint, histogram
+                          in self.histograms.iteritems())
+
+    def reset(self):
+        """Discard all observations."""
+        with self._lock:
+            self.histograms = {}
+            self.errors = {}
@@ -0,0 +1,149 @@
+""" Notification of environment state changes.
+
+A :class:`StateWatcher` long-polls the 'state' endpoint when the server
+supports it.  Otherwise it polls with an adaptive interval: quickly while
+the environment is in transition (e.g. STOPPING) and progressively slower
+while it is stable.
+"""
+from __future__ import absolute_import
+
+import time
+import threading
+from collections import namedtuple
+
+from . import logger, decoder
+from .internal import Backoff, JsonKeys, SETTLED_STATES, raise_for_json
+
+# long polling: the number of seconds the server is asked to wait
+LONG_POLL_WAIT = 30
+
+class StateChange(namedtuple('StateChange',
+                             ['previous', 'state', 'timestamp'])):
+    """A transition of the environment from `previous` to `state` observed
+    at `timestamp` (seconds since the epoch)."""
+    __slots__ = ()
+
+
+class StateWatcher(object):
+    """ An iterator yielding a :class:`StateChange` for each transition.
+
+    :param server: The server instance
+    :type server: PaletteServer
+    :param min_interval: the polling interval during transitions (seconds)
+    :type min_interval: float
+    :param max_interval: the polling interval when stable (seconds)
+    :type max_interval: float
+    :param long_poll: try long polling first
+    :type long_poll: bool
+    :param wait: the number of seconds per long poll request
+    :type wait: float
+
+    :ivar state: the current state (None before the first request)
+    """
+    # pylint: disable=too-many-arguments
+
+    def __init__(self, server, min_interval=1.0, max_interval=30.0,
+                 long_poll=True, wait=LONG_POLL_WAIT):
+        self.server = server
+        self.backoff = Backoff(min_interval, max_interval)
+        self.long_poll = long_poll
+        self.wait = wait
+        self.state = None
+        self._closed = threading.Event()
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        """Wait for the next state transition.
+
+        :returns: StateChange
+        :raises: StopIteration (once closed), HTTPError
+        """
+        if self.state is None:
+            self.state = self._fetch(None)
+        while not self._closed.is_set():
+            if self.long_poll:
+                state = self._fetch(self.state)
+            else:
+                if self.state in SETTLED_STATES:
+                    interval = self.backoff.next()
+                else:
+                    self.backoff.reset()
+                    interval = self.backoff.next()
+                self._closed.wait(interval)
+                if self._closed.is_set():
+                    break
+                state = self._fetch(None)
+            if state != self.state:
+                change = StateChange(self.state, state, time.time())
+                self.state = state
+                self.backoff.reset()
+                return change
+        raise StopIteration()
+
+    __next__ = next
+
+    def close(self):
+        """Stop watching: iteration ends after the current request."""
+        self._closed.set()
+
+    def _fetch(self, known):
+        """Return the state, long polling if `known` is set."""
+        if known is None:
+            return self.server.state
+        params = {'wait': self.wait, 'state': known}
+        timeout = self.wait + (self.server.timeout or 0) + 5
+        start = time.time()
+        # pylint: disable=protected-access
+        res, _ = self.server._send('GET', self.server.STATE_PATH_INFO,
+                                   params=params, timeout=timeout,
+                                   record=False)
+        res.raise_for_status()
+        data = decoder.loads(res.content)
+        raise_for_json(data, required=JsonKeys.STATE)
+        state = data[JsonKeys.STATE]
+        if state == known and time.time() - start < self.wait / 2.0:
+            # the server answered immediately: no long polling support.
+            logger.debug("Long polling is not supported by '%s'",
+                         self.server.url)
+            self.long_poll = False
+        return state
+
+
+class StateSubscription(object):
+    """ Run a StateWatcher in a daemon thread and call `callback` with
+    each :class:`StateChange`.  Errors are passed to `on_error` (if
+    given) and watching continues after `retry` seconds.
+
+    Any additional keyword arguments are passed to StateWatcher.
+    """
+
+    def __init__(self, server, callback, on_error=None, retry=30, **kwargs):
+        self.watcher = StateWatcher(server, **kwargs)
+        self.callback = callback
+        self.on_error = on_error
+        self.retry = retry
+        self.thread = threading.Thread(target=self._run,
+                                       name='palette-state-watcher')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def cancel(self):
+        """Stop the subscription."""
+        self.watcher.close()
+
+    def _run(self):
+        # pylint: disable=protected-access
+        closed = self.watcher._closed
+        while not closed.is_set():
+            try:
+                for change in self.watcher:
+                    self.callback(change)
+            except Exception as ex: # pylint: disable=broad-except
+                if self.on_error is not None:
+                    self.on_error(ex)
+                else:
+                    logger.warning("State watch of '%s' failed: %s",
+                                   self.watcher.server.url, ex)
+                closed.wait(self.retry)
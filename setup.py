@@ -16,5 +16,7 @@ setup(name=name,
       maintainer_email=package.__email__,
       include_package_data=True,
       install_requires = ['requests'],
+      extras_require = {'fast': ['ujson']},
+      entry_points = {'console_scripts': ['palette = palette.cli:main']},
       packages=find_packages()
 )
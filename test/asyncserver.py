@@ -0,0 +1,40 @@
+import os
+import sys
+import tempfile
+import unittest
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if not path in sys.path:
+    sys.path.insert(0, path)
+
+import palette
+
+from support import URL, CREDENTIALS, FAKES
+
+class TestAsyncServer(unittest.TestCase):
+    """ See support.py for the server used by these tests."""
+    def setUp(self):
+        self.server = palette.connect_async(URL, **CREDENTIALS).result()
+    def tearDown(self):
+        self.server.close()
+    def test_state(self):
+        self.assertIsNotNone(self.server.state.result())
+    def test_query(self):
+        futures = [self.server.Backup.list_all(limit=1),
+                   self.server.System.list_all()]
+        for future in palette.executor.as_completed(futures, timeout=60):
+            self.assertTrue(future.result())
+    @unittest.skipUnless(FAKES, 'uploads random data')
+    def test_restore_progress(self):
+        with tempfile.NamedTemporaryFile(suffix='.tsbak') as handle:
+            handle.write(os.urandom(1000))
+            handle.flush()
+            progress = []
+            future = self.server.restore(
+                handle.name, progress=lambda sent, total:
+                progress.append((sent, total)))
+            future.result(timeout=60)
+        self.assertEqual(progress[-1], (1000, 1000))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,19 +7,116 @@ if not path in sys.path:
     sys.path.insert(0, path)
 
 import palette
+from palette.decoder import ArrayStream
+from palette.error import PaletteError
+from palette.testing import FakePaletteServer
 
-URL = 'http://localhost:8080'
+from support import URL, CREDENTIALS, FAKES
 
 class TestBackup(unittest.TestCase):
-    """ These tests assume a valid ~/.palette file."""
+    """ See support.py for the server used by these tests."""
     def setUp(self):
-        self.server = palette.connect(URL)
+        self.server = palette.connect(URL, **CREDENTIALS)
     def test_backup(self):
         self.server.backup()
     def test_query(self):
         backups = self.server.Backup.list_all(limit=3)
         self.assertTrue(backups)
         self.assertTrue(self.server.Backup.get(backups[0].unique_id))
+    def test_iter_all(self):
+        ids = [backup.unique_id
+               for backup in self.server.Backup.iter_all(page_size=2)]
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(ids, sorted(ids, reverse=True))
+    def test_iter_all_in_pool(self):
+        # every worker of the default pool waits on a prefetched page
+        pool = palette.executor.default_pool()
+        futures = [pool.submit(list, self.server.Backup.iter_all(page_size=2))
+                   for _ in xrange(pool.max_workers)]
+        for future in palette.executor.as_completed(futures, timeout=60):
+            self.assertTrue(future.result())
+    def test_cursor_ignored(self):
+        # a server that ignores the cursor must not be paged forever
+        with FakePaletteServer(backups=150) as fake:
+            server = palette.connect(fake.url, username=fake.username,
+                                     password=fake.password)
+            list_backups = fake.list_backups
+            fake.list_backups = lambda limit, desc, cursor=None: \
+                list_backups(limit=limit, desc=desc)
+            backups = server.Backup.iter_all(page_size=2)
+            self.assertRaises(PaletteError, list, backups)
+            # (nothing is prefetched after the repeated page)
+            self.assertEqual(fake.requests['/api/v1/backups'], 2)
+    def test_compact(self):
+        backups = self.server.Backup.list_all(limit=3)
+        records = self.server.Backup.list_all(limit=3, compact=True)
+        self.assertEqual(backups, records)
+        self.assertEqual(records[0].creation_time,
+                         records[0]['creation-time'])
+    def test_array_stream(self):
+        body = '{"status": "OK", "backups": [{"id": 10}, {"id": 9}], "n": 12}'
+        stream = ArrayStream(iter(body), 'backups')
+        self.assertEqual(list(stream), [{'id': 10}, {'id': 9}])
+        self.assertEqual(stream.members, {'status': 'OK', 'n': 12})
+        # values split across chunks
+        body = ('{"status": "OK", "note": "a \\"}]\\\\", "backups": '
+                '[{"id": 2, "tags": ["x]", "{y"], "n": null}, 1.5]}')
+        for size in (1, 2, 3, 7):
+            chunks = [body[i:i + size] for i in xrange(0, len(body), size)]
+            stream = ArrayStream(iter(chunks), 'backups')
+            self.assertEqual(list(stream), [{'id': 2, 'tags': ['x]', '{y'],
+                                             'n': None}, 1.5])
+            self.assertEqual(stream.members['note'], 'a "}]\\')
+        # a large element is decoded once, not after every chunk
+        item = {'files': ['f' * 100] * 20000}
+        body = palette.decoder.json.dumps({'backups': [item]})
+        chunks = [body[i:i + 1024] for i in xrange(0, len(body), 1024)]
+        self.assertEqual(list(ArrayStream(iter(chunks), 'backups')), [item])
+        failed = '{"status": "FAILED", "error": "x", "backups": [{"id": 1}]}'
+        stream = ArrayStream(iter(failed), 'backups',
+                             before=palette.server.raise_for_json)
+        self.assertRaises(PaletteError, list, stream)
+
+@unittest.skipUnless(FAKES, 'deletes backups')
+class TestDeleteBackups(unittest.TestCase):
+    """ Each test deletes the backups of its own FakePaletteServer."""
+    def _check_delete_many(self, bulk_delete):
+        with FakePaletteServer(backups=150, bulk_delete=bulk_delete) as fake:
+            server = palette.connect(fake.url, username=fake.username,
+                                     password=fake.password)
+            sizes = dict((b['id'], b['size']) for b in fake.backups)
+            doomed = range(1, 121) + [999]
+            result = server.Backup.delete_many(doomed)
+            self.assertEqual(sorted(result.deleted), range(1, 121))
+            self.assertEqual(result.reclaimed,
+                             sum(sizes[i] for i in range(1, 121)))
+            self.assertEqual(result.errors.keys(), [999])
+            self.assertFalse(result.ok)
+            self.assertRaises(PaletteError, result.raise_for_errors)
+            self.assertEqual(len(fake.backups), 30)
+            return fake.requests
+    def test_delete_many_bulk(self):
+        requests = self._check_delete_many(bulk_delete=True)
+        self.assertEqual(requests['/api/v1/backups/delete'], 2)
+    def test_delete_many_single(self):
+        requests = self._check_delete_many(bulk_delete=False)
+        self.assertEqual(requests['/api/v1/backups/delete'], 1)
+        self.assertEqual(requests['/api/v1/backups/999'], 1)
+    def test_prune(self):
+        with FakePaletteServer(backups=48) as fake:
+            server = palette.connect(fake.url, username=fake.username,
+                                     password=fake.password)
+            self.assertRaises(ValueError, server.Backup.prune)
+            result = server.Backup.prune(keep_last=40, dry_run=True)
+            self.assertEqual(result.deleted, range(8, 0, -1))
+            self.assertEqual(len(fake.backups), 48)
+            # the backups are an hour apart, the oldest is 48 hours old
+            result = server.Backup.prune(older_than=60 * 3600)
+            self.assertEqual(result.deleted, [])
+            result = server.Backup.prune(keep_last=30, older_than=23.5 * 3600)
+            self.assertTrue(result.ok)
+            self.assertEqual(len(result.deleted), 18)
+            self.assertEqual(len(fake.backups), 30)
 
 if __name__ == '__main__':
     unittest.main()
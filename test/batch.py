@@ -0,0 +1,78 @@
+import os
+import sys
+import unittest
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if not path in sys.path:
+    sys.path.insert(0, path)
+
+import palette
+from palette.testing import FakePaletteServer
+
+from support import URL, CREDENTIALS, FAKES
+
+class TestBatch(unittest.TestCase):
+    """ See support.py for the server used by these tests."""
+    def setUp(self):
+        self.server = palette.connect(URL, **CREDENTIALS)
+    def _refresh(self, server):
+        with server.batch() as batch:
+            state = batch.state
+            retain = batch.System.get('backup-auto-retain-count')
+            latest = batch.Backup.list_all(limit=1)
+            system = batch.get('/api/v1/system')
+        self.assertEqual(state.result(), server.state)
+        self.assertEqual(retain.result(),
+                         server.System.get('backup-auto-retain-count'))
+        self.assertEqual(latest.result(), server.Backup.list_all(limit=1))
+        self.assertTrue(latest.result()[0].server is server)
+        self.assertIn('backup-auto-retain-count', system.result())
+    def test_batch(self):
+        before = FAKES[0].requests.get('/api/v1/state', 0) if FAKES else 0
+        self._refresh(self.server)
+        if FAKES:
+            self.assertTrue(self.server.batch_endpoint)
+            # one request for the batch, one for the check above
+            self.assertEqual(FAKES[0].requests['/api/v1/state'], before + 1)
+    def test_errors(self):
+        with self.server.batch() as batch:
+            missing = batch.System.get('no-such-key')
+            state = batch.state
+        self.assertRaises(Exception, missing.result)
+        self.assertTrue(state.result())
+    def test_cancel(self):
+        try:
+            with self.server.batch() as batch:
+                state = batch.state
+                raise KeyError()
+        except KeyError:
+            pass
+        self.assertTrue(state.cancelled())
+    @unittest.skipUnless(FAKES, 'uses its own fake server')
+    def test_fallback(self):
+        with FakePaletteServer(batch=False) as fake:
+            server = palette.connect(fake.url, username=fake.username,
+                                     password=fake.password)
+            self._refresh(server)
+            self.assertFalse(server.batch_endpoint)
+            self.assertEqual(fake.requests['/api/v1/batch'], 1)
+    @unittest.skipUnless(FAKES, 'uses its own fake server')
+    def test_many_calls(self):
+        with FakePaletteServer() as fake:
+            server = palette.connect(fake.url, username=fake.username,
+                                     password=fake.password)
+            value = fake.system['socket-timeout']
+            # more calls than workers: one round per MAX_WORKERS calls
+            with server.batch() as batch:
+                values = [batch.System.get('socket-timeout')
+                          for _ in xrange(3 * palette.batch.MAX_WORKERS)]
+                saved = batch.post('/api/v1/system', idempotent=True,
+                                   data={'socket-timeout': value + 1})
+            self.assertEqual([future.result() for future in values],
+                             [value] * len(values))
+            self.assertIsNotNone(saved.result())
+            self.assertEqual(fake.system['socket-timeout'], value + 1)
+            self.assertEqual(fake.requests['/api/v1/batch'], 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import sys
+import time
+import unittest
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if not path in sys.path:
+    sys.path.insert(0, path)
+
+import palette
+from palette.catalog import BackupCatalog, parse_time
+
+from support import URLS, CREDENTIALS, FAKES
+
+class TestCatalog(unittest.TestCase):
+    """ See support.py for the servers used by these tests."""
+    def setUp(self):
+        self.servers = [palette.connect(url, **CREDENTIALS) for url in URLS]
+        self.catalog = BackupCatalog()
+    def tearDown(self):
+        self.catalog.close()
+    def test_sync(self):
+        added = self.catalog.sync(*self.servers)
+        self.assertEqual(self.catalog.count(), added)
+        self.assertEqual(self.catalog.sync(*self.servers), 0)
+        summary = self.catalog.summary()
+        self.assertEqual(sorted(summary), sorted(URLS))
+        for url, data in summary.iteritems():
+            self.assertEqual(data['count'], self.catalog.count(server=url))
+            self.assertEqual(data['total_size'],
+                             self.catalog.total_size(server=url))
+    @unittest.skipUnless(FAKES, 'creates backups')
+    def test_incremental(self):
+        server = self.servers[0]
+        self.catalog.sync(server)
+        FAKES[0].add_backup()
+        self.assertEqual(self.catalog.sync(server), 1)
+        newest = self.catalog.query(server=server, limit=1)[0]
+        self.assertEqual(newest.unique_id, FAKES[0].backups[-1]['id'])
+        self.assertTrue(newest.server is server)
+        FAKES[0].backups.pop()
+        self.catalog.sync(server, full=True)
+        self.assertEqual(self.catalog.count(server=server),
+                         len(FAKES[0].backups))
+    def test_query(self):
+        self.catalog.sync(*self.servers)
+        largest = self.catalog.query(order_by='size', limit=3)
+        sizes = [backup.size for backup in largest]
+        self.assertEqual(sizes, sorted(sizes, reverse=True))
+        self.assertEqual(self.catalog.count(since=time.time() + 60), 0)
+        self.assertEqual(self.catalog.count(older_than=0),
+                         self.catalog.count())
+    def test_parse_time(self):
+        self.assertEqual(parse_time('1970-01-02T00:00:01.5Z'), 86401.5)
+        self.assertIsNone(parse_time('yesterday'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from StringIO import StringIO
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if not path in sys.path:
+    sys.path.insert(0, path)
+
+from palette import cli
+from palette.agent import Agent
+
+from support import URL, CREDENTIALS, FAKES
+
+def palette(*argv):
+    """Run the 'palette' command, return (exit status, output)."""
+    args = ['--url', URL]
+    for key, value in CREDENTIALS.iteritems():
+        args.extend(['--' + key, value])
+    stdout, sys.stdout = sys.stdout, StringIO()
+    stderr, sys.stderr = sys.stderr, StringIO()
+    try:
+        status = cli.main(args + list(argv))
+        return status, sys.stdout.getvalue()
+    finally:
+        sys.stdout = stdout
+        sys.stderr = stderr
+
+class TestCommandLine(unittest.TestCase):
+    """ See support.py for the server used by these tests."""
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.socket = os.path.join(self.tmpdir, 'agent.sock')
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+    def _check_commands(self):
+        status, out = palette('--socket', self.socket, 'state')
+        self.assertEqual(status, 0)
+        self.assertTrue(out.strip())
+        status, out = palette('--socket', self.socket, 'system', 'get',
+                              'socket-timeout')
+        self.assertEqual((status, out), (0, '60\n'))
+        status, out = palette('--socket', self.socket, 'backups',
+                              '--limit', '2')
+        self.assertEqual(status, 0)
+        self.assertEqual(len(json.loads(out)), 2)
+        status, _ = palette('--socket', self.socket, 'system', 'get')
+        self.assertEqual(status, 1)
+    def test_direct(self):
+        self._check_commands()
+    def test_agent(self):
+        agent = Agent(self.socket)
+        thread = threading.Thread(target=agent.run)
+        thread.daemon = True
+        thread.start()
+        try:
+            logins = FAKES[0].requests.get('/login/authenticate', 0) if FAKES \
+                else 0
+            self._check_commands()
+            self.assertEqual(len(agent.servers), 1)
+            if FAKES:
+                self.assertEqual(FAKES[0].requests['/login/authenticate'],
+                                 logins + 1)
+            self.assertRaises(Exception, Agent, self.socket)
+        finally:
+            self.assertEqual(cli.main(['--socket', self.socket, 'agent',
+                                       '--stop']), 0)
+            thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(os.path.exists(self.socket))
+    def test_agent_path_not_socket(self):
+        with open(self.socket, 'w') as handle:
+            handle.write('data')
+        self.assertRaises(Exception, Agent, self.socket)
+        with open(self.socket) as handle:
+            self.assertEqual(handle.read(), 'data')
+
+if __name__ == '__main__':
+    unittest.main()
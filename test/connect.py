@@ -1,5 +1,9 @@
 import os
 import sys
+import shutil
+import logging
+import tempfile
+import threading
 import unittest
 
 path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -7,14 +11,123 @@ if not path in sys.path:
     sys.path.insert(0, path)
 
 import palette
+from support import URL, CREDENTIALS, FAKES
 
 class TestConnectMethods(unittest.TestCase):
-    """ These tests assume a valid ~/.palette file."""
+    """ See support.py for the server used by these tests."""
     def test_basic(self):
-        palette.connect('HTTP://localhost:8080/')
+        palette.connect(URL.replace('http', 'HTTP', 1) + '/', **CREDENTIALS)
     def test_state(self):
-        server = palette.connect('http://localhost:8080')
+        server = palette.connect(URL, **CREDENTIALS)
         self.assertIsNotNone(server.state)
+    def test_session(self):
+        with palette.connect(URL, **CREDENTIALS) as server:
+            self.assertIsNotNone(server.auth_tkt)
+            self.assertIsNotNone(server.state)
+            self.assertIsNotNone(server.state)
+    def test_watch_state(self):
+        server = palette.connect(URL, **CREDENTIALS)
+        watcher = server.watch_state()
+        watcher.close()
+        self.assertRaises(StopIteration, next, watcher)
+        self.assertIsNotNone(watcher.state)
+    @unittest.skipUnless(FAKES, 'requires long polling')
+    def test_watch_state_spans(self):
+        spans = []
+        server = palette.connect(URL, **CREDENTIALS)
+        server.add_hook(spans.append)
+        watcher = server.watch_state(wait=1)
+        threading.Timer(0.5, watcher.close).start()
+        self.assertRaises(StopIteration, next, watcher)
+        # the long poll is not a sample of the state latency
+        self.assertEqual([span.endpoint for span in spans],
+                         ['GET /api/v1/state'])
+    def test_stats(self):
+        spans = []
+        server = palette.connect(URL, **CREDENTIALS)
+        server.add_hook(spans.append)
+        server.state
+        server.Backup.get(1)
+        server.remove_hook(spans.append)
+        server.state
+        self.assertEqual(len(spans), 2)
+        self.assertEqual(spans[0].method, 'GET')
+        self.assertEqual(spans[0].status, 200)
+        self.assertTrue(spans[0].bytes > 0)
+        self.assertEqual(spans[1].endpoint, 'GET /api/v1/backups/{id}')
+        stats = server.stats()
+        self.assertEqual(stats['GET /api/v1/state']['count'], 2)
+        self.assertEqual(stats['POST /login/authenticate']['count'], 1)
+        self.assertTrue(stats['GET /api/v1/state']['p99'] > 0)
+    def test_ticket_cache(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, 'tickets')
+            first = palette.connect(URL, ticket_cache=path, **CREDENTIALS)
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+            second = palette.connect(URL, ticket_cache=path, **CREDENTIALS)
+            self.assertEqual(second.auth_tkt, first.auth_tkt)
+            self.assertNotIn('POST /login/authenticate', second.stats())
+            # an invalid ticket is replaced transparently
+            second.auth_tkt = 'invalid'
+            self.assertIsNotNone(second.state)
+            self.assertNotEqual(second.auth_tkt, 'invalid')
+            self.assertEqual(
+                second.stats()['POST /login/authenticate']['count'], 1)
+            third = palette.connect(URL, ticket_cache=path, **CREDENTIALS)
+            self.assertEqual(third.auth_tkt, second.auth_tkt)
+            # an unusable cache is only a warning
+            path = os.path.join(tmpdir, 'missing', 'tickets')
+            server = palette.connect(URL, ticket_cache=path, **CREDENTIALS)
+            self.assertIsNotNone(server.state)
+            self.assertFalse(os.path.exists(path))
+        finally:
+            shutil.rmtree(tmpdir)
+    def test_debug_logging(self):
+        class Handler(logging.Handler):
+            def __init__(self):
+                logging.Handler.__init__(self)
+                self.messages = []
+            def emit(self, record):
+                self.messages.append(record.getMessage())
+        handler = Handler()
+        palette.logger.addHandler(handler)
+        palette.logger.setLevel(logging.DEBUG)
+        try:
+            server = palette.connect(URL, **CREDENTIALS)
+            server.Backup.list_all(limit=10)
+        finally:
+            palette.logger.removeHandler(handler)
+            palette.logger.setLevel(logging.NOTSET)
+        self.assertTrue(handler.messages)
+        if CREDENTIALS:
+            # the fake server has 10 backups
+            self.assertFalse([msg for msg in handler.messages
+                              if ": '" + CREDENTIALS['password'] in msg])
+            self.assertTrue([msg for msg in handler.messages
+                             if '7 more' in msg])
+        for msg in handler.messages:
+            self.assertTrue(len(msg) < palette.payload.LIMIT + 100)
+    def test_resources(self):
+        server = palette.connect(URL, **CREDENTIALS)
+        self.assertIs(server.System, server.System)
+        self.assertIs(server.System.get, server.System.get)
+        self.assertEqual(server.System.get('socket-timeout'),
+                         server.system['socket-timeout'])
+        self.assertRaises(AttributeError, getattr, server, 'NoSuchResource')
+        self.assertRaises(AttributeError, getattr, server.Backup, 'download')
+        class Echo(object):
+            @classmethod
+            def echo(cls, server, value):
+                return server.url, value
+        palette.server.register_resource('Echo', Echo)
+        try:
+            self.assertEqual(server.Echo.echo(1), (server.url, 1))
+            fleet = palette.PaletteFleet([server])
+            self.assertEqual(fleet.Echo.echo(2).results,
+                             {server: (server.url, 2)})
+        finally:
+            palette.internal._RESOURCES.pop('Echo')
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,121 @@
+import os
+import sys
+import time
+import urllib2
+import unittest
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if not path in sys.path:
+    sys.path.insert(0, path)
+
+from palette.exporter import FleetExporter, size_trend
+from palette.fleet import PaletteFleet
+from palette.testing import FakePaletteServer
+
+from support import FAKES
+
+def samples(text):
+    """Parse the text exposition into a dict of sample -> value."""
+    result = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            sample, value = line.rsplit(' ', 1)
+            result[sample] = float(value)
+    return result
+
+class TestExporter(unittest.TestCase):
+    def test_size_trend(self):
+        backups = [{'creation-time': '2015-09-{0:02d}T12:00:00.5Z'.format(day),
+                    'size': 1000000 + day * 86400} for day in (3, 2, 1)]
+        self.assertAlmostEqual(size_trend(backups), 1.0)
+        self.assertIsNone(size_trend(backups[:1]))
+
+@unittest.skipUnless(FAKES, 'changes the state')
+class TestFleetExporter(unittest.TestCase):
+    """ Each test uses its own FakePaletteServer."""
+    def test_collect(self):
+        with FakePaletteServer() as fake:
+            fake.system['socket_timeout'] = 5
+            exporter = FleetExporter([fake.url], username=fake.username,
+                                     password=fake.password)
+            data = samples(exporter.collect())
+            server = 'server="{0}",index="0"'.format(fake.url)
+            labels = '{' + server + '}'
+            self.assertEqual(data['palette_up' + labels], 1)
+            self.assertEqual(data['palette_state{' + server +
+                                  ',state="RUNNING"}'], 1)
+            self.assertAlmostEqual(data['palette_backup_age_seconds' + labels],
+                                   3600, delta=60)
+            self.assertEqual(data['palette_system_value{' + server +
+                                  ',key="socket-timeout"}'], 60)
+            self.assertEqual(data['palette_system_value{' + server +
+                                  ',key="socket_timeout"}'], 5)
+            self.assertIn('palette_circuit_successes_total' + labels, data)
+            # one round trip per server (besides authentication)
+            self.assertEqual(fake.requests['/api/v1/batch'], 1)
+            fake.set_state('STOPPED')
+            data = samples(exporter.collect())
+            self.assertEqual(data['palette_state{' + server +
+                                  ',state="STOPPED"}'], 1)
+            self.assertEqual(
+                data['palette_state_transitions_total' + labels], 1)
+            self.assertEqual(
+                data['palette_state_duration_seconds' + labels], 0)
+            self.assertIn('palette_request_duration_seconds_count{' + server +
+                          ',endpoint="POST /api/v1/batch"}', data)
+    def test_same_url(self):
+        with FakePaletteServer() as fake:
+            exporter = FleetExporter([fake.url, fake.url],
+                                     username=fake.username,
+                                     password=fake.password)
+            exporter.collect()
+            fake.set_state('STOPPED')
+            data = samples(exporter.collect())
+            for index in '01':
+                labels = '{{server="{0}",index="{1}"}}'.format(fake.url,
+                                                              index)
+                self.assertEqual(data['palette_up' + labels], 1)
+                self.assertEqual(
+                    data['palette_state_transitions_total' + labels], 1)
+    def test_stop(self):
+        with FakePaletteServer() as fake:
+            exporter = FleetExporter([fake.url], max_workers=1,
+                                     username=fake.username,
+                                     password=fake.password)
+            exporter.collect()
+            exporter.stop()
+            # the fleet created by the exporter is closed
+            self.assertRaises(RuntimeError, exporter.fleet.pool.submit,
+                              len, ())
+            fleet = PaletteFleet([fake.url], max_workers=1,
+                                 username=fake.username,
+                                 password=fake.password)
+            FleetExporter(fleet).stop()
+            self.assertEqual(fleet.pool.submit(len, ()).result(), 0)
+            fleet.close()
+    def test_server_down(self):
+        exporter = FleetExporter(['http://localhost:1'], timeout=5,
+                                 username='admin', password='password')
+        data = samples(exporter.collect())
+        self.assertEqual(
+            data['palette_up{server="http://localhost:1",index="0"}'], 0)
+    def test_serve(self):
+        with FakePaletteServer() as fake:
+            with FleetExporter([fake.url], interval=3600,
+                               username=fake.username,
+                               password=fake.password) as exporter:
+                url = exporter.start(port=0, address='127.0.0.1')
+                deadline = time.time() + 10
+                while exporter.snapshot is None and time.time() < deadline:
+                    time.sleep(0.01)
+                requests = dict(fake.requests)
+                for _ in xrange(3):
+                    self.assertEqual(urllib2.urlopen(url).read(),
+                                     exporter.snapshot)
+                # scrapes are served from the snapshot
+                self.assertEqual(fake.requests, requests)
+                self.assertRaises(urllib2.HTTPError, urllib2.urlopen,
+                                  url.replace('/metrics', '/other'))
+
+if __name__ == '__main__':
+    unittest.main()
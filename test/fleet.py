@@ -0,0 +1,57 @@
+import os
+import sys
+import unittest
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if not path in sys.path:
+    sys.path.insert(0, path)
+
+import palette
+
+from support import URLS, CREDENTIALS
+
+class TestFleet(unittest.TestCase):
+    """ See support.py for the server used by these tests."""
+    def setUp(self):
+        self.fleet = palette.PaletteFleet(URLS, timeout=60, **CREDENTIALS)
+    def tearDown(self):
+        self.fleet.close()
+    def test_state(self):
+        result = self.fleet.state()
+        self.assertEqual(len(list(result)), len(URLS))
+        result.raise_for_errors()
+    def test_query(self):
+        result = self.fleet.Backup.list_all(limit=1)
+        self.assertEqual(len(result.results), len(URLS))
+        result = self.fleet.System.get('socket-timeout')
+        self.assertEqual(result.errors, {})
+    def test_partial_failure(self):
+        fleet = palette.PaletteFleet(URLS + ['http://localhost:1'], timeout=5,
+                                      **CREDENTIALS)
+        result = fleet.state()
+        self.assertEqual([server.url for server in result.errors],
+                         ['http://localhost:1'])
+        self.assertRaises(palette.error.PaletteFleetError,
+                          result.raise_for_errors)
+    def test_duplicate_urls(self):
+        with palette.PaletteFleet(URLS * 2, max_workers=2,
+                                  **CREDENTIALS) as fleet:
+            result = fleet.state()
+            self.assertEqual(len(result.results), 2 * len(URLS))
+            pool = fleet.pool
+        self.assertRaises(RuntimeError, pool.submit, len, ())
+        # the shared pool outlives the fleets that use it
+        self.fleet.close()
+        self.assertEqual(self.fleet.pool.submit(len, ()).result(), 0)
+    def test_close_shared_server(self):
+        server = palette.connect(URLS[0], **CREDENTIALS)
+        closed = []
+        server.session.close = lambda: closed.append(server)
+        with palette.PaletteFleet([server, URLS[0]], **CREDENTIALS) as fleet:
+            fleet.state().raise_for_errors()
+        # only the server the fleet created itself is closed
+        self.assertEqual(closed, [])
+        self.assertEqual(len(fleet._owned), 1)
+
+if __name__ == '__main__':
+    unittest.main()
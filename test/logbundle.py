@@ -0,0 +1,150 @@
+import os
+import sys
+import zlib
+import shutil
+import struct
+import zipfile
+import tempfile
+import unittest
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if not path in sys.path:
+    sys.path.insert(0, path)
+
+import palette
+from palette.error import PaletteChecksumError
+from palette.logbundle import LogBundle, iter_members
+from palette.testing import FakePaletteServer, LOG_FILES
+
+from support import FAKES
+
+def streamed_zip(files):
+    """Return a zip archive as written by a streaming zipper: the sizes and
+    CRC-32 of each member follow its data (in a data descriptor)."""
+    local = []
+    for name, data in files:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        compressed = compressor.compress(data) + compressor.flush()
+        crc = zlib.crc32(data) & 0xffffffff
+        local.append(struct.pack('<4sHHHHHIIIHH', 'PK\x03\x04', 20, 0x8, 8,
+                                 0, 0, 0, 0, 0, len(name), 0))
+        local.append(name + compressed)
+        local.append(struct.pack('<4sIII', 'PK\x07\x08', crc,
+                                 len(compressed), len(data)))
+    # (the central directory is not read)
+    return ''.join(local) + 'PK\x05\x06' + '\x00' * 18
+
+def chunked(data, size):
+    return [data[i:i + size] for i in xrange(0, len(data), size)]
+
+class TestLogBundle(unittest.TestCase):
+    def test_data_descriptor(self):
+        files = [('a.log', ''.join('line {0}\n'.format(i)
+                                   for i in xrange(20000))),
+                 ('empty.log', ''),
+                 ('b.log', 'no newline at the end')]
+        archive = streamed_zip(files)
+        for size in (1, 7, 4096, len(archive)):
+            members = [(member.name, member.read())
+                       for member in iter_members(chunked(archive, size))]
+            self.assertEqual(members, files)
+        # unread members are skipped
+        names = [member.name for member in iter_members([archive])]
+        self.assertEqual(names, ['a.log', 'empty.log', 'b.log'])
+        lines = list(next(iter_members([archive])))
+        self.assertEqual(len(lines), 20000)
+        self.assertEqual(lines[-1], 'line 19999\n')
+    def test_corrupt(self):
+        archive = streamed_zip([('a.log', 'x' * 1000)])
+        offset = archive.index('PK\x07\x08') + 4
+        corrupt = archive[:offset] + '\x00' * 4 + archive[offset + 4:]
+        member = next(iter_members([corrupt]))
+        self.assertRaises(PaletteChecksumError, member.read)
+    def test_local_file(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'logs.zip')
+            archive = zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED)
+            archive.writestr('stored.txt', 'abc')
+            archive.writestr(u'caf\xe9.log', 'x\n' * 100000)
+            archive.close()
+            bundle = LogBundle(None, {'id': 1, 'url': filename})
+            members = [(member.name, member.size, len(list(member)))
+                       for member in bundle.members()]
+            self.assertEqual(members, [('stored.txt', 3, 1),
+                                       (u'caf\xe9.log', 200000, 100000)])
+        finally:
+            shutil.rmtree(tmpdir)
+
+@unittest.skipUnless(FAKES, 'creates log bundles')
+class TestZiplogs(unittest.TestCase):
+    """ Each test uses its own FakePaletteServer."""
+    def test_ziplogs(self):
+        with FakePaletteServer(log_lines=5000, action_time=0) as fake:
+            server = palette.connect(fake.url, username=fake.username,
+                                     password=fake.password)
+            bundle = server.ziplogs()
+            # (the response describes the bundle: no lookup is needed)
+            self.assertNotIn('/api/v1/logs', fake.requests)
+            self.assertIsInstance(bundle, LogBundle)
+            self.assertEqual(bundle.size, len(fake.log_files[bundle.id]))
+            self.assertTrue(bundle.creation_time)
+            errors = {}
+            names = []
+            for member in bundle.members():
+                names.append(member.name)
+                errors[member.name] = len([line for line in member
+                                           if ' ERROR: ' in line])
+            self.assertEqual(names, ['manifest.txt'] + list(LOG_FILES))
+            self.assertEqual(errors['httpd/access.log'], 50)
+            self.assertEqual(server.LogBundle.get(bundle.id), bundle)
+    def test_ziplogs_async(self):
+        with FakePaletteServer(action_time=0) as fake:
+            server = palette.connect(fake.url, username=fake.username,
+                                     password=fake.password)
+            first = server.ziplogs()
+            job = server.ziplogs(sync=False)
+            bundle = job.result(timeout=60)
+            self.assertEqual(bundle.id, first.id + 1)
+            self.assertEqual(server.LogBundle.list_all(), [bundle, first])
+    def test_ziplogs_without_id(self):
+        with FakePaletteServer(action_time=0) as fake:
+            server = palette.connect(fake.url, username=fake.username,
+                                     password=fake.password)
+            first = server.ziplogs()
+            # the response of the action does not describe the bundle
+            add_log_bundle = fake.add_log_bundle
+            fake.add_log_bundle = lambda: add_log_bundle() and {}
+            bundle = server.ziplogs()
+            self.assertEqual(bundle.id, first.id + 1)
+            # neither does the server ('logs' is not found or fails)
+            def without_logs(status):
+                """Answer the lookup after the action with `status`."""
+                def add():
+                    add_log_bundle()
+                    fake.fail(status)
+                    return {}
+                return add
+            fake.add_log_bundle = without_logs(404)
+            self.assertIs(server.ziplogs(), True)
+            fake.add_log_bundle = without_logs(200)
+            self.assertIs(server.ziplogs(), True)
+            self.assertEqual(len(fake.log_bundles), 4)
+    def test_download(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            with FakePaletteServer(action_time=0) as fake:
+                server = palette.connect(fake.url, username=fake.username,
+                                         password=fake.password)
+                bundle = server.ziplogs()
+                filename = os.path.join(tmpdir, 'logs.zip')
+                result = bundle.download(filename, workers=2, part_size=1000)
+                self.assertEqual(result.size, bundle.size)
+            archive = zipfile.ZipFile(filename)
+            self.assertIsNone(archive.testzip())
+            self.assertIn(LOG_FILES[0], archive.namelist())
+        finally:
+            shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    unittest.main()
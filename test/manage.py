@@ -1,5 +1,6 @@
 import os
 import sys
+import threading
 import unittest
 
 # Force the tests to be performed in the order they are defined.
@@ -10,14 +11,17 @@ if not path in sys.path:
     sys.path.insert(0, path)
 
 import palette
+from palette.error import PaletteError
+from palette.internal import States
+from palette.testing import FakePaletteServer
 
-URL = 'http://localhost:8080'
+from support import URL, CREDENTIALS, FAKES
 
 # The backup test is separate
 class TestManageActions(unittest.TestCase):
-    """ These tests assume a valid ~/.palette file."""
+    """ See support.py for the server used by these tests."""
     def setUp(self):
-        self.server = palette.connect(URL)
+        self.server = palette.connect(URL, **CREDENTIALS)
 
     def test_01_stop(self):
         self.server.stop()
@@ -39,6 +43,48 @@ class TestManageActions(unittest.TestCase):
         self.server.ziplogs()
     ziplogs = test_05_ziplogs
 
+def delay_manage(fake, seconds):
+    """Make `fake` acknowledge 'manage' requests before acting on them."""
+    manage = fake.manage
+    fake.manage = lambda action, sync: threading.Timer(
+        seconds, manage, (action,), {'sync': True}).start()
+
+@unittest.skipUnless(FAKES, 'stops the server and takes backups')
+class TestJobs(unittest.TestCase):
+    """ Each test uses its own FakePaletteServer."""
+    def test_restart(self):
+        # a restart is only over once it has been seen in progress
+        with FakePaletteServer(action_time=2) as fake:
+            server = palette.connect(fake.url, username=fake.username,
+                                     password=fake.password)
+            job = server.restart(sync=False)
+            self.assertTrue(job.result(timeout=60))
+            self.assertTrue(job.active)
+    def test_delayed_stop(self):
+        with FakePaletteServer(action_time=1) as fake:
+            server = palette.connect(fake.url, username=fake.username,
+                                     password=fake.password)
+            # the action starts after the first poll of the job
+            delay_manage(fake, 2)
+            self.assertTrue(server.stop(sync=False).result(timeout=60))
+            self.assertEqual(fake.state, States.STOPPED)
+    def test_delayed_backup(self):
+        with FakePaletteServer(action_time=0) as fake:
+            server = palette.connect(fake.url, username=fake.username,
+                                     password=fake.password)
+            latest = server.Backup.list_all(limit=1)[0]
+            delay_manage(fake, 2)
+            backup = server.backup(sync=False).result(timeout=60)
+            self.assertEqual(backup.id, latest.id + 1)
+    def test_no_new_backup(self):
+        with FakePaletteServer(action_time=3) as fake:
+            server = palette.connect(fake.url, username=fake.username,
+                                     password=fake.password)
+            fake.add_backup = lambda: {}
+            job = server.backup(sync=False)
+            self.assertRaisesRegexp(PaletteError, "without a result",
+                                    job.result, timeout=60)
+
 if __name__ == '__main__':
     unittest.main()
         
@@ -0,0 +1,59 @@
+import os
+import sys
+import tempfile
+import unittest
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if not path in sys.path:
+    sys.path.insert(0, path)
+
+import palette
+from palette.testing import FakePaletteServer, record, replay, REDACTED
+
+class TestRecordReplay(unittest.TestCase):
+    """ Record traffic with a fake server then replay it without one."""
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+    def tearDown(self):
+        os.unlink(self.path)
+    def exercise(self, server):
+        server.authenticate()
+        return (server.state,
+                [backup.unique_id for backup in server.Backup.list_all()],
+                server.System.get('socket-timeout'))
+    def test_replay(self):
+        with FakePaletteServer(latency=0.01, backups=20) as fake:
+            server = palette.PaletteServer(fake.url, username=fake.username,
+                                           password=fake.password)
+            record(server, self.path)
+            expected = self.exercise(server)
+        server = palette.PaletteServer(fake.url, username=fake.username,
+                                       password=fake.password)
+        replay(server, self.path)
+        self.assertEqual(self.exercise(server), expected)
+        self.assertIsNotNone(server.auth_tkt)
+        self.assertRaises(palette.error.PaletteError, self.exercise, server)
+    def test_redacted(self):
+        with FakePaletteServer(password='not-recorded', action_time=0) as fake:
+            server = palette.connect(fake.url, username=fake.username,
+                                     password=fake.password)
+            bundle = server.ziplogs()
+            record(server, self.path)
+            server.authenticate()
+            # (binary content)
+            data = server.session.get(bundle.url).content
+        with open(self.path) as handle:
+            recording = handle.read()
+        self.assertNotIn(fake.password, recording)
+        self.assertNotIn(server.auth_tkt, recording)
+        self.assertIn('auth_tkt=' + REDACTED, recording)
+        server = palette.PaletteServer(fake.url, username=fake.username,
+                                       password=fake.password)
+        replay(server, self.path)
+        server.authenticate()
+        self.assertEqual(server.auth_tkt, REDACTED)
+        self.assertEqual(server.session.get(bundle.url).content, data)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,7 @@
 import os
 import sys
+import hashlib
+import tempfile
 import unittest
 
 path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -8,12 +10,12 @@ if not path in sys.path:
 
 import palette
 
-URL = 'http://localhost:8080'
+from support import URL, CREDENTIALS, FAKES
 
 class TestRestore(unittest.TestCase):
-    """ These tests assume a valid ~/.palette file."""
+    """ See support.py for the server used by these tests."""
     def setUp(self):
-        self.server = palette.connect(URL)
+        self.server = palette.connect(URL, **CREDENTIALS)
     def test_backup(self):
         backup = self.server.backup()
         self.assertIn('url', backup)
@@ -25,6 +27,19 @@ class TestRestore(unittest.TestCase):
         backups = self.server.Backup.list_all(limit=1)
         self.assertTrue(backups)
         self.server.restore(backups[0], data_only=True)
+    @unittest.skipUnless(FAKES, 'uploads random data')
+    def test_restore_local_file(self):
+        data = os.urandom(300 * 1000)
+        with tempfile.NamedTemporaryFile(suffix='.tsbak') as handle:
+            handle.write(data)
+            handle.flush()
+            progress = []
+            self.server.restore(handle.name, progress=lambda sent, total:
+                                progress.append((sent, total)))
+        upload = FAKES[0].uploads[-1]
+        self.assertEqual(upload['filename'], os.path.basename(handle.name))
+        self.assertEqual(upload['sha256'], hashlib.sha256(data).hexdigest())
+        self.assertEqual(progress[-1], (len(data), len(data)))
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,61 @@
+import os
+import sys
+import unittest
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if not path in sys.path:
+    sys.path.insert(0, path)
+
+import requests
+
+import palette
+from palette.error import PaletteCircuitOpenError
+from palette.retry import RetryPolicy, CircuitBreaker, CircuitStates
+from palette.testing import FakePaletteServer
+
+class TestRetry(unittest.TestCase):
+    """ Inject failures into a fake server."""
+    def setUp(self):
+        self.fake = FakePaletteServer()
+        self.fake.start()
+    def tearDown(self):
+        self.fake.stop()
+    def connect(self, **kwargs):
+        return palette.connect(self.fake.url, username=self.fake.username,
+                               password=self.fake.password, **kwargs)
+    def test_retry_get(self):
+        server = self.connect(retry=RetryPolicy(backoff=0.01))
+        self.fake.fail(503, count=2)
+        spans = []
+        server.add_hook(spans.append)
+        self.assertEqual(server.state, 'RUNNING')
+        self.assertEqual(spans[0].retries, 2)
+        self.assertEqual(server.circuit.counters()['failures'], 2)
+    def test_no_retry_post(self):
+        server = self.connect(retry=RetryPolicy(backoff=0.01))
+        self.fake.fail(502)
+        self.assertRaises(requests.HTTPError, server.stop)
+        self.assertEqual(self.fake.requests['/api/v1/manage'], 1)
+    def test_circuit_breaker(self):
+        circuit = CircuitBreaker(threshold=2, reset_timeout=0.2)
+        server = self.connect(retry=False, circuit_breaker=circuit)
+        self.fake.fail(503, count=2)
+        for _ in range(2):
+            self.assertRaises(requests.HTTPError, getattr, server, 'state')
+        self.assertEqual(circuit.state, CircuitStates.OPEN)
+        self.assertRaises(PaletteCircuitOpenError, getattr, server, 'state')
+        self.assertEqual(self.fake.requests['/api/v1/state'], 2)
+        circuit._opened_at -= 0.2
+        self.assertEqual(circuit.state, CircuitStates.HALF_OPEN)
+        self.assertEqual(server.state, 'RUNNING')
+        self.assertEqual(circuit.state, CircuitStates.CLOSED)
+        self.assertEqual(circuit.rejected, 1)
+        # other server errors do not open the circuit
+        self.fake.fail(500, count=3)
+        for _ in range(3):
+            self.assertRaises(requests.HTTPError, getattr, server, 'state')
+        self.assertEqual(circuit.state, CircuitStates.CLOSED)
+        self.assertEqual(circuit.failures, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+""" Startup cost of the SDK.
+
+The tests check that 'import palette' stays cheap: the transport stack
+and ~/.palette are only loaded on first use.  Run this file directly to
+benchmark the import time:
+
+python startup.py
+"""
+import os
+import sys
+import time
+import subprocess
+import unittest
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if not path in sys.path:
+    sys.path.insert(0, path)
+
+def run(code):
+    """Run `code` in a new interpreter and return its output."""
+    env = dict(os.environ, PYTHONPATH=path)
+    return subprocess.check_output([sys.executable, '-c', code], env=env)
+
+class TestStartup(unittest.TestCase):
+    def test_import(self):
+        out = run('import sys, palette; '
+                  'print sorted(m for m in sys.modules '
+                  'if m.startswith(("requests", "palette.")))')
+        self.assertEqual(eval(out), [])
+    def test_lazy_attributes(self):
+        out = run('import sys, palette; '
+                  'from palette import connect; '
+                  'print palette.PaletteFleet.__module__, '
+                  'connect is palette.server.connect, '
+                  '"requests" in sys.modules')
+        self.assertEqual(out.split(), ['palette.fleet', 'True', 'True'])
+        import palette
+        self.assertIn('connect_async', dir(palette))
+        self.assertRaises(AttributeError, getattr, palette, 'no_such_name')
+    def test_config_not_read(self):
+        out = run('import palette; from palette import config; '
+                  'palette.PaletteServer("http://localhost", username="u", '
+                  'password="p"); print config._PARSER is None')
+        self.assertEqual(out.strip(), 'True')
+
+def benchmark(repeat=15):
+    """Print the median time of importing the SDK with and without
+    loading the server classes (the cost of 'import palette' before the
+    classes were imported lazily)."""
+    statements = ('pass', 'import requests', 'import palette',
+                  'import palette; palette.PaletteServer')
+    for statement in statements:
+        times = []
+        for _ in xrange(repeat):
+            start = time.time()
+            run(statement)
+            times.append(time.time() - start)
+        times.sort()
+        print '{0:40} {1:6.1f}ms'.format(statement,
+                                         times[len(times) // 2] * 1000)
+
+if __name__ == '__main__':
+    benchmark()
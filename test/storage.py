@@ -0,0 +1,100 @@
+import os
+import sys
+import shutil
+import hashlib
+import tempfile
+import unittest
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if not path in sys.path:
+    sys.path.insert(0, path)
+
+from palette import storage
+from palette.backup import Backup
+from palette.error import PaletteChecksumError
+
+class FlakyStorage(storage.FileStorage):
+    """Fails once when reading the part starting at `fail_at`."""
+    def __init__(self, fail_at):
+        self.fail_at = fail_at
+    def local_path(self, url):
+        return url[len('flaky://'):]
+    def read(self, url, start, end, chunk_size=storage.CHUNK_SIZE):
+        if start == self.fail_at:
+            self.fail_at = None
+            raise IOError('connection reset')
+        return super(FlakyStorage, self).read(url, start, end, chunk_size)
+
+class TestStorage(unittest.TestCase):
+    """ Transfers between local files (no server needed)."""
+    SIZE = 1000 * 1000 + 17
+    PART = 64 * 1024
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tmpdir, 'source.tsbak')
+        data = os.urandom(self.SIZE)
+        with open(self.source, 'wb') as handle:
+            handle.write(data)
+        self.digest = hashlib.sha256(data).hexdigest()
+        self.dest = os.path.join(self.tmpdir, 'dest.tsbak')
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+    def assertCopied(self, result):
+        self.assertEqual(result.digest, self.digest)
+        self.assertEqual(result.size, self.SIZE)
+        with open(self.dest, 'rb') as handle:
+            data = handle.read()
+        self.assertEqual(hashlib.sha256(data).hexdigest(), self.digest)
+        self.assertFalse(os.path.exists(self.dest + storage.PART_SUFFIX))
+    def test_download(self):
+        progress = []
+        result = storage.download('file://' + self.source, self.dest,
+                                  part_size=self.PART, chunk_size=4096,
+                                  progress=lambda done, total:
+                                  progress.append(done))
+        self.assertCopied(result)
+        self.assertEqual(progress[-1], self.SIZE)
+    def test_parallel(self):
+        result = storage.download(self.source, self.dest, workers=4,
+                                  part_size=self.PART, digest=self.digest)
+        self.assertCopied(result)
+    def test_resume(self):
+        storage.register_backend('flaky', FlakyStorage(fail_at=self.PART * 5))
+        url = 'flaky://' + self.source
+        self.assertRaises(IOError, storage.download, url, self.dest,
+                          part_size=self.PART)
+        self.assertTrue(os.path.exists(self.dest + storage.STATE_SUFFIX))
+        result = storage.download(url, self.dest, workers=3,
+                                  part_size=self.PART)
+        self.assertEqual(result.resumed, self.PART * 5)
+        self.assertCopied(result)
+    def test_resume_other_source(self):
+        storage.register_backend('flaky', FlakyStorage(fail_at=self.PART * 5))
+        other = os.path.join(self.tmpdir, 'other.tsbak')
+        shutil.copy(self.source, other)
+        with open(other, 'r+b') as handle:
+            handle.write('X')
+        self.assertRaises(IOError, storage.download, 'flaky://' + other,
+                          self.dest, part_size=self.PART)
+        # same size, other file: the parts present are not reused
+        result = storage.download('flaky://' + self.source, self.dest,
+                                  part_size=self.PART)
+        self.assertEqual(result.resumed, 0)
+        self.assertCopied(result)
+    def test_upload(self):
+        result = storage.upload(self.source, 'file://' + self.dest,
+                                workers=2, part_size=self.PART)
+        self.assertCopied(result)
+    def test_checksum(self):
+        self.assertRaises(PaletteChecksumError, storage.download,
+                          self.source, self.dest, digest='0' * 64)
+        self.assertFalse(os.path.exists(self.dest))
+    def test_backup_download(self):
+        backup = Backup(None, {'id': 1, 'url': 'file://' + self.source,
+                               'size': self.SIZE})
+        self.assertCopied(backup.download(self.dest))
+        backup['size'] += 1
+        self.assertRaises(PaletteChecksumError, backup.download, self.dest)
+
+if __name__ == '__main__':
+    unittest.main()
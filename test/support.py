@@ -0,0 +1,28 @@
+""" Common test configuration.
+
+By default the tests run against an in-process FakePaletteServer.  Set
+PALETTE_TEST_URL (e.g. http://localhost:8080) to run them against a real
+Palette server instead; credentials are then read from ~/.palette.
+"""
+import os
+import sys
+
+path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if not path in sys.path:
+    sys.path.insert(0, path)
+
+import palette
+from palette.testing import FakePaletteServer
+
+FAKES = []
+
+if os.environ.get('PALETTE_TEST_URL'):
+    URLS = [url.strip() for url in os.environ['PALETTE_TEST_URL'].split(',')]
+    CREDENTIALS = {}
+else:
+    FAKES = [FakePaletteServer(), FakePaletteServer()]
+    URLS = [fake.start() for fake in FAKES]
+    CREDENTIALS = {'username': FAKES[0].username,
+                   'password': FAKES[0].password}
+
+URL = URLS[0]
@@ -1,5 +1,6 @@
 import os
 import sys
+import threading
 import unittest
 
 path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -7,13 +8,14 @@ if not path in sys.path:
     sys.path.insert(0, path)
 
 import palette
+from palette.testing import FakePaletteServer
 
-URL = 'http://localhost:8080'
+from support import URL, CREDENTIALS, FAKES
 
 class TestSystem(unittest.TestCase):
-    """ These tests assume a valid ~/.palette file."""
+    """ See support.py for the server used by these tests."""
     def setUp(self):
-        self.server = palette.connect(URL)
+        self.server = palette.connect(URL, **CREDENTIALS)
     def test_list_all(self):
         data = self.server.System.list_all()
         self.assertTrue(data)
@@ -39,6 +41,62 @@ class TestSystem(unittest.TestCase):
         value = self.server.system['socket-timeout']
         self.server.system['socket-timeout'] = 2 * value
         self.server.system['socket-timeout'] = value
+    def test_mapping_cache(self):
+        system = self.server.system
+        self.assertIs(self.server.system, system)
+        value = system['socket-timeout']
+        self.server.System.save('socket-timeout', 2 * value)
+        self.assertFalse(system.stale)
+        self.assertEqual(self.server.system['socket-timeout'], 2 * value)
+        self.server.system['socket-timeout'] = value
+        self.assertEqual(self.server.System.get('socket-timeout'), value)
+    def test_mapping_batch(self):
+        defaults = dict(self.server.system)
+        with self.server.system.batch() as system:
+            system['socket-timeout'] = 2 * defaults['socket-timeout']
+            system['auto-update-enabled'] = defaults['auto-update-enabled']
+        self.assertEqual(self.server.system['socket-timeout'],
+                         2 * defaults['socket-timeout'])
+        self.server.system.update(defaults)
+
+@unittest.skipUnless(FAKES, 'changes the system table')
+class TestSystemMapping(unittest.TestCase):
+    """ Each test uses its own FakePaletteServer."""
+    def test_save_updates_cache(self):
+        with FakePaletteServer() as fake:
+            server = palette.connect(fake.url, username=fake.username,
+                                     password=fake.password)
+            server.system['socket-timeout'] = 7
+            server.system.update({'socket-timeout': 8})
+            self.assertEqual(server.system['socket-timeout'], 8)
+            self.assertEqual(fake.system['socket-timeout'], 8)
+            # the table was only fetched once
+            self.assertEqual(fake.requests['/api/v1/system'], 2)
+    def test_batch_per_thread(self):
+        with FakePaletteServer() as fake:
+            server = palette.connect(fake.url, username=fake.username,
+                                     password=fake.password)
+            enabled = fake.system['auto-update-enabled']
+            with server.system.batch() as system:
+                system['socket-timeout'] = 7
+                thread = threading.Thread(
+                    target=server.system.__setitem__,
+                    args=('auto-update-enabled', not enabled))
+                thread.start()
+                thread.join()
+                # saved at once, not part of the batch
+                self.assertEqual(fake.system['auto-update-enabled'],
+                                 not enabled)
+                self.assertNotEqual(fake.system['socket-timeout'], 7)
+            self.assertEqual(fake.system['socket-timeout'], 7)
+            try:
+                with server.system.batch() as system:
+                    system['socket-timeout'] = 9
+                    raise ValueError()
+            except ValueError:
+                pass
+            self.assertEqual(server.system['socket-timeout'], 7)
+            self.assertEqual(server.system['auto-update-enabled'], not enabled)
 
 if __name__ == '__main__':
     unittest.main()